@@ -0,0 +1,53 @@
+"""Times a cgroup.CgroupReader sample against the psutil calls it replaces.
+
+The sample reads a fake cgroup v2 tree from tests/test_cgroup.py, which also checks the figures;
+the baseline is the per-process psutil sample of /health and the metrics sampler (cpu_percent,
+memory_info, memory_percent):
+
+    python bench/cgroup_bench.py --samples 20000
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+import psutil
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "tests"))
+
+import cgroup  # noqa: E402
+from test_cgroup import write_tree  # noqa: E402
+
+
+def time_samples(samples: int) -> dict:
+    with tempfile.TemporaryDirectory() as root:
+        write_tree(root, usage=1_000_000)
+        reader = cgroup.CgroupReader(root)
+        start = time.perf_counter()
+        for _ in range(samples):
+            reader.sample()
+        cgroup_us = (time.perf_counter() - start) / samples * 1e6
+        reader.close()
+    process = psutil.Process()
+    start = time.perf_counter()
+    for _ in range(samples):
+        process.cpu_percent(interval=0)
+        process.memory_info()
+        process.memory_percent()
+    psutil_us = (time.perf_counter() - start) / samples * 1e6
+    print(f"cgroup sample {cgroup_us:.1f}us, psutil process cpu+memory {psutil_us:.1f}us")
+    return {"cgroup_us": round(cgroup_us, 1), "psutil_process_us": round(psutil_us, 1)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--samples", type=int, default=20000)
+    parser.add_argument("--json", help="write the timings to this file")
+    args = parser.parse_args()
+    timings = time_samples(args.samples)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(timings, f, indent=2)
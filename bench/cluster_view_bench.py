@@ -0,0 +1,103 @@
+"""Latency of the /get-all-redis-keys aggregation strategies as the pod count grows.
+
+Seeds N fake pods into the Redis at REDIS_HOST/REDIS_PORT (db 15 by default, it is flushed)
+and times each read strategy:
+
+    python bench/cluster_view_bench.py --pods 10 100 1000
+    python bench/cluster_view_bench.py --fake   # in-memory fakeredis, no server needed
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import redis
+import redis.asyncio as aioredis
+
+import cluster_view
+
+
+async def read_naive(rc):
+    """the original SCAN + GET per key"""
+    state = {}
+    async for key in rc.scan_iter(cluster_view.CPU_KEY_PATTERN):
+        val = await rc.get(key)
+        if val:
+            state[key] = json.loads(val)
+    return state
+
+
+STRATEGIES = {
+    "scan+get": read_naive,
+    "scan+mget": cluster_view.read_scan,
+    "hgetall": cluster_view.read_hash,
+}
+
+
+def clients(args):
+    if args.fake:
+        import fakeredis
+        server = fakeredis.FakeServer()
+        return (fakeredis.FakeRedis(server=server, decode_responses=True),
+                fakeredis.FakeAsyncRedis(server=server, decode_responses=True))
+    host = os.getenv("REDIS_HOST", "localhost")
+    port = int(os.getenv("REDIS_PORT", "6379"))
+    return (redis.Redis(host=host, port=port, db=args.db, decode_responses=True),
+            aioredis.Redis(host=host, port=port, db=args.db, decode_responses=True))
+
+
+def seed(r, pods):
+    r.flushdb()
+    now = time.time()
+    for i in range(pods):
+        key = f"cpu:bench:pod-{i}"
+        cluster_view.write_sample(r, key, {"pod": f"pod-{i}", "namespace": "bench", "cpu_percent": 12.5, "ts": now},
+                                  ttl=3600)
+
+
+async def time_strategy(rc, fn, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        await fn(rc)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "p50_ms": round(statistics.median(samples), 3),
+        "p99_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.99))], 3),
+    }
+
+
+async def main(args):
+    r, rc = clients(args)
+    results = []
+    for pods in args.pods:
+        seed(r, pods)
+        row = {"pods": pods}
+        for name, fn in STRATEGIES.items():
+            if name == "hgetall":
+                row[name] = await time_strategy(rc, lambda c: cluster_view.read_hash(c, ttl=3600), args.iterations)
+            else:
+                row[name] = await time_strategy(rc, fn, args.iterations)
+        results.append(row)
+        print(f"{pods:>6} pods  " + "  ".join(f"{n}: p50={row[n]['p50_ms']}ms p99={row[n]['p99_ms']}ms" for n in STRATEGIES))
+    r.flushdb()
+    await rc.aclose()
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pods", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--db", type=int, default=15)
+    parser.add_argument("--fake", action="store_true", help="use fakeredis instead of a live server")
+    parser.add_argument("--json", help="write results to this file")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,251 @@
+"""Self-contained load benchmark mirroring the k6 scenarios.
+
+Runs ramping virtual users (k6 ``options.stages`` semantics: each stage ramps linearly from
+the previous target to its own) against every endpoint in turn and records latency
+percentiles, throughput and errors as JSON.
+
+Targets:
+    --url http://localhost:8080      an already running instance
+    --in-process                     the app itself through httpx's ASGI transport
+
+Redis for --in-process:
+    --redis url                      REDIS_HOST/REDIS_PORT as configured (default)
+    --redis spawn                    start a throwaway redis-server on a free port
+    --redis fake                     in-memory fakeredis (pip install -r bench/requirements.txt)
+
+The --in-process app runs with ADMISSION_CONTROL=off unless --admission adaptive: the load
+generator shares its event loop, so the generator's own work would read as loop lag and shed.
+
+Examples:
+    python bench/loadgen.py --in-process --redis spawn --scenario smoke --json out.json
+    python bench/loadgen.py --url http://localhost:8080 --scenario k6-local --time-scale 0.1
+    python bench/loadgen.py --in-process --redis fake --baseline baseline.json   # exits 1 on regression
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import logging
+import argparse
+import subprocess
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+SRC = os.path.join(os.path.dirname(__file__), "..", "src")
+
+# (duration seconds, target VUs), same shapes as k6/benchmarking.js and k6/localbenchmarking.js
+SCENARIOS: Dict[str, List[Tuple[float, int]]] = {
+    "k6-remote": [(180, 400), (300, 1500), (60, 0)],
+    "k6-local": [(15, 1500), (300, 1500), (10, 0)],
+    "smoke": [(5, 50), (10, 50), (2, 0)],
+}
+ENDPOINTS = ["/health", "/metrics", "/get-all-redis-keys", "/page"]
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = array("d")
+        self.errors = 0
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+
+    def add(self, seconds: float, ok: bool):
+        self.latencies.append(seconds)
+        if not ok:
+            self.errors += 1
+
+    def summary(self) -> Dict:
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        ordered = sorted(self.latencies)
+        n = len(ordered)
+
+        def pct(p):
+            return round(ordered[min(n - 1, int(n * p))] * 1000, 3) if n else 0.0
+
+        return {
+            "requests": n,
+            "errors": self.errors,
+            "error_rate": round(self.errors / n, 4) if n else 0.0,
+            "rps": round(n / elapsed, 1) if elapsed else 0.0,
+            "p50_ms": pct(0.50),
+            "p90_ms": pct(0.90),
+            "p95_ms": pct(0.95),
+            "p99_ms": pct(0.99),
+            "max_ms": round(ordered[-1] * 1000, 3) if n else 0.0,
+            "duration_s": round(elapsed, 2),
+        }
+
+
+def target_vus(stages: List[Tuple[float, int]], t: float) -> int:
+    prev = 0
+    for duration, target in stages:
+        if t < duration:
+            return round(prev + (target - prev) * (t / duration))
+        t -= duration
+        prev = target
+    return prev
+
+
+async def run_endpoint(client: httpx.AsyncClient, path: str, stages: List[Tuple[float, int]],
+                       think: float) -> Dict:
+    rec = Recorder()
+    vus: List[Tuple[asyncio.Task, asyncio.Event]] = []
+
+    async def vu(stop: asyncio.Event):
+        while not stop.is_set():
+            start = time.perf_counter()
+            try:
+                resp = await client.get(path)
+                ok = resp.status_code == 200
+            except httpx.HTTPError:
+                ok = False
+            rec.add(time.perf_counter() - start, ok)
+            await asyncio.sleep(think)
+
+    total = sum(d for d, _ in stages)
+    begin = time.monotonic()
+    while (elapsed := time.monotonic() - begin) < total:
+        want = target_vus(stages, elapsed)
+        while len(vus) < want:
+            stop = asyncio.Event()
+            vus.append((asyncio.create_task(vu(stop)), stop))
+        while len(vus) > want:
+            _, stop = vus.pop()
+            stop.set()
+        await asyncio.sleep(0.1)
+    for _, stop in vus:
+        stop.set()
+    await asyncio.gather(*(task for task, _ in vus), return_exceptions=True)
+    rec.finished = time.perf_counter()
+    return rec.summary()
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def spawn_redis() -> subprocess.Popen:
+    port = free_port()
+    proc = subprocess.Popen(["redis-server", "--port", str(port), "--save", "", "--appendonly", "no"],
+                            stdout=subprocess.DEVNULL)
+    os.environ.update(REDIS_HOST="127.0.0.1", REDIS_PORT=str(port))
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            return proc
+        except OSError:
+            time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError("redis-server did not start")
+
+
+def use_fakeredis():
+    """Point the app's pool at an in-memory fakeredis server"""
+    import fakeredis
+    import redis_pool
+
+    server = fakeredis.FakeServer()
+
+    class FakePool(redis_pool.StatsConnectionPool):
+        def __init__(self, **kwargs):
+            super().__init__(connection_class=fakeredis.FakeAsyncConnection, server=server, **kwargs)
+
+    redis_pool.StatsConnectionPool = FakePool
+
+
+def compare(results: Dict, baseline: Dict, max_p99: float, max_rps: float) -> List[str]:
+    failures = []
+    for path, cur in results.items():
+        base = baseline.get("results", {}).get(path)
+        if not base:
+            continue
+        if base["p99_ms"] and cur["p99_ms"] > base["p99_ms"] * (1 + max_p99):
+            failures.append(f"{path}: p99 {cur['p99_ms']}ms vs baseline {base['p99_ms']}ms")
+        if base["rps"] and cur["rps"] < base["rps"] * (1 - max_rps):
+            failures.append(f"{path}: {cur['rps']} req/s vs baseline {base['rps']} req/s")
+    return failures
+
+
+async def main(args) -> int:
+    stages = [(d * args.time_scale, t) for d, t in SCENARIOS[args.scenario]]
+    limits = httpx.Limits(max_connections=args.max_connections, max_keepalive_connections=args.max_connections)
+    app_main = None
+    if args.in_process:
+        sys.path.insert(0, SRC)
+        if args.redis == "fake":
+            use_fakeredis()
+        # the client shares the app's event loop here, so its own work reads as loop lag
+        os.environ["ADMISSION_CONTROL"] = args.admission
+        import main as app_main
+        await app_main.startup()
+        transport = httpx.ASGITransport(app=app_main.app)
+        client = httpx.AsyncClient(transport=transport, base_url="http://bench", limits=limits)
+    else:
+        client = httpx.AsyncClient(base_url=args.url, limits=limits, timeout=args.timeout)
+
+    results = {}
+    try:
+        for path in args.endpoints:
+            summary = await run_endpoint(client, path, stages, args.think)
+            results[path] = summary
+            print(f"{path:<20} {summary['rps']:>9} req/s  p50={summary['p50_ms']}ms  "
+                  f"p99={summary['p99_ms']}ms  errors={summary['errors']}/{summary['requests']}")
+    finally:
+        await client.aclose()
+        if app_main is not None:
+            await app_main.shutdown()
+
+    report = {
+        "scenario": args.scenario,
+        "stages": stages,
+        "target": "in-process" if args.in_process else args.url,
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            failures = compare(results, json.load(f), args.max_p99_regression, args.max_rps_regression)
+        for failure in failures:
+            print(f"REGRESSION {failure}")
+        return 1 if failures else 0
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--url", default="http://localhost:8080")
+    target.add_argument("--in-process", action="store_true")
+    parser.add_argument("--redis", choices=["url", "spawn", "fake"], default="url")
+    parser.add_argument("--admission", choices=["off", "adaptive"], default="off",
+                        help="ADMISSION_CONTROL of the --in-process app")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="smoke")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="multiply every stage duration")
+    parser.add_argument("--endpoints", nargs="+", default=ENDPOINTS)
+    parser.add_argument("--think", type=float, default=0.0, help="seconds each VU sleeps between requests")
+    parser.add_argument("--max-connections", type=int, default=1000)
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--baseline", help="report to compare against, exits 1 on regression")
+    parser.add_argument("--max-p99-regression", type=float, default=0.10)
+    parser.add_argument("--max-rps-regression", type=float, default=0.10)
+    args = parser.parse_args()
+    # httpx logs every request at INFO, which would be the load generator benchmarking itself
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    redis_proc = spawn_redis() if args.in_process and args.redis == "spawn" else None
+    try:
+        sys.exit(asyncio.run(main(args)))
+    finally:
+        if redis_proc is not None:
+            redis_proc.terminate()
@@ -0,0 +1,193 @@
+"""Replay captured production traffic (CAPTURE=on, see src/capture.py) and compare latencies.
+
+Requests are sent open-loop on the captured schedule: each one leaves at its captured arrival
+time divided by --speed, whether or not earlier ones have answered, so the concurrency of the
+original traffic is reproduced (and multiplied with it at --speed above 1). Files of several
+workers or pods are merged by arrival time. The report compares, per route, the captured latency
+with the replayed one and counts errors and status codes that differ from the capture; the
+schedule lag shows whether the client itself kept up.
+
+Targets and --redis as in loadgen.py.
+
+Examples:
+    python bench/replay.py /tmp/capture --in-process --redis fake
+    python bench/replay.py capture-*.bin --url http://localhost:8080 --speed 4 --json replay.json
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+from typing import Dict, List, Optional
+
+import httpx
+
+from loadgen import SRC, Recorder, spawn_redis, use_fakeredis
+
+sys.path.insert(0, SRC)
+import capture  # noqa: E402
+
+
+def load(paths: List[str], skip: List[str], limit: Optional[int]) -> List[capture.Record]:
+    records = []
+    for path in capture.capture_files(paths):
+        records.extend(r for r in capture.read_records(path) if not any(r.target.startswith(s) for s in skip))
+    records.sort(key=lambda r: r.arrival)
+    return records[:limit] if limit else records
+
+
+def route_of(record: capture.Record) -> str:
+    return record.target.partition("?")[0]
+
+
+def percentiles(values: List[float]) -> Dict:
+    ordered = sorted(values)
+    n = len(ordered)
+
+    def pct(p):
+        return round(ordered[min(n - 1, int(n * p))] * 1000, 3) if n else 0.0
+
+    return {"p50_ms": pct(0.50), "p95_ms": pct(0.95), "p99_ms": pct(0.99)}
+
+
+async def replay(client: httpx.AsyncClient, records: List[capture.Record], speed: float,
+                 max_in_flight: int) -> Dict:
+    recorders: Dict[str, Recorder] = {}
+    mismatched: Dict[str, int] = {}
+    lags: List[float] = []
+    gate = asyncio.Semaphore(max_in_flight)
+    in_flight = 0
+    peak = 0
+
+    async def send(record: capture.Record):
+        nonlocal in_flight, peak
+        route = route_of(record)
+        async with gate:
+            in_flight += 1
+            peak = max(peak, in_flight)
+            start = time.perf_counter()
+            try:
+                resp = await client.request(record.method, record.target)
+                status = resp.status_code
+            except httpx.HTTPError:
+                status = 0
+            in_flight -= 1
+        ok = status != 0 and status < 500
+        recorders.setdefault(route, Recorder()).add(time.perf_counter() - start, ok)
+        if status != record.status:
+            mismatched[route] = mismatched.get(route, 0) + 1
+
+    tasks = []
+    first = records[0].arrival
+    begin = time.perf_counter()
+    for record in records:
+        due = (record.arrival - first) / speed
+        delay = due - (time.perf_counter() - begin)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        else:
+            # yield anyway, or a backlog of due requests would starve the ones in flight
+            await asyncio.sleep(0)
+        lags.append(max(0.0, time.perf_counter() - begin - due))
+        tasks.append(asyncio.create_task(send(record)))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - begin
+
+    captured: Dict[str, List[float]] = {}
+    for record in records:
+        captured.setdefault(route_of(record), []).append(record.latency)
+    routes = {}
+    for route, latencies in sorted(captured.items()):
+        rec = recorders.get(route, Recorder())
+        summary = rec.summary()
+        replayed = {k: summary[k] for k in ("p50_ms", "p95_ms", "p99_ms")}
+        original = percentiles(latencies)
+        routes[route] = {
+            "requests": len(latencies),
+            "captured": original,
+            "replayed": replayed,
+            "p99_ratio": round(replayed["p99_ms"] / original["p99_ms"], 2) if original["p99_ms"] else None,
+            "errors": rec.errors,
+            "status_mismatches": mismatched.get(route, 0),
+        }
+    span = records[-1].arrival - first
+    return {
+        "requests": len(records),
+        "speed": speed,
+        "captured_span_s": round(span, 2),
+        "replay_duration_s": round(elapsed, 2),
+        "captured_peak_in_flight": max(r.in_flight for r in records) + 1,
+        "replayed_peak_in_flight": peak,
+        "schedule_lag": percentiles(lags),
+        "routes": routes,
+    }
+
+
+async def main(args) -> int:
+    records = load(args.captures, args.skip, args.limit)
+    if not records:
+        print("no captured requests to replay")
+        return 1
+    limits = httpx.Limits(max_connections=args.max_in_flight, max_keepalive_connections=args.max_in_flight)
+    app_main = None
+    if args.in_process:
+        if args.redis == "fake":
+            use_fakeredis()
+        # the client shares the app's event loop here, so its own work reads as loop lag
+        os.environ["ADMISSION_CONTROL"] = args.admission
+        import main as app_main
+        await app_main.startup()
+        transport = httpx.ASGITransport(app=app_main.app)
+        client = httpx.AsyncClient(transport=transport, base_url="http://replay", limits=limits)
+    else:
+        client = httpx.AsyncClient(base_url=args.url, limits=limits, timeout=args.timeout)
+
+    try:
+        report = await replay(client, records, args.speed, args.max_in_flight)
+    finally:
+        await client.aclose()
+        if app_main is not None:
+            await app_main.shutdown()
+
+    report["target"] = "in-process" if args.in_process else args.url
+    print(f"{report['requests']} requests, {report['captured_span_s']}s captured, replayed in "
+          f"{report['replay_duration_s']}s at {args.speed}x; peak in flight {report['captured_peak_in_flight']} "
+          f"captured / {report['replayed_peak_in_flight']} replayed; schedule lag p99 "
+          f"{report['schedule_lag']['p99_ms']}ms")
+    for route, r in report["routes"].items():
+        print(f"{route:<22} {r['requests']:>7}  p50 {r['captured']['p50_ms']} -> {r['replayed']['p50_ms']}ms  "
+              f"p99 {r['captured']['p99_ms']} -> {r['replayed']['p99_ms']}ms  "
+              f"errors={r['errors']} status_mismatches={r['status_mismatches']}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("captures", nargs="+", help="capture files, globs or CAPTURE_DIR directories")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--url", default="http://localhost:8080")
+    target.add_argument("--in-process", action="store_true")
+    parser.add_argument("--redis", choices=["url", "spawn", "fake"], default="url")
+    parser.add_argument("--admission", choices=["off", "adaptive"], default="off",
+                        help="ADMISSION_CONTROL of the --in-process app")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay N times faster than captured")
+    parser.add_argument("--max-in-flight", type=int, default=1000, help="cap on concurrent replayed requests")
+    # the event stream stays open until the client leaves, its latency says nothing
+    parser.add_argument("--skip", nargs="*", default=["/stream/"], help="target prefixes not to replay")
+    parser.add_argument("--limit", type=int, help="replay only the first N requests")
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--json", help="write the report to this file")
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    redis_proc = spawn_redis() if args.in_process and args.redis == "spawn" else None
+    try:
+        sys.exit(asyncio.run(main(args)))
+    finally:
+        if redis_proc is not None:
+            redis_proc.terminate()
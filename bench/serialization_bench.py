@@ -0,0 +1,79 @@
+"""Requests/s per worker for /health and /metrics with RESPONSE_MODE=pydantic vs fast.
+
+Drives the ASGI app in-process (no sockets, no Redis: METRICS_SOURCE=sampler) so the number
+is the handler + FastAPI + serialization cost of one worker:
+
+    python bench/serialization_bench.py --requests 20000
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+os.environ.setdefault("METRICS_SOURCE", "sampler")
+
+import main
+import serialize
+
+
+async def call(app, path):
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"",
+        "root_path": "", "headers": [(b"host", b"bench")], "client": ("127.0.0.1", 0), "server": ("bench", 80),
+    }
+    status = None
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    return status
+
+
+async def run(path, requests, concurrency):
+    per_task = requests // concurrency
+
+    async def worker():
+        for _ in range(per_task):
+            assert await call(main.app, path) == 200
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return per_task * concurrency / (time.perf_counter() - start)
+
+
+async def bench(args):
+    main.sampler.start()
+    results = {}
+    for path in ("/health", "/metrics"):
+        for mode in ("pydantic", "fast"):
+            serialize.RESPONSE_MODE = mode
+            await run(path, 500, args.concurrency)  # warm up
+            rps = await run(path, args.requests, args.concurrency)
+            results[f"{path} {mode}"] = round(rps)
+            print(f"{path:<9} {mode:<9} {rps:>10.0f} req/s")
+    main.sampler.stop()
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+    # the handlers' per-request log lines would dominate the measurement
+    logging.disable(logging.INFO)
+    asyncio.run(bench(args))
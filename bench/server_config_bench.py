@@ -0,0 +1,99 @@
+"""Compare uvicorn server configurations under the same load.
+
+Starts ``python src/main.py`` once per configuration (each is a set of environment overrides
+read by server_config.py), drives it with loadgen.py over HTTP and prints one row per
+configuration and endpoint. Needs a real Redis since the server runs in its own processes:
+either REDIS_HOST/REDIS_PORT as configured or a throwaway one with --redis spawn.
+
+Examples:
+    python bench/server_config_bench.py --redis spawn
+    python bench/server_config_bench.py --configs baseline uvloop-httptools --time-scale 0.5 --json out.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+from typing import Dict
+
+import httpx
+
+from loadgen import SRC, free_port, spawn_redis
+
+CONFIGS: Dict[str, Dict[str, str]] = {
+    # stock uvicorn: asyncio loop, h11 parser, its default backlog and 5s keep-alive
+    "baseline": {"WORKERS": "1", "UVICORN_LOOP": "asyncio", "UVICORN_HTTP": "h11",
+                 "UVICORN_BACKLOG": "2048", "UVICORN_KEEPALIVE": "5"},
+    "uvloop-httptools": {"WORKERS": "1", "UVICORN_LOOP": "uvloop", "UVICORN_HTTP": "httptools"},
+    "auto": {"WORKERS": "auto"},
+    "auto-no-access-log": {"WORKERS": "auto", "UVICORN_ACCESS_LOG": "false"},
+    "auto-limited": {"WORKERS": "auto", "UVICORN_LIMIT_CONCURRENCY": "500", "UVICORN_MAX_REQUESTS": "50000"},
+}
+
+
+def wait_ready(url: str, proc: subprocess.Popen, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"server exited with {proc.returncode}")
+        try:
+            if httpx.get(f"{url}/health", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("server did not become healthy")
+
+
+def run_config(name: str, overrides: Dict[str, str], args) -> Dict:
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    env = {**os.environ, **overrides, "PORT": str(port), "HOST": "127.0.0.1",
+           "PROMETHEUS_MULTIPROC_DIR": tempfile.mkdtemp(prefix="prom-bench-")}
+    server = subprocess.Popen([sys.executable, os.path.join(SRC, "main.py")], env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_ready(url, server)
+        with tempfile.NamedTemporaryFile(suffix=".json") as out:
+            subprocess.run([sys.executable, os.path.join(os.path.dirname(__file__), "loadgen.py"),
+                            "--url", url, "--scenario", args.scenario, "--time-scale", str(args.time_scale),
+                            "--endpoints", *args.endpoints, "--json", out.name],
+                           check=True, stdout=subprocess.DEVNULL)
+            return json.load(open(out.name))["results"]
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def main(args) -> int:
+    report = {}
+    print(f"{'config':<20} {'endpoint':<20} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'errors':>8}")
+    for name in args.configs:
+        results = run_config(name, CONFIGS[name], args)
+        report[name] = {"env": CONFIGS[name], "results": results}
+        for path, r in results.items():
+            print(f"{name:<20} {path:<20} {r['rps']:>9} {r['p50_ms']:>9} {r['p99_ms']:>9} {r['errors']:>8}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--configs", nargs="+", choices=list(CONFIGS), default=list(CONFIGS))
+    parser.add_argument("--redis", choices=["url", "spawn"], default="url")
+    parser.add_argument("--scenario", default="smoke")
+    parser.add_argument("--time-scale", type=float, default=1.0)
+    parser.add_argument("--endpoints", nargs="+", default=["/health", "/metrics", "/get-all-redis-keys"])
+    parser.add_argument("--json", help="write the report to this file")
+    args = parser.parse_args()
+
+    redis_proc = spawn_redis() if args.redis == "spawn" else None
+    try:
+        sys.exit(main(args))
+    finally:
+        if redis_proc is not None:
+            redis_proc.terminate()
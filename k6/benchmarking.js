@@ -14,6 +14,7 @@
 
     check(res, {
       'status is 200': (r) => r.status === 200,
+      'not shed (503)': (r) => r.status !== 503,
     });
 	sleep(0.0001);  // 100ms think time = ~10 requests/second per user
   }
@@ -15,6 +15,7 @@ export default function () {
 
   check(res, {
     'status is 200': (r) => r.status === 200,
+    'not shed (503)': (r) => r.status !== 503,
   });
 
 }
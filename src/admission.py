@@ -0,0 +1,219 @@
+"""Adaptive admission control: excess load gets an immediate 503 instead of a place in the queue.
+
+A worker is one event loop, so it saturates in two ways, and a request is shed on either:
+
+* queueing: once the CPU is saturated, requests wait in the loop's ready queue before the app
+  sees them. That wait is the event-loop lag (prom.loop_lag, decaying between probes), and a
+  request is refused while it exceeds ADMISSION_MAX_QUEUE_DELAY times its class's factor;
+* concurrency: requests waiting on Redis pile up inside the app. Each worker admits at most
+  ``limit`` of them at once.
+
+The limit follows observed latency (the loop lag at admission plus the time in the app) with a
+gradient, in the manner of TCP Vegas:
+
+* every completed request is compared with its route's baseline, the lowest latency that route
+  saw over the last BASELINE_WINDOWS windows (a minute, longer than a KEDA scale-up takes). It
+  tracks each route's unloaded latency, and /page is never judged against /health;
+* every ADMISSION_WINDOW seconds the mean of baseline/observed over the window, times
+  ADMISSION_TOLERANCE, gives a gradient between 0.5 and 1. It stays at 1 while latency is within
+  TOLERANCE times its baseline and falls as queueing inflates it;
+* the new limit is ``limit * gradient``, plus ``sqrt(limit)`` headroom when the window actually
+  used the limit. It is smoothed and clamped to ADMISSION_MIN_LIMIT..ADMISSION_MAX_LIMIT.
+
+Routes have a priority (ADMISSION_PRIORITIES, ``path=class``). Class 0 is never limited or
+measured: probes, scrapes, the long-lived event stream and the debug endpoints. Classes 1-3 may
+fill 100%, 90% and 75% of the limit and are shed at 4, 2 and 1 times the queue delay, so under
+saturation /page and /get-all-redis-keys go first while /health still gets through.
+"""
+import os
+import math
+import time
+import logging
+from collections import deque
+from typing import Callable, Deque, Dict, Optional
+
+from prom import ADMISSION_LIMIT, ADMISSION_REJECTED, RouteLabels, loop_lag
+
+
+# "adaptive" sheds load above the latency-driven limit, "off" admits everything
+ADMISSION_CONTROL = os.getenv("ADMISSION_CONTROL", "adaptive")
+ADMISSION_INITIAL_LIMIT = int(os.getenv("ADMISSION_INITIAL_LIMIT", 20))
+ADMISSION_MIN_LIMIT = int(os.getenv("ADMISSION_MIN_LIMIT", 4))
+ADMISSION_MAX_LIMIT = int(os.getenv("ADMISSION_MAX_LIMIT", 500))
+ADMISSION_WINDOW = float(os.getenv("ADMISSION_WINDOW", 1))
+# latency may grow to this multiple of a route's baseline before the limit shrinks
+ADMISSION_TOLERANCE = float(os.getenv("ADMISSION_TOLERANCE", 2))
+ADMISSION_MAX_QUEUE_DELAY = float(os.getenv("ADMISSION_MAX_QUEUE_DELAY", 0.05))
+ADMISSION_RETRY_AFTER = os.getenv("ADMISSION_RETRY_AFTER", "1")
+ADMISSION_PRIORITIES = os.getenv(
+    "ADMISSION_PRIORITIES",
+    "/livez=0,/readyz=0,/startup=0,/prometheus=0,/scaling=0,/stream/cluster-cpu=0,"
+    "/debug/profile=0,/debug/blocking=0,/debug/route-times=0,"
+    "/health=1,/metrics=2,/page=3,/get-all-redis-keys=3",
+)
+DEFAULT_PRIORITY = 2
+# share of the limit each priority class may fill
+SHARES = {1: 1.0, 2: 0.9, 3: 0.75}
+# multiple of ADMISSION_MAX_QUEUE_DELAY each class tolerates
+DELAY_FACTORS = {1: 4.0, 2: 2.0, 3: 1.0}
+# completions needed before a window may move the limit
+MIN_SAMPLES = 10
+SMOOTHING = 0.5
+BASELINE_WINDOWS = 60
+
+REJECTED_BODY = b'{"detail":"overloaded, retry later"}'
+
+logger = logging.getLogger(__name__)
+
+
+def parse_priorities(spec: str) -> Dict[str, int]:
+    priorities = {}
+    for item in spec.split(","):
+        path, _, priority = item.strip().partition("=")
+        if path and priority:
+            priorities[path] = int(priority)
+    return priorities
+
+
+class AdaptiveLimiter:
+    """Concurrency limit of one worker; only touched from its event loop, so no locks"""
+
+    def __init__(self, initial: int = ADMISSION_INITIAL_LIMIT, min_limit: int = ADMISSION_MIN_LIMIT,
+                 max_limit: int = ADMISSION_MAX_LIMIT, window: float = ADMISSION_WINDOW,
+                 tolerance: float = ADMISSION_TOLERANCE, max_queue_delay: float = ADMISSION_MAX_QUEUE_DELAY):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.window = window
+        self.tolerance = tolerance
+        self.max_queue_delay = max_queue_delay
+        self.in_flight = 0
+        self.baselines: Dict[str, float] = {}
+        self._lows: Dict[str, Deque[float]] = {}
+        self._window_low: Dict[str, float] = {}
+        self.admitted = 0
+        self.rejected: Dict[str, int] = {}
+        self.rejected_by = {"queue": 0, "limit": 0}
+        self.gradient = 1.0
+        self.updates = 0
+        self._window_started = time.monotonic()
+        self._ratio_sum = 0.0
+        self._samples = 0
+        self._peak = 0
+
+    def publish(self):
+        ADMISSION_LIMIT.set(int(self.limit))
+
+    def try_acquire(self, route: str, priority: int, queue_delay: float) -> bool:
+        if queue_delay > self.max_queue_delay * DELAY_FACTORS[priority]:
+            reason = "queue"
+        elif self.in_flight >= max(1, int(self.limit * SHARES[priority])):
+            reason = "limit"
+        else:
+            reason = None
+        if reason is not None:
+            self.rejected[route] = self.rejected.get(route, 0) + 1
+            self.rejected_by[reason] += 1
+            ADMISSION_REJECTED.labels(route, reason).inc()
+            return False
+        self.in_flight += 1
+        self.admitted += 1
+        if self.in_flight > self._peak:
+            self._peak = self.in_flight
+        return True
+
+    def release(self, route: str, latency: float):
+        self.in_flight -= 1
+        latency = max(latency, 1e-6)
+        self._ratio_sum += min(1.0, self.baselines.get(route, latency) / latency)
+        self._samples += 1
+        if latency < self._window_low.get(route, math.inf):
+            self._window_low[route] = latency
+
+        now = time.monotonic()
+        if now - self._window_started >= self.window and self._samples >= MIN_SAMPLES:
+            self._update(now)
+
+    def _update(self, now: float):
+        for route, low in self._window_low.items():
+            lows = self._lows.setdefault(route, deque(maxlen=BASELINE_WINDOWS))
+            lows.append(low)
+            self.baselines[route] = min(lows)
+        self._window_low = {}
+        self.gradient = max(0.5, min(1.0, self.tolerance * self._ratio_sum / self._samples))
+        # only grow when the window was limited by us, not by how much traffic arrived
+        headroom = math.sqrt(self.limit) if self._peak >= int(self.limit * 0.9) else 0.0
+        target = self.limit * self.gradient + headroom
+        limit = min(self.max_limit, max(self.min_limit, self.limit * (1 - SMOOTHING) + target * SMOOTHING))
+        if int(limit) != int(self.limit):
+            logger.debug("Admission limit %d -> %d (gradient %.2f)", self.limit, limit, self.gradient)
+        self.limit = limit
+        self.updates += 1
+        self._window_started = now
+        self._ratio_sum = 0.0
+        self._samples = 0
+        self._peak = self.in_flight
+        self.publish()
+
+    def stats(self) -> Dict:
+        return {
+            "mode": ADMISSION_CONTROL,
+            "limit": int(self.limit),
+            "in_flight": self.in_flight,
+            "gradient": round(self.gradient, 3),
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "rejected_by": dict(self.rejected_by),
+            "baselines_ms": {route: round(b * 1000, 2) for route, b in self.baselines.items()},
+            "updates": self.updates,
+            "min_limit": self.min_limit,
+            "max_limit": self.max_limit,
+            "tolerance": self.tolerance,
+            "max_queue_delay_ms": self.max_queue_delay * 1000,
+        }
+
+
+limiter = AdaptiveLimiter()
+
+
+class AdmissionMiddleware:
+    """ASGI middleware admitting requests against the worker's limiter.
+
+    Requests are labelled by route template, paths outside the app's routes as "other" (RouteLabels).
+    """
+
+    def __init__(self, app, limiter: Optional[AdaptiveLimiter] = limiter, mode: str = ADMISSION_CONTROL,
+                 priorities: Optional[Dict[str, int]] = None, queue_delay: Callable[[], float] = loop_lag.current_lag):
+        self.app = app
+        self.limiter = limiter if mode == "adaptive" else None
+        self.queue_delay = queue_delay
+        self.priorities = priorities if priorities is not None else parse_priorities(ADMISSION_PRIORITIES)
+        self._route = RouteLabels()
+        self.headers = [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(REJECTED_BODY)).encode()),
+            (b"retry-after", ADMISSION_RETRY_AFTER.encode()),
+        ]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.limiter is None:
+            await self.app(scope, receive, send)
+            return
+        priority = self.priorities.get(scope["path"], DEFAULT_PRIORITY)
+        if priority == 0:
+            await self.app(scope, receive, send)
+            return
+
+        if priority not in SHARES:
+            priority = DEFAULT_PRIORITY
+        route = self._route(scope)
+        delay = self.queue_delay()
+        if not self.limiter.try_acquire(route, priority, delay):
+            await send({"type": "http.response.start", "status": 503, "headers": self.headers})
+            await send({"type": "http.response.body", "body": REJECTED_BODY})
+            return
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.limiter.release(route, delay + time.perf_counter() - start)
@@ -0,0 +1,131 @@
+import os
+import json
+import time
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+import redis.asyncio as aioredis
+
+from sampler import MetricsSampler
+
+
+# "worker" reports the serving worker's own process, "pod" a rollup over every worker in the pod
+METRICS_SCOPE = os.getenv("METRICS_SCOPE", "worker")
+AGGREGATE_INTERVAL = float(os.getenv("METRICS_AGGREGATE_INTERVAL", 2))
+# a worker that has not published for this many intervals is treated as gone
+AGGREGATE_EXPIRE_INTERVALS = 3
+
+SUMMED_FIELDS = ("cpu_percent", "memory_mb", "memory_percent", "num_threads", "open_files", "connections")
+# read from the pod's cgroup, so every worker reports the same container and they are not summed
+CONTAINER_FIELDS = ("cpu_percent", "memory_mb", "memory_percent", "cpu_quota", "throttled_ratio", "cpu_pressure")
+
+logger = logging.getLogger(__name__)
+
+
+def rollup(samples: List[Dict]) -> Dict:
+    """Pod-wide totals plus the per-worker breakdown; sampled_at is the oldest contributing sample"""
+    totals = {field: 0 for field in SUMMED_FIELDS}
+    for sample in samples:
+        for field in SUMMED_FIELDS:
+            totals[field] += sample[field]
+    for field in ("cpu_percent", "memory_mb", "memory_percent"):
+        totals[field] = round(totals[field], 2)
+    newest = max(samples, key=lambda s: s["sampled_at"], default=None)
+    if newest is not None and newest.get("source") == "cgroup":
+        for field in CONTAINER_FIELDS:
+            totals[field] = newest[field]
+        totals["source"] = "cgroup"
+    totals["sampled_at"] = min((s["sampled_at"] for s in samples), default=time.time())
+    totals["workers"] = sorted(samples, key=lambda s: s["worker"])
+    return totals
+
+
+class PodAggregator:
+    """Publishes this worker's snapshot to worker-metrics:{ns}:{pod} and keeps the pod rollup in memory.
+
+    Each worker does one pipeline (HSET own field, PEXPIRE, HGETALL) per interval, so reads of
+    the rollup never touch Redis and the cost does not grow with request rate.
+    """
+
+    def __init__(self, sampler: MetricsSampler, interval: float = AGGREGATE_INTERVAL, writer=None):
+        self.sampler = sampler
+        # a WriteBatcher to share its flushes, None sends an own pipeline
+        self.writer = writer
+        self.interval = interval
+        ns = os.getenv("POD_NAMESPACE", "default")
+        pod = os.getenv("POD_NAME", "unknown")
+        self.key = f"worker-metrics:{ns}:{pod}"
+        self.rollup: Optional[Dict] = None
+        self._task: Optional[asyncio.Task] = None
+        self.errors = 0
+        # the last publish failed, so the rollup would be stale
+        self.failing = False
+        self._errors_before = 0
+
+    def start(self, rc: aioredis.Redis):
+        self._task = asyncio.create_task(self._run(rc))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def publish(self, rc: aioredis.Redis) -> Dict:
+        pid = os.getpid()
+        own = {**self.sampler.latest().as_dict(), "worker": pid}
+        expire_after = self.interval * AGGREGATE_EXPIRE_INTERVALS
+        data = json.dumps(own)
+
+        def queue(pipe):
+            pipe.hset(self.key, str(pid), data)
+            pipe.pexpire(self.key, int(expire_after * 1000))
+            pipe.hgetall(self.key)
+
+        if self.writer is not None:
+            *_, fields = await self.writer.submit(("worker-metrics", pid), queue)
+            if isinstance(fields, Exception):
+                raise fields
+        else:
+            pipe = rc.pipeline(transaction=False)
+            queue(pipe)
+            *_, fields = await pipe.execute()
+
+        cutoff = time.time() - expire_after
+        samples, dead = [], []
+        for field, val in fields.items():
+            sample = json.loads(val)
+            if sample["sampled_at"] >= cutoff:
+                samples.append(sample)
+            else:
+                dead.append(field)
+        if dead:
+            await rc.hdel(self.key, *dead)
+        self.rollup = rollup(samples)
+        return self.rollup
+
+    async def _run(self, rc: aioredis.Redis):
+        while True:
+            try:
+                await self.publish(rc)
+                if self.failing:
+                    failures = self.errors - self._errors_before
+                    logger.info(f"Pod metrics aggregation recovered after {failures} failures")
+                self.failing = False
+            except Exception as e:
+                if not self.failing:
+                    logger.warning(f"Pod metrics aggregation failing, serving this worker alone: {e}")
+                    self._errors_before = self.errors
+                self.errors += 1
+                self.failing = True
+            await asyncio.sleep(self.interval)
+
+    def latest(self) -> Dict:
+        """Last pod rollup, or this worker alone until the first publish lands or while Redis fails"""
+        if self.rollup is None or self.failing:
+            return rollup([{**self.sampler.latest().as_dict(), "worker": os.getpid()}])
+        return self.rollup
@@ -0,0 +1,104 @@
+"""Precompressed, content-addressed static assets for the /page dashboard.
+
+Everything is built once per worker at startup: dashboard.css and dashboard.js are published
+under content-hash names (``/static/dashboard.<hash>.js``) with a one-year immutable
+Cache-Control, and dashboard.html has those URLs substituted in. The HTML itself stays at
+/page with ``no-cache``, so browsers revalidate it with If-None-Match and get a bodiless 304
+until the image changes. Each asset is held as identity, gzip and, when the optional
+``brotli`` package is installed, br bytes.
+"""
+import os
+import gzip
+import hashlib
+from typing import Dict, NamedTuple
+
+from fastapi import Request
+from fastapi.responses import Response
+
+try:
+    import brotli
+except ImportError:  # optional, gzip alone still covers every browser
+    brotli = None
+
+
+STATIC_DIR = os.path.join(os.path.dirname(__file__), "static")
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+CONTENT_TYPES = {
+    ".html": "text/html; charset=utf-8",
+    ".css": "text/css; charset=utf-8",
+    ".js": "text/javascript; charset=utf-8",
+}
+
+
+class Asset(NamedTuple):
+    content_type: str
+    cache_control: str
+    digest: str
+    # encoding ("identity", "gzip", "br") -> body
+    bodies: Dict[str, bytes]
+
+    def etag(self, encoding: str) -> str:
+        # strong validators must differ per byte representation
+        return f'"{self.digest}"' if encoding == "identity" else f'"{self.digest}-{encoding}"'
+
+
+def make_asset(body: bytes, content_type: str, cache_control: str) -> Asset:
+    bodies = {"identity": body, "gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        bodies["br"] = brotli.compress(body, quality=11)
+    digest = hashlib.sha256(body).hexdigest()[:16]
+    return Asset(content_type, cache_control, digest, bodies)
+
+
+def build(static_dir: str = STATIC_DIR) -> Dict[str, Asset]:
+    """Map of URL path -> Asset for the dashboard page and its hashed css/js"""
+    assets = {}
+    with open(os.path.join(static_dir, "dashboard.html"), "rb") as f:
+        page = f.read()
+    for name in ("dashboard.css", "dashboard.js"):
+        stem, ext = os.path.splitext(name)
+        with open(os.path.join(static_dir, name), "rb") as f:
+            asset = make_asset(f.read(), CONTENT_TYPES[ext], IMMUTABLE)
+        url = f"/static/{stem}.{asset.digest}{ext}"
+        assets[url] = asset
+        page = page.replace(b"{{" + name.encode() + b"}}", url.encode())
+    assets["/page"] = make_asset(page, CONTENT_TYPES[".html"], REVALIDATE)
+    return assets
+
+
+def negotiate(accept_encoding: str, available) -> str:
+    """Best of br > gzip > identity the client accepts with q > 0"""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        token, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if token:
+            accepted[token.lower()] = q
+    for encoding in ("br", "gzip"):
+        if encoding in available and accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return "identity"
+
+
+def respond(asset: Asset, request: Request) -> Response:
+    encoding = negotiate(request.headers.get("accept-encoding", ""), asset.bodies)
+    etag = asset.etag(encoding)
+    headers = {"ETag": etag, "Cache-Control": asset.cache_control, "Vary": "Accept-Encoding"}
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        tags = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+        if "*" in tags or tags & {asset.etag(e) for e in asset.bodies}:
+            return Response(status_code=304, headers=headers)
+
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(content=asset.bodies[encoding], media_type=asset.content_type, headers=headers)
@@ -0,0 +1,171 @@
+"""Write-behind batching of Redis writes over the worker's shared pool.
+
+Writers hand over a function that queues their commands on a pipeline, under a coalescing
+key. Within WRITE_BATCH_WINDOW a newer write for the same key replaces the older one, and
+everything pending is then sent as one non-transactional pipeline: one round trip and one
+pooled connection per window, however many sources wrote. The pipeline goes through the Redis
+circuit breaker like any other call. A failed flush drops its batch, since every writer here
+re-sends fresh data on its own cadence (CPU samples, cache fills, worker rollups).
+
+Threads (the CPU reporter) use put_threadsafe(); coroutines that need the replies use submit().
+"""
+import os
+import time
+import asyncio
+import logging
+from typing import Callable, Dict, Hashable, List, Optional
+
+from prom import REDIS_BATCH_SIZE, REDIS_FLUSH_LATENCY, REDIS_WRITES_COALESCED, REDIS_WRITES_DROPPED
+
+
+WRITE_BATCH_WINDOW = float(os.getenv("WRITE_BATCH_WINDOW", 0.1))
+
+logger = logging.getLogger(__name__)
+
+# queues commands on the pipeline it is given
+Queue = Callable[[object], None]
+# receives the replies to the commands its Queue added, or the exception that failed the flush
+OnResult = Callable[[List], None]
+
+
+class WriteBatcher:
+    def __init__(self, window: float = WRITE_BATCH_WINDOW):
+        self.window = window
+        self.pending: Dict[Hashable, tuple] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._client = None
+        self.writes = 0
+        self.coalesced = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.dropped = 0
+        self.commands = 0
+        # flushes are failing; logged once when it starts and once when it ends
+        self.failing = False
+        self._dropped_before = 0
+
+    def start(self, get_client: Callable):
+        self._client = get_client
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            await self.flush()
+
+    def put(self, key: Hashable, queue: Queue, on_result: Optional[OnResult] = None):
+        """Schedule a write; replaces a pending write with the same key"""
+        self.writes += 1
+        prev = self.pending.get(key)
+        callbacks = prev[1] if prev is not None else []
+        if prev is not None:
+            self.coalesced += 1
+            REDIS_WRITES_COALESCED.inc()
+        if on_result is not None:
+            callbacks.append(on_result)
+        self.pending[key] = (queue, callbacks)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def put_threadsafe(self, key: Hashable, queue: Queue, on_result: Optional[OnResult] = None):
+        if self._loop is None:
+            raise RuntimeError("write batcher is not started")
+        self._loop.call_soon_threadsafe(self.put, key, queue, on_result)
+
+    async def submit(self, key: Hashable, queue: Queue) -> List:
+        """Schedule a write and wait for its replies; raises if the flush fails"""
+        future = asyncio.get_running_loop().create_future()
+
+        def resolve(replies):
+            if not future.done():
+                if isinstance(replies, Exception):
+                    future.set_exception(replies)
+                else:
+                    future.set_result(replies)
+
+        self.put(key, queue, resolve)
+        return await future
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            await asyncio.sleep(self.window)
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                # never let the task die, or every later put() would pile up in pending
+                logger.exception(f"Write batch flush crashed: {e}")
+
+    async def flush(self):
+        batch, self.pending = self.pending, {}
+        if not batch:
+            return
+        spans = []
+        size = 0
+        start = time.perf_counter()
+        failure = None
+        replies = None
+        try:
+            pipe = self._client().pipeline(transaction=False)
+            for queue, callbacks in batch.values():
+                first = len(pipe)
+                queue(pipe)
+                spans.append((first, len(pipe), callbacks))
+            size = len(pipe)
+            replies = await pipe.execute(raise_on_error=False)
+        except Exception as e:
+            self.failed_flushes += 1
+            self.dropped += len(batch)
+            REDIS_WRITES_DROPPED.inc(len(batch))
+            if not self.failing:
+                # once per outage; the rest are counted in failed_flushes and dropped
+                logger.warning(f"Write batches failing, dropping them until Redis recovers: {e}")
+                self.failing = True
+            failure = e
+            # a batch that failed while being built still owes its writers an answer
+            spans = [(0, 0, callbacks) for _, callbacks in batch.values()]
+        else:
+            if self.failing:
+                dropped = self.dropped - self._dropped_before
+                logger.info(f"Write batches recovered, {dropped} writes dropped meanwhile")
+                self.failing = False
+            self._dropped_before = self.dropped
+        finally:
+            REDIS_FLUSH_LATENCY.observe(time.perf_counter() - start)
+            REDIS_BATCH_SIZE.observe(size)
+        self.flushes += 1
+        self.commands += size
+
+        for first, end, callbacks in spans:
+            result = failure if replies is None else replies[first:end]
+            for callback in callbacks:
+                try:
+                    callback(result)
+                except Exception as e:
+                    logger.warning(f"Write batch callback failed: {e}")
+
+    def stats(self) -> Dict:
+        return {
+            "window": self.window,
+            "pending": len(self.pending),
+            "writes": self.writes,
+            "coalesced": self.coalesced,
+            "flushes": self.flushes,
+            "commands": self.commands,
+            "failed_flushes": self.failed_flushes,
+            "dropped": self.dropped,
+            "failing": self.failing,
+        }
+
+
+batcher = WriteBatcher()
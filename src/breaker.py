@@ -0,0 +1,92 @@
+"""Circuit breaker for a remote dependency.
+
+closed     calls pass; BREAKER_FAILURES consecutive failures open the circuit
+open       calls are refused immediately for BREAKER_RESET seconds
+half_open  one probe call at a time is let through; success closes, failure reopens
+
+The breaker lives in one worker's event loop, so its state needs no locks; other threads
+(the CPU reporter) only read ``state``.
+"""
+import os
+import time
+import logging
+from typing import Callable, Dict, Optional
+
+
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", 5))
+BREAKER_RESET = float(os.getenv("BREAKER_RESET", 5))
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+# gauge values, higher is worse so a max across workers shows the worst one
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failures: int = BREAKER_FAILURES, reset: float = BREAKER_RESET,
+                 on_change: Optional[Callable[[str], None]] = None):
+        self.name = name
+        self.failure_threshold = failures
+        self.reset_timeout = reset
+        self.on_change = on_change
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.rejected = 0
+        self.opened = 0
+
+    def allow(self) -> bool:
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                self.rejected += 1
+                return False
+            self._set(HALF_OPEN)
+        if self.probing:
+            self.rejected += 1
+            return False
+        self.probing = True
+        return True
+
+    def record_success(self):
+        self.failures = 0
+        self.probing = False
+        if self.state != CLOSED:
+            self._set(CLOSED)
+
+    def record_failure(self):
+        self.failures += 1
+        self.probing = False
+        if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+            self.opened_at = time.monotonic()
+            self.opened += 1
+            self._set(OPEN)
+
+    def abandon(self):
+        """A call was cancelled before it could tell us anything; free the probe slot"""
+        self.probing = False
+
+    def _set(self, state: str):
+        if CLOSED in (state, self.state):
+            logger.warning(f"Circuit {self.name} {self.state} -> {state}")
+        else:
+            # open <-> half_open repeats every reset timeout for as long as the outage lasts
+            logger.debug(f"Circuit {self.name} {self.state} -> {state}")
+        self.state = state
+        if self.on_change is not None:
+            self.on_change(state)
+
+    def stats(self) -> Dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "rejected": self.rejected,
+            "opened": self.opened,
+            "failure_threshold": self.failure_threshold,
+            "reset_timeout": self.reset_timeout,
+        }
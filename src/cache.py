@@ -0,0 +1,247 @@
+import os
+import math
+import time
+import random
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Set
+
+import orjson
+import redis.asyncio as aioredis
+
+from prom import CACHE_LOOKUPS
+
+
+# how long a filled value counts as fresh
+CACHE_TTL = float(os.getenv("CACHE_TTL", 5))
+# extra time an expired value is kept in Redis and served while one caller refreshes it
+CACHE_STALE_TTL = float(os.getenv("CACHE_STALE_TTL", 10))
+# cross-worker/pod fill lease, also the longest a caller waits on someone else's fill
+CACHE_LEASE_MS = int(os.getenv("CACHE_LEASE_MS", 2000))
+# XFetch beta, >1 refreshes earlier, 0 disables early refresh
+CACHE_EARLY_BETA = float(os.getenv("CACHE_EARLY_BETA", 1.0))
+# process-local tier in front of Redis
+LOCAL_CACHE_TTL = float(os.getenv("LOCAL_CACHE_TTL", 1))
+LOCAL_CACHE_SIZE = int(os.getenv("LOCAL_CACHE_SIZE", 256))
+
+_MISSING = object()
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key in this worker into one in-flight call"""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._calls
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        while key in self._calls:
+            fut = self._calls[key]
+            # unlike awaiting fut, wait() leaves it alone when this caller is the one cancelled
+            await asyncio.wait((fut,))
+            if not fut.cancelled():
+                return fut.result()
+            # the leader was cancelled, not this caller: run the call itself or join whoever does
+
+        fut = asyncio.get_running_loop().create_future()
+        self._calls[key] = fut
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            fut.cancel()
+            raise
+        except Exception as e:
+            fut.set_exception(e)
+            fut.exception()  # mark retrieved when nobody else was waiting
+            raise
+        else:
+            fut.set_result(result)
+            return result
+        finally:
+            del self._calls[key]
+
+
+class LocalCache:
+    """Process-local TTL cache with a bounded size and LRU eviction.
+
+    Not thread-safe, it is only touched from the worker's event loop.
+    """
+
+    def __init__(self, maxsize: int = LOCAL_CACHE_SIZE, ttl: float = LOCAL_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.flight = SingleFlight()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            CACHE_LOOKUPS.labels("local", "miss").inc()
+            return default
+        value, expires_at = item
+        if time.monotonic() >= expires_at:
+            del self._data[key]
+            self.expirations += 1
+            self.misses += 1
+            CACHE_LOOKUPS.labels("local", "miss").inc()
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        CACHE_LOOKUPS.labels("local", "hit").inc()
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        self._data[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key: Hashable):
+        self._data.pop(key, None)
+
+    async def get_or_load(self, key: str, load: Callable[[], Awaitable[Any]], ttl: Optional[float] = None) -> Any:
+        """Local hit, or one shared load per key that then populates the local tier"""
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        value = await self.flight.do(key, load)
+        self.set(key, value, ttl)
+        return value
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class StampedeCache:
+    """Redis read-through cache whose fill can't stampede.
+
+    Values are stored as ``{"value", "fresh_until", "delta"}`` envelopes, where ``delta`` is how
+    long the last fill took. Readers:
+
+    * return fresh values directly, except that a reader may refresh early with probability
+      rising as expiry approaches (XFetch: ``now - delta * beta * ln(rand) >= fresh_until``);
+    * return stale values immediately and kick off a single background refresh;
+    * on a miss, share one fill per worker (SingleFlight), and across workers/pods only the
+      caller that wins ``SET NX`` on ``lease:<key>`` computes, the rest poll for its write.
+
+    The lease is not released after the write; it expires after CACHE_LEASE_MS, well before
+    the value stops being fresh.
+    """
+
+    def __init__(self, ttl: float = CACHE_TTL, stale_ttl: float = CACHE_STALE_TTL,
+                 lease_ms: int = CACHE_LEASE_MS, beta: float = CACHE_EARLY_BETA, writer=None):
+        self.ttl = ttl
+        # a WriteBatcher to send fills write-behind, None writes them directly
+        self.writer = writer
+        self.stale_ttl = stale_ttl
+        self.lease_ms = lease_ms
+        self.beta = beta
+        self.flight = SingleFlight()
+        self._tasks: Set[asyncio.Task] = set()
+        self.hits = 0
+        self.misses = 0
+        self.stale_served = 0
+        self.early_refreshes = 0
+        self.fills = 0
+        self.lease_waits = 0
+
+    async def get(self, rc: aioredis.Redis, key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        raw = await rc.get(key)
+        if raw:
+            entry = orjson.loads(raw)
+            now = time.time()
+            fresh_until = entry["fresh_until"]
+            jitter = -entry["delta"] * self.beta * math.log(1.0 - random.random())
+            if now + jitter < fresh_until:
+                self.hits += 1
+                CACHE_LOOKUPS.labels("redis", "hit").inc()
+                return entry["value"]
+            if now >= fresh_until:
+                self.stale_served += 1
+                CACHE_LOOKUPS.labels("redis", "stale").inc()
+            else:
+                self.early_refreshes += 1
+                CACHE_LOOKUPS.labels("redis", "early_refresh").inc()
+            self._refresh_in_background(rc, key, compute)
+            return entry["value"]
+
+        self.misses += 1
+        CACHE_LOOKUPS.labels("redis", "miss").inc()
+        return await self.flight.do(key, lambda: self._fill(rc, key, compute, wait=True))
+
+    def _refresh_in_background(self, rc: aioredis.Redis, key: str, compute: Callable[[], Awaitable[Any]]):
+        # its own flight: a refresh may return None, which a miss sharing its flight would get
+        flight_key = ("refresh", key)
+        if self.flight.in_flight(flight_key):
+            return
+        task = asyncio.create_task(self.flight.do(flight_key, lambda: self._fill(rc, key, compute, wait=False)))
+        self._tasks.add(task)
+        task.add_done_callback(self._refresh_done)
+
+    def _refresh_done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Background cache refresh failed: {task.exception()}")
+
+    async def _fill(self, rc: aioredis.Redis, key: str, compute: Callable[[], Awaitable[Any]],
+                    wait: bool) -> Optional[Any]:
+        if await rc.set(f"lease:{key}", "1", nx=True, px=self.lease_ms):
+            start = time.perf_counter()
+            value = await compute()
+            entry = {
+                "value": value,
+                "fresh_until": time.time() + self.ttl,
+                "delta": time.perf_counter() - start,
+            }
+            data, px = orjson.dumps(entry), int((self.ttl + self.stale_ttl) * 1000)
+            if self.writer is not None:
+                # lease waiters poll for this write, so they see it one batch window later
+                self.writer.put(("cache", key), lambda pipe: pipe.set(key, data, px=px))
+            else:
+                await rc.set(key, data, px=px)
+            self.fills += 1
+            return value
+
+        if not wait:
+            # someone else is refreshing, the stale value we already returned is fine
+            return None
+
+        self.lease_waits += 1
+        deadline = time.monotonic() + self.lease_ms / 1000
+        while time.monotonic() < deadline:
+            await asyncio.sleep(0.02)
+            raw = await rc.get(key)
+            if raw:
+                return orjson.loads(raw)["value"]
+        # lease holder never wrote, answer this caller without touching the cache
+        return await compute()
+
+    def stats(self) -> Dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale_served": self.stale_served,
+            "early_refreshes": self.early_refreshes,
+            "fills": self.fills,
+            "lease_waits": self.lease_waits,
+        }
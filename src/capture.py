@@ -0,0 +1,244 @@
+"""Opt-in capture of request metadata for replay (bench/replay.py).
+
+With CAPTURE=on every request leaves one packed record: arrival time, latency, status, response
+size, method, requests already in flight at arrival and the request target (path and query).
+Inter-arrival times and concurrency follow from arrival and latency. Nothing about headers or
+bodies is kept.
+
+The middleware only packs the record into an in-memory buffer. A task on the loop hands full
+buffers (CAPTURE_BUFFER_BYTES, or whatever arrived in the last second) to a writer thread through
+a bounded queue; when the writer falls behind, whole chunks are dropped and counted instead of
+blocking the loop. The thread appends to ``{CAPTURE_DIR}/capture-{pid}-{n}.bin`` and starts a new
+file past CAPTURE_MAX_BYTES, keeping the newest CAPTURE_KEEP files per worker, so disk use is
+bounded by CAPTURE_MAX_BYTES * CAPTURE_KEEP per worker. The middleware times its own work and
+/capture reports it.
+
+File format: MAGIC, then records of RECORD followed by ``target_len`` bytes of target.
+"""
+import os
+import glob
+import time
+import queue
+import struct
+import asyncio
+import logging
+import threading
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+
+# "on" records every request, "off" leaves the middleware a pass-through
+CAPTURE = os.getenv("CAPTURE", "off")
+CAPTURE_DIR = os.getenv("CAPTURE_DIR", "/tmp/capture")
+CAPTURE_MAX_BYTES = int(os.getenv("CAPTURE_MAX_BYTES", 64 * 1024 * 1024))
+CAPTURE_KEEP = int(os.getenv("CAPTURE_KEEP", 4))
+CAPTURE_BUFFER_BYTES = int(os.getenv("CAPTURE_BUFFER_BYTES", 64 * 1024))
+# chunks waiting for the writer thread before new ones are dropped
+CAPTURE_QUEUE_CHUNKS = int(os.getenv("CAPTURE_QUEUE_CHUNKS", 64))
+FLUSH_INTERVAL = 1.0
+
+MAGIC = b"HSCAP1\n"
+# arrival (epoch s), latency s, status, in flight at arrival, response bytes, method, target length
+RECORD = struct.Struct("<dfHHIBH")
+METHODS = ("GET", "HEAD", "POST", "PUT", "DELETE", "PATCH", "OPTIONS")
+METHOD_CODES = {m: i for i, m in enumerate(METHODS)}
+MAX_TARGET = 1024
+
+logger = logging.getLogger(__name__)
+
+
+class Record(NamedTuple):
+    arrival: float
+    latency: float
+    status: int
+    in_flight: int
+    response_bytes: int
+    method: str
+    target: str
+
+
+def read_records(path: str) -> Iterator[Record]:
+    with open(path, "rb") as f:
+        data = f.read()
+    if not data.startswith(MAGIC):
+        raise ValueError(f"{path} is not a capture file")
+    pos = len(MAGIC)
+    # a file being written can end in a partial record
+    while pos + RECORD.size <= len(data):
+        arrival, latency, status, in_flight, size, method, length = RECORD.unpack_from(data, pos)
+        pos += RECORD.size
+        if pos + length > len(data):
+            break
+        target = data[pos:pos + length].decode("latin-1")
+        pos += length
+        yield Record(arrival, latency, status, in_flight, size, METHODS[method], target)
+
+
+def capture_files(paths: List[str]) -> List[str]:
+    """Expand directories and globs into capture files"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(glob.glob(os.path.join(path, "capture-*.bin")))
+        else:
+            files.extend(glob.glob(path))
+    return sorted(files)
+
+
+class CaptureWriter:
+    """Writer thread appending buffered records to rotated files"""
+
+    def __init__(self, directory: str = CAPTURE_DIR, max_bytes: int = CAPTURE_MAX_BYTES, keep: int = CAPTURE_KEEP,
+                 buffer_bytes: int = CAPTURE_BUFFER_BYTES, queue_chunks: int = CAPTURE_QUEUE_CHUNKS):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.keep = keep
+        self.buffer_bytes = buffer_bytes
+        self.buffer = bytearray()
+        self.chunks: queue.Queue = queue.Queue(maxsize=queue_chunks)
+        self.records = 0
+        self.dropped_records = 0
+        self.bytes_written = 0
+        self.files: List[str] = []
+        self.overhead_ns = 0
+        self._pending_records = 0
+        self._file = None
+        self._file_bytes = 0
+        self._seq = 0
+        self._thread: Optional[threading.Thread] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._write_loop, daemon=True, name="capture-writer")
+        self._thread.start()
+        self._task = asyncio.create_task(self._flush_loop())
+        logger.info(f"Capturing requests to {self.directory} (max {self.max_bytes} bytes x {self.keep} files)")
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self.flush()
+        self.chunks.put(None)
+        await asyncio.to_thread(self._thread.join, 5)
+
+    def add(self, record: bytes):
+        self.buffer += record
+        self._pending_records += 1
+        if len(self.buffer) >= self.buffer_bytes:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        chunk, count = bytes(self.buffer), self._pending_records
+        self.buffer.clear()
+        self._pending_records = 0
+        try:
+            self.chunks.put_nowait((chunk, count))
+            self.records += count
+        except queue.Full:
+            self.dropped_records += count
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            self.flush()
+
+    def _open(self):
+        if self._file is not None:
+            self._file.close()
+        self._seq += 1
+        path = os.path.join(self.directory, f"capture-{os.getpid()}-{self._seq}.bin")
+        self._file = open(path, "wb")
+        self._file.write(MAGIC)
+        self._file_bytes = len(MAGIC)
+        self.files.append(path)
+        while len(self.files) > self.keep:
+            try:
+                os.remove(self.files.pop(0))
+            except OSError:
+                pass
+
+    def _write_loop(self):
+        while True:
+            item = self.chunks.get()
+            if item is None:
+                break
+            chunk, _ = item
+            try:
+                if self._file is None or self._file_bytes + len(chunk) > self.max_bytes:
+                    self._open()
+                self._file.write(chunk)
+                # a replay may read the file while it is still being written
+                self._file.flush()
+                self._file_bytes += len(chunk)
+                self.bytes_written += len(chunk)
+            except OSError as e:
+                logger.warning(f"Capture write failed: {e}")
+        if self._file is not None:
+            self._file.close()
+
+    def stats(self) -> Dict:
+        captured = self.records + self._pending_records
+        return {
+            "mode": CAPTURE,
+            "records": captured,
+            "dropped_records": self.dropped_records,
+            "bytes_written": self.bytes_written,
+            "queued_chunks": self.chunks.qsize(),
+            "files": list(self.files),
+            "record_us_per_request": round(self.overhead_ns / captured / 1000, 2) if captured else 0.0,
+        }
+
+
+writer = CaptureWriter()
+
+
+class CaptureMiddleware:
+    """ASGI middleware packing one record per HTTP request into the writer's buffer"""
+
+    def __init__(self, app, writer: CaptureWriter = writer, mode: str = CAPTURE):
+        self.app = app
+        self.writer = writer if mode == "on" else None
+        self.in_flight = 0
+        # wall clock at perf_counter() == 0, so an arrival costs one clock read
+        self.epoch = time.time() - time.perf_counter()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.writer is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        in_flight = self.in_flight
+        self.in_flight += 1
+        status = 500
+        size = 0
+
+        async def send_wrapper(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            end = time.perf_counter()
+            self.in_flight -= 1
+            target = scope.get("raw_path") or scope["path"].encode()
+            if scope.get("query_string"):
+                target = target + b"?" + scope["query_string"]
+            target = target[:MAX_TARGET]
+            self.writer.add(RECORD.pack(self.epoch + start, end - start, min(status, 0xFFFF), min(in_flight, 0xFFFF),
+                                        min(size, 0xFFFFFFFF), METHOD_CODES.get(scope["method"], 0), len(target))
+                            + target)
+            self.writer.overhead_ns += int((time.perf_counter() - end) * 1e9)
@@ -0,0 +1,209 @@
+"""Container CPU and memory read straight from the cgroup v2 interface files.
+
+psutil answers for one process (``Process``) or for the whole node (``cpu_percent()``,
+``virtual_memory()``), neither of which is what the pod's limits apply to. CgroupReader opens
+``cpu.stat``, ``cpu.max``, ``memory.current``, ``memory.max``, ``memory.stat`` and ``cpu.pressure``
+once and re-reads them with ``pread`` at offset 0, which makes the kernel regenerate the file: a
+sample is a handful of syscalls with no path lookups, /proc walks or per-call allocations of
+psutil objects. Every sample reports, over the interval since the previous one:
+
+* CPU as cores used and as a percentage of the quota (of the node's cores when unlimited);
+* the share of CFS periods in which the container was throttled, and the time lost to it;
+* CPU pressure (PSI ``some``), the share of wall time runnable tasks waited for a CPU;
+* memory as the working set (``memory.current`` minus ``inactive_file``, what the kubelet
+  evicts on) and as a percentage of ``memory.max`` (of node memory when unlimited).
+
+CGROUP_ROOT points at the container's cgroup; it can point at a fake tree of plain files.
+"""
+import os
+import time
+import threading
+from typing import Dict, NamedTuple, Optional
+
+import psutil
+
+
+CGROUP_ROOT = os.getenv("CGROUP_ROOT", "/sys/fs/cgroup")
+# "auto" uses cgroup v2 when the files are there, "psutil" always samples processes/the node
+METRICS_BACKEND = os.getenv("METRICS_BACKEND", "auto")
+
+FILES = ("cpu.stat", "cpu.max", "memory.current", "memory.max", "memory.stat", "cpu.pressure")
+# without these there is nothing container-level to report
+REQUIRED = ("cpu.stat", "memory.current")
+READ_SIZE = 4096
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def cpu_quota(root: str = CGROUP_ROOT) -> Optional[float]:
+    """CPU limit in cores from cgroup v2 cpu.max (or v1 cfs quota), None when unlimited"""
+    cpu_max = _read(os.path.join(root, "cpu.max"))
+    if cpu_max is not None:
+        return parse_cpu_max(cpu_max.encode())
+    quota = _read(os.path.join(root, "cpu", "cpu.cfs_quota_us"))
+    period = _read(os.path.join(root, "cpu", "cpu.cfs_period_us"))
+    if quota is None or period is None or int(quota) <= 0:
+        return None
+    return int(quota) / int(period)
+
+
+def memory_limit(root: str = CGROUP_ROOT) -> Optional[int]:
+    """Memory limit in bytes from cgroup v2 memory.max (or v1 limit_in_bytes), None when unlimited"""
+    value = _read(os.path.join(root, "memory.max"))
+    if value is None:
+        value = _read(os.path.join(root, "memory", "memory.limit_in_bytes"))
+    if value is None or value == "max":
+        return None
+    limit = int(value)
+    # cgroup v1 reports "unlimited" as a huge page-aligned number
+    return None if limit >= 1 << 60 else limit
+
+
+def parse_cpu_max(blob: bytes) -> Optional[float]:
+    quota, _, period = blob.strip().partition(b" ")
+    if quota == b"max" or not quota:
+        return None
+    return int(quota) / int(period or 100000)
+
+
+def parse_flat(blob: bytes) -> Dict[bytes, int]:
+    """``key value`` lines, as in cpu.stat and memory.stat"""
+    values = {}
+    for line in blob.splitlines():
+        key, _, value = line.partition(b" ")
+        if value:
+            values[key] = int(value)
+    return values
+
+
+def parse_pressure(blob: bytes) -> Dict[bytes, Dict[bytes, float]]:
+    """``some``/``full`` lines of a PSI file -> {b"some": {b"avg10": ..., b"total": ...}}"""
+    pressure = {}
+    for line in blob.splitlines():
+        kind, _, fields = line.partition(b" ")
+        pressure[kind] = {k: float(v) for k, _, v in (f.partition(b"=") for f in fields.split())}
+    return pressure
+
+
+class ContainerSnapshot(NamedTuple):
+    cpu_cores: float
+    cpu_percent: float
+    cpu_quota: Optional[float]
+    throttled_ratio: float
+    throttled_ms: float
+    cpu_pressure: Optional[float]
+    memory_mb: float
+    memory_percent: float
+    memory_limit_mb: Optional[float]
+    sampled_at: float
+
+    def as_fields(self) -> Dict:
+        """The fields that replace psutil's cpu/memory in a metrics sample"""
+        return {
+            "cpu_percent": self.cpu_percent,
+            "memory_mb": self.memory_mb,
+            "memory_percent": self.memory_percent,
+            "source": "cgroup",
+            "cpu_quota": self.cpu_quota,
+            "throttled_ratio": self.throttled_ratio,
+            "cpu_pressure": self.cpu_pressure,
+        }
+
+
+class CgroupReader:
+    """Pre-opened cgroup files of one container; sample() reports the interval since the last call.
+
+    Open it in the process that samples: a worker forked from the preloaded parent opens its own.
+    """
+
+    def __init__(self, root: str = CGROUP_ROOT):
+        self.root = root
+        self.fds: Dict[str, int] = {}
+        for name in FILES:
+            try:
+                self.fds[name] = os.open(os.path.join(root, name), os.O_RDONLY | os.O_CLOEXEC)
+            except OSError:
+                pass
+        missing = [name for name in REQUIRED if name not in self.fds]
+        if missing:
+            self.close()
+            raise FileNotFoundError(f"no cgroup v2 {', '.join(missing)} under {root}")
+        self.node_cores = os.cpu_count() or 1
+        self.node_memory = psutil.virtual_memory().total
+        # (monotonic s, usage us, periods, throttled periods, throttled us, pressure total us)
+        self._prev: Optional[tuple] = None
+        self._lock = threading.Lock()
+
+    def read(self, name: str) -> Optional[bytes]:
+        fd = self.fds.get(name)
+        return os.pread(fd, READ_SIZE, 0) if fd is not None else None
+
+    def sample(self) -> ContainerSnapshot:
+        with self._lock:
+            now = time.monotonic()
+            cpu = parse_flat(self.read("cpu.stat"))
+            cpu_max = self.read("cpu.max")
+            quota = parse_cpu_max(cpu_max) if cpu_max is not None else None
+            pressure_blob = self.read("cpu.pressure")
+            pressure = parse_pressure(pressure_blob).get(b"some") if pressure_blob is not None else None
+            current = int(self.read("memory.current"))
+            memory_stat = self.read("memory.stat")
+            inactive_file = parse_flat(memory_stat).get(b"inactive_file", 0) if memory_stat is not None else 0
+            memory_max = self.read("memory.max")
+            limit = int(memory_max) if memory_max is not None and memory_max.strip() != b"max" else None
+
+            state = (now, cpu[b"usage_usec"], cpu.get(b"nr_periods", 0), cpu.get(b"nr_throttled", 0),
+                     cpu.get(b"throttled_usec", 0), pressure[b"total"] if pressure else 0.0)
+            prev, self._prev = self._prev, state
+
+        if prev is None or state[0] <= prev[0] or any(cur < old for cur, old in zip(state[1:], prev[1:])):
+            # first sample, or the counters were reset (cgroup recreated): no usable interval,
+            # report the kernel's own 10s pressure average
+            cores, throttled_ratio, throttled_ms = 0.0, 0.0, 0.0
+            cpu_pressure = pressure[b"avg10"] if pressure else None
+        else:
+            wall_us = (state[0] - prev[0]) * 1e6
+            cores = (state[1] - prev[1]) / wall_us
+            periods = state[2] - prev[2]
+            throttled_ratio = (state[3] - prev[3]) / periods if periods > 0 else 0.0
+            throttled_ms = (state[4] - prev[4]) / 1000
+            cpu_pressure = min(100.0, (state[5] - prev[5]) / wall_us * 100) if pressure else None
+
+        working_set = max(0, current - inactive_file)
+        return ContainerSnapshot(
+            cpu_cores=round(cores, 3),
+            cpu_percent=round(cores / (quota or self.node_cores) * 100, 2),
+            cpu_quota=quota,
+            throttled_ratio=round(throttled_ratio, 4),
+            throttled_ms=round(throttled_ms, 1),
+            cpu_pressure=round(cpu_pressure, 2) if cpu_pressure is not None else None,
+            memory_mb=round(working_set / 1024 / 1024, 2),
+            memory_percent=round(working_set / (limit or self.node_memory) * 100, 2),
+            memory_limit_mb=round(limit / 1024 / 1024, 2) if limit is not None else None,
+            sampled_at=time.time(),
+        )
+
+    def close(self):
+        for fd in self.fds.values():
+            os.close(fd)
+        self.fds = {}
+
+
+def open_reader(root: str = CGROUP_ROOT, backend: str = METRICS_BACKEND) -> Optional[CgroupReader]:
+    """A primed reader for the container, or None to keep sampling with psutil"""
+    if backend == "psutil":
+        return None
+    try:
+        reader = CgroupReader(root)
+    except OSError:
+        if backend == "cgroup":
+            raise
+        return None
+    reader.sample()
+    return reader
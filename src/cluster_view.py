@@ -0,0 +1,200 @@
+"""Cluster-wide per-pod CPU view.
+
+Every pod's reporter writes its sample as ``cpu:{ns}:{pod}``, mirrors it into the ``cpu-state``
+hash and publishes it on the ``cpu-samples`` channel. Readers pick one of three views:
+
+* ``pubsub`` (default): each worker subscribes once and keeps the map in memory, so requests
+  cost zero Redis commands. Pub/sub is at-most-once; a lost message is repaired by that pod's
+  next sample (every REPORT_INTERVAL seconds) and the map is reseeded from ``cpu-state`` on
+  every (re)subscribe. Resubscribing backs off up to RESUBSCRIBE_MAX_DELAY and waits out an open
+  Redis circuit; pods keep expiring meanwhile. Lag behind a pod is publish latency, typically
+  well under a second. A pod missing for CLUSTER_EXPIRE_INTERVALS report intervals is dropped,
+  so a dead pod lingers for up to that many intervals, like the key TTL does.
+* ``hash``: one HGETALL of ``cpu-state`` per read.
+* ``scan``: SCAN ``cpu:*`` with one MGET per page per read.
+"""
+import os
+import json
+import time
+import asyncio
+import logging
+from typing import Dict, Optional
+
+import redis
+import redis.asyncio as aioredis
+
+from redis_pool import CircuitOpenError, breaker
+from breaker import OPEN
+
+
+CLUSTER_VIEW = os.getenv("CLUSTER_VIEW", "pubsub")
+CLUSTER_SCAN_COUNT = int(os.getenv("CLUSTER_SCAN_COUNT", 500))
+CLUSTER_EXPIRE_INTERVALS = int(os.getenv("CLUSTER_EXPIRE_INTERVALS", 2))
+
+CPU_KEY_PATTERN = "cpu:*"
+# hash of cpu:{ns}:{pod} -> latest sample, mirrors the per-pod keys
+CPU_STATE_KEY = "cpu-state"
+# sorted set of cpu:{ns}:{pod} scored by sample ts, used to prune pods that stopped reporting
+CPU_INDEX_KEY = "cpu-index"
+CPU_CHANNEL = "cpu-samples"
+CPU_TTL = 5
+REPORT_INTERVAL = 3
+# backoff between resubscribe attempts while Redis is unreachable
+RESUBSCRIBE_MIN_DELAY = 1.0
+RESUBSCRIBE_MAX_DELAY = 10.0
+
+logger = logging.getLogger(__name__)
+
+
+def queue_sample(pipe, key: str, payload: Dict, ttl: int = CPU_TTL):
+    """Queue one pod sample as its own key and in the cluster hash, its publish, and the lookup of dead pods.
+
+    Works on sync and async pipelines; the last reply lists the pods for queue_prune().
+    """
+    data = json.dumps(payload)
+    pipe.set(key, data, ex=ttl)
+    pipe.hset(CPU_STATE_KEY, key, data)
+    pipe.publish(CPU_CHANNEL, json.dumps({"key": key, "sample": payload}))
+    pipe.zadd(CPU_INDEX_KEY, {key: payload["ts"]})
+    pipe.zrangebyscore(CPU_INDEX_KEY, "-inf", payload["ts"] - ttl)
+
+
+def queue_prune(pipe, stale, cutoff: float):
+    pipe.hdel(CPU_STATE_KEY, *stale)
+    pipe.zremrangebyscore(CPU_INDEX_KEY, "-inf", cutoff)
+
+
+def write_sample(r: redis.Redis, key: str, payload: Dict, ttl: int = CPU_TTL):
+    """Synchronous write of one sample, pruning dead pods, in one or two pipelines"""
+    pipe = r.pipeline(transaction=False)
+    queue_sample(pipe, key, payload, ttl)
+    *_, stale = pipe.execute()
+    if stale:
+        queue_prune(pipe, stale, payload["ts"] - ttl)
+        pipe.execute()
+
+
+async def read_scan(rc: aioredis.Redis, count: int = CLUSTER_SCAN_COUNT) -> Dict:
+    """SCAN cpu:* page by page with one MGET per page instead of a GET per key"""
+    state = {}
+    cursor = 0
+    while True:
+        cursor, keys = await rc.scan(cursor=cursor, match=CPU_KEY_PATTERN, count=count)
+        if keys:
+            for key, val in zip(keys, await rc.mget(keys)):
+                if val:
+                    state[key] = json.loads(val)
+        if cursor == 0:
+            return state
+
+
+async def read_hash(rc: aioredis.Redis, ttl: int = CPU_TTL) -> Dict:
+    """Whole cluster view in one HGETALL, dropping samples older than the per-key TTL"""
+    cutoff = time.time() - ttl
+    state = {}
+    for key, val in (await rc.hgetall(CPU_STATE_KEY)).items():
+        payload = json.loads(val)
+        if payload["ts"] >= cutoff:
+            state[key] = payload
+    return state
+
+
+class ClusterSubscriber:
+    """Keeps this worker's in-memory cluster CPU map current from the cpu-samples channel"""
+
+    def __init__(self, expire_after: float = CLUSTER_EXPIRE_INTERVALS * REPORT_INTERVAL):
+        self.expire_after = expire_after
+        self.state: Dict[str, Dict] = {}
+        # local receive time per key, so expiry does not depend on other pods' clocks
+        self.seen: Dict[str, float] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.messages = 0
+        self.reconnects = 0
+        # False while resubscribing, the map then only holds what was known before
+        self.connected = False
+
+    def start(self, rc: aioredis.Redis):
+        self._task = asyncio.create_task(self._run(rc))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def snapshot(self) -> Dict:
+        return dict(self.state)
+
+    def _apply(self, key: str, sample: Dict, now: float):
+        self.state[key] = sample
+        self.seen[key] = now
+
+    def _expire(self, now: float):
+        for key in [k for k, t in self.seen.items() if now - t > self.expire_after]:
+            del self.state[key]
+            del self.seen[key]
+
+    async def _run(self, rc: aioredis.Redis):
+        delay = RESUBSCRIBE_MIN_DELAY
+        while True:
+            pubsub = rc.pubsub(ignore_subscribe_messages=True)
+            try:
+                # pub/sub connections bypass the breaker, so respect it here
+                if breaker.state == OPEN:
+                    raise CircuitOpenError("Redis circuit open")
+                await pubsub.subscribe(CPU_CHANNEL)
+                # subscribe first, then seed, so nothing published in between is missed
+                now = time.monotonic()
+                for key, sample in (await read_hash(rc)).items():
+                    self._apply(key, sample, now)
+                self._expire(now)
+                if self.reconnects:
+                    logger.info("Cluster CPU subscription restored")
+                self.connected = True
+                delay = RESUBSCRIBE_MIN_DELAY
+                while True:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    now = time.monotonic()
+                    if message is not None:
+                        data = json.loads(message["data"])
+                        self._apply(data["key"], data["sample"], now)
+                        self.messages += 1
+                    self._expire(now)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if self.connected or not self.reconnects:
+                    logger.warning(f"Cluster CPU subscription lost, resubscribing with backoff: {e}")
+                self.connected = False
+                self.reconnects += 1
+                # nothing refreshes the map meanwhile, so pods still age out of it
+                self._expire(time.monotonic())
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, RESUBSCRIBE_MAX_DELAY)
+            finally:
+                await pubsub.aclose()
+
+    def stats(self) -> Dict:
+        return {"pods": len(self.state), "messages": self.messages, "reconnects": self.reconnects,
+                "connected": self.connected}
+
+
+subscriber = ClusterSubscriber()
+
+
+async def read_cluster_cpu(rc: aioredis.Redis) -> Dict:
+    if CLUSTER_VIEW == "pubsub":
+        return subscriber.snapshot()
+    if CLUSTER_VIEW == "scan":
+        return await read_scan(rc)
+    return await read_hash(rc)
+
+
+async def read_live_cluster_cpu(rc: aioredis.Redis) -> Dict:
+    """read_cluster_cpu, but raises instead of answering from a pub/sub map nothing refreshes"""
+    if CLUSTER_VIEW == "pubsub" and (not subscriber.connected or breaker.state == OPEN):
+        raise CircuitOpenError("cluster CPU subscription not connected")
+    return await read_cluster_cpu(rc)
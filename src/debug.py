@@ -0,0 +1,325 @@
+"""On-demand debugging of a live worker: where its event loop spends time and what blocks it.
+
+Enabled with DEBUG_ENDPOINTS=on and a DEBUG_TOKEN, which every /debug request must send as
+``X-Debug-Token``; otherwise the endpoints answer 404. Three tools:
+
+* SamplingProfiler: for a requested number of seconds a thread reads the event loop thread's
+  stack every DEBUG_PROFILE_INTERVAL (``sys._current_frames``) and counts identical stacks,
+  rendered as collapsed stacks (flamegraph.pl, speedscope) or speedscope JSON. Idle time shows
+  as the selector's ``select``.
+* BlockingDetector: a heartbeat callback on the loop every DEBUG_BLOCKING_THRESHOLD / 2 and a
+  watchdog thread checking it. When a heartbeat is overdue by the threshold, the loop has been
+  busy that long, almost always in one callback. The watchdog takes the loop thread's stack
+  while that callback still runs, and the next heartbeat records how long the block lasted.
+* RouteTimer: for a requested number of seconds each request's coroutine is stepped through a
+  wrapper reading the thread CPU clock around every step, which gives per route the wall time,
+  the CPU time of the request itself (not of requests interleaved with it) and its longest step,
+  the longest the route kept the loop from everything else.
+
+Idle cost: none with DEBUG_ENDPOINTS=off. When on, the heartbeat and the watchdog wake a few
+dozen times a second, and the route middleware checks one attribute per request between windows.
+"""
+import os
+import sys
+import hmac
+import time
+import asyncio
+import logging
+import threading
+from collections import Counter, deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from prom import RouteLabels
+
+
+DEBUG_ENDPOINTS = os.getenv("DEBUG_ENDPOINTS", "off")
+DEBUG_TOKEN = os.getenv("DEBUG_TOKEN", "")
+DEBUG_PROFILE_INTERVAL = float(os.getenv("DEBUG_PROFILE_INTERVAL", 0.005))
+DEBUG_MAX_SECONDS = float(os.getenv("DEBUG_MAX_SECONDS", 60))
+DEBUG_BLOCKING_THRESHOLD = float(os.getenv("DEBUG_BLOCKING_THRESHOLD", 0.1))
+# blocking events kept, newest last
+BLOCKING_EVENTS = 50
+MAX_DEPTH = 128
+
+# without a token there is nothing to check requests against, so the endpoints stay off
+ENABLED = DEBUG_ENDPOINTS == "on" and bool(DEBUG_TOKEN)
+
+logger = logging.getLogger(__name__)
+
+
+def authorized(token: Optional[str]) -> bool:
+    return token is not None and hmac.compare_digest(token.encode(), DEBUG_TOKEN.encode())
+
+
+_labels: Dict[object, str] = {}
+
+
+def label(code) -> str:
+    """``function (dir/file.py:line)`` of a code object, cached"""
+    name = _labels.get(code)
+    if name is None:
+        path = os.sep.join(code.co_filename.split(os.sep)[-2:])
+        name = _labels[code] = f"{code.co_name} ({path}:{code.co_firstlineno})"
+    return name
+
+
+def stack_of(frame) -> Tuple:
+    """Code objects of a frame and its callers, outermost first"""
+    codes = []
+    while frame is not None and len(codes) < MAX_DEPTH:
+        codes.append(frame.f_code)
+        frame = frame.f_back
+    codes.reverse()
+    return tuple(codes)
+
+
+class Profile:
+    def __init__(self, stacks: Counter, samples: int, duration: float):
+        self.stacks = stacks
+        self.samples = samples
+        self.duration = duration
+
+    def collapsed(self) -> str:
+        """One ``frame;frame;frame count`` line per distinct stack, heaviest first"""
+        return "".join(f"{';'.join(label(c) for c in stack)} {count}\n"
+                       for stack, count in self.stacks.most_common())
+
+    def speedscope(self) -> Dict:
+        """speedscope's sampled profile format, one weighted sample per distinct stack"""
+        frames: List[Dict] = []
+        index: Dict[object, int] = {}
+        samples, weights = [], []
+        weight = self.duration / self.samples if self.samples else 0.0
+        for stack, count in self.stacks.most_common():
+            ids = []
+            for code in stack:
+                if code not in index:
+                    index[code] = len(frames)
+                    frames.append({"name": code.co_name, "file": code.co_filename, "line": code.co_firstlineno})
+                ids.append(index[code])
+            samples.append(ids)
+            weights.append(count * weight)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": f"event loop of pid {os.getpid()}",
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": self.duration,
+                "samples": samples,
+                "weights": weights,
+            }],
+            "name": f"health-service pid {os.getpid()}",
+            "exporter": "health-service",
+        }
+
+
+class SamplingProfiler:
+    """Samples the event loop thread's stack from a helper thread; one profile at a time"""
+
+    def __init__(self, interval: float = DEBUG_PROFILE_INTERVAL):
+        self.interval = interval
+        self.running = False
+
+    def _sample(self, thread_id: int, seconds: float, interval: float) -> Profile:
+        stacks: Counter = Counter()
+        samples = 0
+        start = time.perf_counter()
+        deadline = start + seconds
+        while time.perf_counter() < deadline:
+            frame = sys._current_frames().get(thread_id)
+            if frame is not None:
+                stacks[stack_of(frame)] += 1
+                samples += 1
+            del frame
+            time.sleep(interval)
+        return Profile(stacks, samples, time.perf_counter() - start)
+
+    async def profile(self, seconds: float, interval: Optional[float] = None) -> Profile:
+        """Profile the calling event loop for ``seconds``"""
+        self.running = True
+        try:
+            return await asyncio.to_thread(self._sample, threading.get_ident(), seconds, interval or self.interval)
+        finally:
+            self.running = False
+
+
+class BlockingDetector:
+    def __init__(self, threshold: float = DEBUG_BLOCKING_THRESHOLD, keep: int = BLOCKING_EVENTS):
+        self.threshold = threshold
+        self.period = threshold / 2
+        self.events: Deque[Dict] = deque(maxlen=keep)
+        self.blocks = 0
+        self.blocked_seconds = 0.0
+        self._beat = 0.0
+        # (beat it was taken after, wall time, stack) of a block still in progress
+        self._pending: Optional[Tuple[float, float, Tuple]] = None
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._handle: Optional[asyncio.TimerHandle] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop.clear()
+        self._handle = self._loop.call_later(self.period, self._heartbeat)
+        self._thread = threading.Thread(target=self._watch, daemon=True, name="loop-watchdog")
+        self._thread.start()
+
+    async def stop(self):
+        if self._thread is None:
+            return
+        self._handle.cancel()
+        self._stop.set()
+        await asyncio.to_thread(self._thread.join, 1)
+        self._thread = None
+
+    def _heartbeat(self):
+        now = time.monotonic()
+        with self._lock:
+            # how much later than scheduled this callback ran: the loop was busy that long
+            blocked = now - self._beat - self.period
+            pending, self._pending = self._pending, None
+            self._beat = now
+        if blocked >= self.threshold:
+            self.blocks += 1
+            self.blocked_seconds += blocked
+            if pending is not None:
+                self.events.append({
+                    "at": pending[1],
+                    "blocked_ms": round(blocked * 1000, 1),
+                    "stack": [label(code) for code in pending[2]],
+                })
+        self._handle = self._loop.call_later(self.period, self._heartbeat)
+
+    def _watch(self):
+        while not self._stop.wait(self.period / 2):
+            with self._lock:
+                beat = self._beat
+                if self._pending is not None and self._pending[0] == beat:
+                    continue
+                if time.monotonic() - beat - self.period < self.threshold:
+                    continue
+                frame = sys._current_frames().get(self._loop_thread)
+                self._pending = (beat, time.time(), stack_of(frame))
+                del frame
+
+    def stats(self) -> Dict:
+        return {
+            "running": self._thread is not None,
+            "threshold_ms": self.threshold * 1000,
+            "blocks": self.blocks,
+            "blocked_s": round(self.blocked_seconds, 3),
+            "events": list(self.events),
+        }
+
+
+class _CpuTimed:
+    """Awaitable stepping a coroutine and reading the thread CPU clock around each step"""
+
+    __slots__ = ("coro", "cpu", "longest")
+
+    def __init__(self, coro):
+        self.coro = coro
+        self.cpu = 0.0
+        self.longest = 0.0
+
+    def _add(self, seconds: float):
+        self.cpu += seconds
+        if seconds > self.longest:
+            self.longest = seconds
+
+    def __await__(self):
+        message, error = None, None
+        while True:
+            start = time.thread_time()
+            try:
+                if error is None:
+                    signal = self.coro.send(message)
+                else:
+                    signal = self.coro.throw(error)
+            except StopIteration as e:
+                return e.value
+            finally:
+                self._add(time.thread_time() - start)
+            try:
+                message, error = (yield signal), None
+            except GeneratorExit:
+                self.coro.close()
+                raise
+            except BaseException as e:
+                message, error = None, e
+
+
+class RouteTimer:
+    """Per-route wall and CPU time collected over one window at a time"""
+
+    def __init__(self):
+        self.active = False
+        self.routes: Dict[str, Dict] = {}
+
+    def record(self, route: str, wall: float, cpu: float, longest: float):
+        r = self.routes.get(route)
+        if r is None:
+            r = self.routes[route] = {"wall": [], "cpu": 0.0, "longest": 0.0}
+        r["wall"].append(wall)
+        r["cpu"] += cpu
+        if longest > r["longest"]:
+            r["longest"] = longest
+
+    async def collect(self, seconds: float) -> Dict:
+        self.routes = {}
+        self.active = True
+        start = time.perf_counter()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            self.active = False
+        elapsed = time.perf_counter() - start
+        report = {}
+        for route, r in sorted(self.routes.items()):
+            walls = sorted(r["wall"])
+            n = len(walls)
+            wall = sum(walls)
+            report[route] = {
+                "requests": n,
+                "wall_ms_mean": round(wall / n * 1000, 3),
+                "wall_ms_p99": round(walls[min(n - 1, int(n * 0.99))] * 1000, 3),
+                "cpu_ms_mean": round(r["cpu"] / n * 1000, 3),
+                "cpu_share": round(r["cpu"] / wall, 3) if wall else 0.0,
+                "longest_step_ms": round(r["longest"] * 1000, 3),
+                # of the window's wall time, how much this route had the loop
+                "loop_share": round(r["cpu"] / elapsed, 3),
+            }
+        return {"seconds": round(elapsed, 2), "routes": report}
+
+
+class RouteTimingMiddleware:
+    """ASGI middleware feeding RouteTimer while a window is open; a pass-through otherwise"""
+
+    def __init__(self, app, timer: Optional[RouteTimer] = None):
+        self.app = app
+        self.timer = timer or route_timer
+        self._route = RouteLabels()
+
+    async def __call__(self, scope, receive, send):
+        if not self.timer.active or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        timed = _CpuTimed(self.app(scope, receive, send))
+        start = time.perf_counter()
+        try:
+            await timed
+        finally:
+            self.timer.record(self._route(scope), time.perf_counter() - start, timed.cpu, timed.longest)
+
+
+profiler = SamplingProfiler()
+detector = BlockingDetector()
+route_timer = RouteTimer()
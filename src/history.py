@@ -0,0 +1,121 @@
+"""Per-pod CPU/memory history in fixed-size binary ring buffers.
+
+Each resolution in HISTORY_RESOLUTIONS (``seconds=slots``) is one Redis string per reporter key,
+``hist:{resolution}:{cpu key}``, holding ``slots`` packed records of bucket start, cpu avg/max,
+memory avg/max and sample count (SLOT, 22 bytes). Bucket ``t`` lives in slot
+``(t // resolution) % slots``, so:
+
+* writes are one SETRANGE per resolution, whatever the history length. The reporter keeps the
+  open bucket of each resolution in memory and rewrites its slot on every sample, so the 10s and
+  1m rollups are maintained incrementally, never recomputed from raw samples;
+* memory per pod is fixed, slots * 22 bytes per resolution (about 100KB with the defaults:
+  15 minutes at 1s, 6 hours at 10s, 24 hours at 1m), and keys expire once a pod stops writing;
+* a range read is one GETRANGE per contiguous run of slots (two at most, where the ring
+  wraps), so it costs O(points returned). Slots still holding an older lap of the ring are
+  recognised by their bucket start and skipped.
+"""
+import os
+import struct
+from typing import Dict, List, Optional, Tuple
+
+import redis.asyncio as aioredis
+from redis.client import NEVER_DECODE
+
+
+HISTORY_RESOLUTIONS = os.getenv("HISTORY_RESOLUTIONS", "1=900,10=2160,60=1440")
+# a range query without an explicit resolution gets the finest one that stays under this
+HISTORY_MAX_POINTS = int(os.getenv("HISTORY_MAX_POINTS", 1000))
+
+# bucket start (epoch s), cpu avg, cpu max, memory MB avg, memory MB max, samples
+SLOT = struct.Struct("<IffffH")
+
+
+def parse_resolutions(spec: str) -> Dict[int, int]:
+    resolutions = {}
+    for item in spec.split(","):
+        res, _, slots = item.strip().partition("=")
+        if res and slots:
+            resolutions[int(res)] = int(slots)
+    return dict(sorted(resolutions.items()))
+
+
+RESOLUTIONS = parse_resolutions(HISTORY_RESOLUTIONS)
+
+
+def history_key(cpu_key: str, resolution: int) -> str:
+    return f"hist:{resolution}:{cpu_key}"
+
+
+class RollupWriter:
+    """Folds samples into the open bucket of every resolution; owned by one reporter"""
+
+    def __init__(self, resolutions: Dict[int, int] = RESOLUTIONS):
+        self.resolutions = resolutions
+        # resolution -> [bucket start, count, cpu sum, cpu max, mem sum, mem max]
+        self.open: Dict[int, list] = {}
+
+    def add(self, ts: float, cpu: float, memory_mb: float) -> List[Tuple[int, int, bytes]]:
+        """(resolution, byte offset, slot bytes) to write for this sample"""
+        writes = []
+        for res, slots in self.resolutions.items():
+            bucket = int(ts // res) * res
+            b = self.open.get(res)
+            if b is None or b[0] != bucket:
+                b = self.open[res] = [bucket, 0, 0.0, 0.0, 0.0, 0.0]
+            b[1] += 1
+            b[2] += cpu
+            b[3] = max(b[3], cpu)
+            b[4] += memory_mb
+            b[5] = max(b[5], memory_mb)
+            slot = SLOT.pack(bucket, b[2] / b[1], b[3], b[4] / b[1], b[5], min(b[1], 0xFFFF))
+            writes.append((res, (bucket // res) % slots * SLOT.size, slot))
+        return writes
+
+
+def queue_history(pipe, cpu_key: str, writes: List[Tuple[int, int, bytes]], resolutions: Dict[int, int] = RESOLUTIONS):
+    for res, offset, slot in writes:
+        key = history_key(cpu_key, res)
+        pipe.setrange(key, offset, slot)
+        pipe.expire(key, res * resolutions[res])
+
+
+def pick_resolution(start: float, end: float, resolutions: Dict[int, int] = RESOLUTIONS,
+                    max_points: int = HISTORY_MAX_POINTS) -> int:
+    """Finest resolution that still covers ``start`` and returns at most max_points"""
+    for res, slots in resolutions.items():
+        if end - start <= res * slots and (end - start) / res <= max_points:
+            return res
+    return max(resolutions)
+
+
+async def read_range(rc: aioredis.Redis, cpu_key: str, start: float, end: float, resolution: Optional[int] = None,
+                     resolutions: Dict[int, int] = RESOLUTIONS) -> Dict:
+    """Buckets of cpu_key between start and end as [ts, cpu_avg, cpu_max, mem_avg, mem_max] rows"""
+    res = resolution or pick_resolution(start, end, resolutions)
+    slots = resolutions[res]
+    last = int(end // res)
+    # older buckets have been overwritten by the ring
+    first = max(int(start // res), last - slots + 1)
+    count = last - first + 1
+    if count <= 0:
+        return {"resolution": res, "points": []}
+
+    i = first % slots
+    runs = [(i, count)] if i + count <= slots else [(i, slots - i), (0, count - (slots - i))]
+    key = history_key(cpu_key, res)
+    pipe = rc.pipeline(transaction=False)
+    for offset, n in runs:
+        pipe.execute_command("GETRANGE", key, offset * SLOT.size, (offset + n) * SLOT.size - 1, **{NEVER_DECODE: True})
+    blobs = await pipe.execute()
+
+    points = []
+    bucket = first * res
+    for (offset, n), blob in zip(runs, blobs):
+        for j in range(n):
+            raw = blob[j * SLOT.size:(j + 1) * SLOT.size]
+            if len(raw) == SLOT.size:
+                ts, cpu_avg, cpu_max, mem_avg, mem_max, _ = SLOT.unpack(raw)
+                if ts == bucket:
+                    points.append([ts, round(cpu_avg, 2), round(cpu_max, 2), round(mem_avg, 2), round(mem_max, 2)])
+            bucket += res
+    return {"resolution": res, "points": points}
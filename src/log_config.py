@@ -0,0 +1,189 @@
+"""Logging that stays off the request path.
+
+Handlers on the event loop only run the sampling filter and a non-blocking put onto a bounded
+queue; a QueueListener thread formats records (lazily, %-style args are only rendered there)
+and writes them to stdout. Records that lose the sampling draw or find the queue full are
+counted rather than written, so /log-stats shows what sampling hides.
+
+Sampling is per route, taken from the ``route`` attribute callers pass via ``extra``, or for
+uvicorn's access log from the request path in the record's args (counted separately, under
+``uvicorn.access <path>``):
+
+    LOG_SAMPLE_RATES="/health=100,/metrics=100"    keep 1 in N records
+    LOG_RATE_LIMITS="/get-all-redis-keys=1"         keep at most N records per second
+
+Warnings and errors are never sampled.
+"""
+import os
+import sys
+import time
+import queue
+import atexit
+import logging
+import logging.handlers
+from typing import Dict, Optional
+
+import orjson
+
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# "text" keeps the old human-readable lines, "json" emits one object per line
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "/health=100,/metrics=100,/livez=100,/readyz=100")
+LOG_RATE_LIMITS = os.getenv("LOG_RATE_LIMITS", "/get-all-redis-keys=1")
+
+ACCESS_LOGGER = "uvicorn.access"
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+
+def parse_rules(spec: str) -> Dict[str, float]:
+    rules = {}
+    for item in spec.split(","):
+        route, _, value = item.strip().partition("=")
+        if route and value:
+            rules[route] = float(value)
+    return rules
+
+
+class SamplingFilter(logging.Filter):
+    """1-in-N sampling and per-second caps for INFO and below, keyed on record.route"""
+
+    def __init__(self, sample_rates: Dict[str, float], rate_limits: Dict[str, float]):
+        super().__init__()
+        self.sample_rates = sample_rates
+        self.rate_limits = rate_limits
+        self._seen: Dict[str, int] = {}
+        # route -> (window start second, records let through in it)
+        self._windows: Dict[str, tuple] = {}
+        self.sampled_out: Dict[str, int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.INFO:
+            return True
+        route = getattr(record, "route", None)
+        key = route
+        args = record.args
+        if route is None and record.name == ACCESS_LOGGER and isinstance(args, tuple) and len(args) > 2:
+            # uvicorn.access args: (client, method, path with query, http version, status)
+            route = str(args[2]).partition("?")[0]
+            key = f"{ACCESS_LOGGER} {route}"
+        if route is None:
+            return True
+
+        every = self.sample_rates.get(route)
+        if every and every > 1:
+            seen = self._seen.get(key, 0)
+            self._seen[key] = seen + 1
+            if seen % int(every):
+                return self._reject(key)
+
+        limit = self.rate_limits.get(route)
+        if limit is not None:
+            second = int(time.monotonic())
+            start, count = self._windows.get(key, (second, 0))
+            if start != second:
+                start, count = second, 0
+            if count >= limit:
+                self._windows[key] = (start, count)
+                return self._reject(key)
+            self._windows[key] = (start, count + 1)
+        return True
+
+    def _reject(self, key: str) -> bool:
+        self.sampled_out[key] = self.sampled_out.get(key, 0) + 1
+        return False
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks or formats on the caller's thread"""
+
+    def __init__(self, q: queue.Queue):
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # the stock prepare() renders the message here; leave that to the listener thread
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        route = getattr(record, "route", None)
+        if route is not None:
+            payload["route"] = route
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        return orjson.dumps(payload, default=str).decode()
+
+
+queue_handler: Optional[DroppingQueueHandler] = None
+sampling: Optional[SamplingFilter] = None
+listener: Optional[logging.handlers.QueueListener] = None
+
+
+def setup_logging():
+    """Route the root logger through the sampled, bounded queue and start the writer thread"""
+    global queue_handler, sampling, listener
+    if listener is not None:
+        return
+
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT))
+
+    sampling = SamplingFilter(parse_rules(LOG_SAMPLE_RATES), parse_rules(LOG_RATE_LIMITS))
+    queue_handler = DroppingQueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+    queue_handler.addFilter(sampling)
+
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(LOG_LEVEL)
+
+    listener = logging.handlers.QueueListener(queue_handler.queue, stream, respect_handler_level=True)
+    listener.start()
+    atexit.register(stop_logging)
+
+
+def _restart_after_fork():
+    """The writer thread does not survive fork(); give a forked worker its own queue and thread"""
+    global listener
+    if listener is None:
+        return
+    queue_handler.queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    listener = logging.handlers.QueueListener(queue_handler.queue, *listener.handlers, respect_handler_level=True)
+    listener.start()
+
+
+os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+def stop_logging():
+    """Flush what is queued and stop the writer thread"""
+    global listener
+    if listener is not None:
+        listener.stop()
+        listener = None
+
+
+def log_stats() -> Dict:
+    if queue_handler is None:
+        return {}
+    return {
+        "queued": queue_handler.queue.qsize(),
+        "queue_size": LOG_QUEUE_SIZE,
+        "dropped_queue_full": queue_handler.dropped,
+        "sampled_out": dict(sampling.sampled_out),
+    }
@@ -1,35 +1,59 @@
 import os
+import sys
+
+if __name__ == "__main__":
+    # hand over to the launcher before the app is imported into __main__, see serve.py
+    import serve
+    sys.exit(serve.main())
+
+import time
+from startup import timer as startup_timer
+
+_import_started = time.perf_counter()
+
 import logging
 from datetime import datetime
-from typing import Dict
-from fastapi.responses import HTMLResponse
+from typing import Dict, List, Optional, Tuple
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
 import psutil
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request
 from pydantic import BaseModel
-import uvicorn
-import redis
-import time
+from prometheus_client import CONTENT_TYPE_LATEST
+from redis.exceptions import RedisError
 import json
-import threading
+import orjson
+import asyncio
+import redis_pool
+from cache import LocalCache, StampedeCache
+from batcher import batcher
+import cluster_view
+from stream import Broadcaster
+from reporter import reporter
+from sampler import sampler
+from aggregator import METRICS_SCOPE, PodAggregator
+import prom
+import assets
+import serialize
+import log_config
+import readiness
+import cgroup
+import admission
+import capture
+import debug
+import scaling
+import history
 
 
 POD_NAME = os.getenv("POD_NAME")
 POD_NAMESPACE = os.getenv("POD_NAMESPACE", "default")
 NODE_NAME = os.getenv("NODE_NAME")
+# "sampler" serves /health and /metrics from the in-process snapshot,
+# "cache" keeps the old Redis read-through (health-cache / metrics-cache keys)
+METRICS_SOURCE = os.getenv("METRICS_SOURCE", "sampler")
 
 print("Node from env:", NODE_NAME)
 
-REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
-REDIS_PORT = os.getenv("REDIS_PORT", "6379")
-r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=0, decode_responses=True)
-
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler()  
-    ]
-)
+log_config.setup_logging()
 
 logger = logging.getLogger(__name__)
 
@@ -38,8 +62,27 @@ app = FastAPI(
     description="HTTP service to monitor process resource usage",
     version="2.0.0"
 )
+# innermost, so it times only requests that were admitted
+app.add_middleware(debug.RouteTimingMiddleware)
+# added before Prometheus so it runs inside the Prometheus middleware, which then counts the 503s it sheds
+app.add_middleware(admission.AdmissionMiddleware)
+app.add_middleware(prom.PrometheusMiddleware)
+# outermost, so captured latency is what the client saw, shed requests included
+app.add_middleware(capture.CaptureMiddleware)
 
 process = psutil.Process()
+# container cpu/memory for METRICS_SOURCE=cache, opened per worker at startup
+container: Optional[cgroup.CgroupReader] = None
+metrics_cache = StampedeCache(writer=batcher)
+local_cache = LocalCache()
+pod_aggregator = PodAggregator(sampler, writer=batcher)
+static_assets: Dict[str, assets.Asset] = {}
+cluster_stream = Broadcaster(lambda: cluster_view.read_cluster_cpu(redis_pool.get_client()))
+warmup_task: Optional[asyncio.Task] = None
+# last cluster CPU view read while Redis was healthy, served when it is not
+last_cluster_cpu: Dict[str, Dict] = {}
+
+ALIVE = b'{"alive":true}'
 
 class HealthResponse(BaseModel):
     status: str
@@ -47,6 +90,18 @@ class HealthResponse(BaseModel):
     cpu_percent: float
     memory_mb: float
     memory_percent: float
+    sample_age_ms: float
+    degraded: bool = False
+
+
+class WorkerMetrics(BaseModel):
+    worker: int
+    cpu_percent: float
+    memory_mb: float
+    memory_percent: float
+    num_threads: int
+    open_files: int
+    connections: int
 
 
 class ProcessMetrics(BaseModel):
@@ -57,6 +112,14 @@ class ProcessMetrics(BaseModel):
     open_files: int
     connections: int
     timestamp: str
+    sample_age_ms: float
+    source: str = "process"
+    cpu_quota: Optional[float] = None
+    throttled_ratio: Optional[float] = None
+    cpu_pressure: Optional[float] = None
+    scope: str = "worker"
+    workers: Optional[List[WorkerMetrics]] = None
+    degraded: bool = False
 
 
 @app.get("/", response_model=dict)
@@ -67,67 +130,97 @@ async def root():
         "version": "2.0.0",
         "endpoints": {
             "/health": "Health check with current resource usage",
-            "/metrics": "Detailed process resource metrics"
+            "/metrics": "Detailed process resource metrics",
+            "/redis-pool": "Connection pool stats for this worker",
+            "/cache-stats": "Cache hit/miss/refresh counters for this worker",
+            "/stream/cluster-cpu": "Server-sent events of per-pod CPU",
+            "/history": "Downsampled CPU/memory history of a pod",
+            "/livez": "Liveness, answered without any I/O",
+            "/readyz": "Readiness from a cached Redis and event-loop check",
+            "/startup": "Startup time breakdown for this worker",
+            "/scaling": "Smoothed desired replicas for the KEDA metrics-api trigger",
+            "/capture": "Request capture counters and files for this worker",
+            "/prometheus": "Prometheus exposition of app metrics"
         }
     }
 
 def get_process_metrics() -> Dict:
-    """Get current process resource usage"""
-    cpu_percent = process.cpu_percent(interval=0)
-    memory_info = process.memory_info()
-    memory_mb = round(memory_info.rss / 1024 / 1024, 2)
-    memory_percent = round(process.memory_percent(), 2)
+    """Get current container (or, without a cgroup, process) resource usage"""
+    if container is not None:
+        usage = container.sample().as_fields()
+    else:
+        usage = {
+            "cpu_percent": round(process.cpu_percent(interval=0), 2),
+            "memory_mb": round(process.memory_info().rss / 1024 / 1024, 2),
+            "memory_percent": round(process.memory_percent(), 2),
+        }
     num_threads = process.num_threads()
     open_files = len(process.open_files())
     connections = len(process.connections())
 
     return {
-        "cpu_percent": round(cpu_percent, 2),
-        "memory_mb": memory_mb,
-        "memory_percent": memory_percent,
+        **usage,
         "num_threads": num_threads,
         "open_files": open_files,
-        "connections": connections
+        "connections": connections,
+        "sampled_at": time.time()
     }
 
+async def load_metrics(kind: str) -> Tuple[Dict, bool]:
+    """Metrics payload for /health or /metrics and whether it is a local fallback for a Redis-backed source"""
+    if METRICS_SOURCE == "sampler":
+        if METRICS_SCOPE == "pod":
+            return pod_aggregator.latest(), pod_aggregator.failing
+        return sampler.latest().as_dict(), False
+
+    ns = os.getenv("POD_NAMESPACE", "default")
+    pod = os.getenv("POD_NAME", "unknown")
+    key = f"{kind}-cache:{ns}:{pod}"
+    try:
+        return await local_cache.get_or_load(key, lambda: metrics_cache.get(
+            redis_pool.get_client(), key, lambda: asyncio.to_thread(get_process_metrics)
+        )), False
+    except RedisError:
+        # the open circuit fails this in microseconds; the local sample is shared for LOCAL_CACHE_TTL
+        return await local_cache.get_or_load(f"{key}:local", lambda: asyncio.to_thread(get_process_metrics)), True
+
+def sample_age_ms(metrics: Dict) -> float:
+    return round((time.time() - metrics.get("sampled_at", time.time())) * 1000, 1)
+
 @app.get("/health", response_model=HealthResponse)
 async def health_check():
     """Health check endpoint with current resource usage"""
-    ns = os.getenv("POD_NAMESPACE", "default")
-    pod = os.getenv("POD_NAME", "unknown")
-    key = f"health-cache:{ns}:{pod}"
-    health = r.get(key)
-    if health:
-        health = json.loads(health)
-    else:
-        health = get_process_metrics()
-        r.set(key, json.dumps(health), ex=5)
+    health, degraded = await load_metrics("health")
+    if degraded:
+        prom.DEGRADED_RESPONSES.labels("/health").inc()
+    logger.info("Health check: CPU=%s%%, Memory=%sMB", health["cpu_percent"], health["memory_mb"],
+                extra={"route": "/health"})
+    if serialize.RESPONSE_MODE == "fast":
+        return serialize.health_response(health, sample_age_ms(health), degraded)
 
     health_status = {
         "status": "ok",
         "timestamp": datetime.utcnow().isoformat(),
         "cpu_percent": health["cpu_percent"],
         "memory_mb": health["memory_mb"],
-        "memory_percent": health["memory_percent"]
+        "memory_percent": health["memory_percent"],
+        "sample_age_ms": sample_age_ms(health),
+        "degraded": degraded
     }
-
-    logger.info(f"Health check: CPU={health['cpu_percent']}%, Memory={health['memory_mb']}MB")
     return health_status
 
 
 @app.get("/metrics", response_model=ProcessMetrics)
 async def get_metrics():
     """Get detailed process resource metrics"""
-    ns = os.getenv("POD_NAMESPACE", "default")
-    pod = os.getenv("POD_NAME", "unknown")
-    key = f"metrics-cache:{ns}:{pod}"
-    metrics = r.get(key)
-    if metrics:
-        metrics = json.loads(metrics)
-    else:
-        metrics = get_process_metrics()
-        r.set(key, json.dumps(metrics), ex=5)
-
+    metrics, degraded = await load_metrics("metrics")
+    if degraded:
+        prom.DEGRADED_RESPONSES.labels("/metrics").inc()
+    logger.info("Metrics: CPU=%s%%, Memory=%sMB (%s%%), Threads=%s", metrics["cpu_percent"],
+                metrics["memory_mb"], metrics["memory_percent"], metrics["num_threads"],
+                extra={"route": "/metrics"})
+    if serialize.RESPONSE_MODE == "fast":
+        return serialize.metrics_response(metrics, sample_age_ms(metrics), degraded)
 
     response = ProcessMetrics(
         cpu_percent=metrics["cpu_percent"],
@@ -136,669 +229,30 @@ async def get_metrics():
         num_threads=metrics["num_threads"],
         open_files=metrics["open_files"],
         connections=metrics["connections"],
-        timestamp=datetime.utcnow().isoformat()
+        timestamp=datetime.utcnow().isoformat(),
+        sample_age_ms=sample_age_ms(metrics),
+        source=metrics.get("source", "process"),
+        cpu_quota=metrics.get("cpu_quota"),
+        throttled_ratio=metrics.get("throttled_ratio"),
+        cpu_pressure=metrics.get("cpu_pressure"),
+        scope="pod" if "workers" in metrics else "worker",
+        workers=metrics.get("workers"),
+        degraded=degraded
     )
-
-    logger.info(f"Metrics: CPU={metrics['cpu_percent']}%, "
-               f"Memory={metrics['memory_mb']}MB ({metrics['memory_percent']}%), "
-               f"Threads={metrics['num_threads']}")
-
     return response
 
 @app.get("/page", response_class=HTMLResponse)
-async def return_page():
+async def return_page(request: Request):
     """this just returns a webpage to mess around with"""
+    return assets.respond(static_assets["/page"], request)
 
-    logger.info(f"Someone requested a webpage time: {datetime.utcnow().isoformat()}")
-    html_content = """
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>Health Service Monitor</title>
-        <style>
-            :root {
-                --bg-main: #020617;
-                --bg-card: #020617;
-                --bg-elevated: #020617;
-                --border-subtle: #1f2933;
-                --text-main: #e5e7eb;
-                --text-muted: #9ca3af;
-                --accent: #38bdf8;
-                --accent-soft: #0f172a;
-                --danger: #f97373;
-            }
-
-            * {
-                margin: 0;
-                padding: 0;
-                box-sizing: border-box;
-            }
-
-            body {
-                font-family: system-ui, -apple-system, BlinkMacSystemFont, "Segoe UI",
-                             sans-serif;
-                background: #1e293b;
-                color: var(--text-main);
-                min-height: 100vh;
-                display: flex;
-                align-items: center;
-                justify-content: center;
-                padding: 24px;
-            }
-
-            .container {
-                max-width: 960px;
-                width: 100%;
-            }
-
-            .card {
-                background: #0f172a;
-                border-radius: 8px;
-                padding: 28px 28px 22px 28px;
-                border: 1px solid #334155;
-            }
-
-            h1 {
-                font-size: 1.35rem;
-                margin-bottom: 6px;
-                letter-spacing: 0.02em;
-                display: flex;
-                align-items: center;
-                gap: 6px;
-            }
-
-            h1 span {
-                font-size: 1rem;
-                font-weight: 500;
-                color: var(--accent);
-            }
-
-            .subtitle {
-                font-size: 0.85rem;
-                color: var(--text-muted);
-                margin-bottom: 20px;
-            }
-
-            .top-row {
-                display: flex;
-                justify-content: space-between;
-                align-items: center;
-                gap: 12px;
-                margin-bottom: 16px;
-            }
-
-            .tag {
-                font-size: 0.7rem;
-                text-transform: uppercase;
-                letter-spacing: 0.08em;
-                color: var(--text-muted);
-                padding: 4px 9px;
-                border-radius: 4px;
-                border: 1px solid #475569;
-                background: #1e293b;
-            }
-
-            .stats {
-                display: flex;
-                justify-content: flex-start;
-                gap: 18px;
-                margin-bottom: 20px;
-            }
-
-            .stat {
-                background: #1e293b;
-                border-radius: 6px;
-                padding: 10px 12px;
-                border: 1px solid #475569;
-                min-width: 96px;
-            }
-
-            .stat-label {
-                font-size: 0.7rem;
-                color: var(--text-muted);
-                margin-bottom: 4px;
-                text-transform: uppercase;
-                letter-spacing: 0.06em;
-            }
-
-            .stat-value {
-                font-size: 0.95rem;
-                font-weight: 600;
-                color: var(--accent);
-            }
-
-            .endpoints {
-                display: grid;
-                grid-template-columns: repeat(auto-fit, minmax(210px, 1fr));
-                gap: 12px;
-                margin-top: 14px;
-            }
-
-            .endpoint-card {
-                background: #1e293b;
-                border-radius: 6px;
-                padding: 14px 14px 12px 14px;
-                text-decoration: none;
-                color: var(--text-main);
-                border: 1px solid #475569;
-                display: flex;
-                flex-direction: column;
-                gap: 4px;
-            }
-
-            .endpoint-card:hover {
-                border-color: #64748b;
-                background-color: #334155;
-            }
-
-            .endpoint-title {
-                font-size: 0.9rem;
-                font-weight: 500;
-                display: flex;
-                align-items: center;
-                gap: 6px;
-            }
-
-            .endpoint-icon {
-                font-size: 0.9rem;
-                opacity: 0.9;
-            }
-
-            .endpoint-desc {
-                font-size: 0.8rem;
-                color: var(--text-muted);
-            }
-
-            .endpoint-card.button-like {
-                cursor: pointer;
-            }
-
-            .endpoint-card.button-like:disabled {
-                opacity: 0.7;
-                cursor: wait;
-            }
-
-            .footer {
-                text-align: right;
-                margin-top: 16px;
-                color: var(--text-muted);
-                font-size: 0.7rem;
-                border-top: 1px solid #334155;
-                padding-top: 8px;
-            }
-
-            .footer span {
-                color: var(--accent);
-            }
-
-            .hidden {
-                display: none;
-            }
-
-            .section-header {
-                display: flex;
-                justify-content: space-between;
-                align-items: center;
-                margin-top: 10px;
-                margin-bottom: 8px;
-                gap: 10px;
-            }
-
-            .section-header h2 {
-                font-size: 0.95rem;
-                font-weight: 500;
-            }
-
-            .section-status {
-                font-size: 0.75rem;
-                color: var(--text-muted);
-            }
-
-            .section-header-right {
-                display: flex;
-                align-items: center;
-                gap: 8px;
-            }
-
-            .grid-panel {
-                display: grid;
-                grid-template-columns: repeat(auto-fit, minmax(200px, 1fr));
-                gap: 10px;
-                margin-top: 8px;
-            }
-
-            .data-card {
-                background: #1e293b;
-                border-radius: 6px;
-                padding: 12px 12px 10px 12px;
-                border: 1px solid #475569;
-                font-size: 0.8rem;
-            }
-
-            .data-title {
-                font-size: 0.8rem;
-                color: var(--text-muted);
-                margin-bottom: 3px;
-                text-transform: uppercase;
-                letter-spacing: 0.06em;
-            }
-
-            .data-value {
-                font-size: 0.95rem;
-                font-weight: 600;
-            }
-
-            .data-value.accent {
-                color: var(--accent);
-            }
-
-            .data-value.bad {
-                color: var(--danger);
-            }
-
-            .small-text {
-                font-size: 0.72rem;
-                color: var(--text-muted);
-            }
-
-            .btn-refresh {
-                padding: 6px 11px;
-                border-radius: 4px;
-                border: 1px solid #475569;
-                background: #1e293b;
-                color: var(--text-main);
-                font-size: 0.75rem;
-                cursor: pointer;
-            }
-
-            .btn-refresh:hover {
-                background: #334155;
-                border-color: #64748b;
-            }
-
-            .btn-refresh:disabled {
-                opacity: 0.6;
-                cursor: wait;
-            }
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <div class="card">
-                <div class="top-row">
-                    <div>
-                        <h1>Health Service Monitor <span>· k8s pod view</span></h1>
-                        <p class="subtitle">Realtime process & per-pod CPU from Redis, exposed via FastAPI.</p>
-                    </div>
-                    <div class="tag">Internal · Diagnostics</div>
-                </div>
-
-                <!-- Load Testing Instructions -->
-                <div style="background: #1e293b; border: 1px solid #475569; border-radius: 6px; padding: 14px 16px; margin-bottom: 18px;">
-                    <div style="font-size: 0.85rem; font-weight: 500; margin-bottom: 8px; color: var(--accent);">Load Testing with K6</div>
-                    <div style="font-size: 0.8rem; color: var(--text-muted); line-height: 1.5;">
-                        Test autoscaling by running K6 against these endpoints:<br>
-                        <code style="background: #0f172a; padding: 2px 6px; border-radius: 4px; font-size: 0.75rem;">https://api.codeseeker.dev/health</code> or
-                        <code style="background: #0f172a; padding: 2px 6px; border-radius: 4px; font-size: 0.75rem;">https://api.codeseeker.dev/metrics</code><br><br>
-                        <strong style="color: var(--text-main);">Suggested config:</strong> ~100 VUs for 5 minutes<br><br>
-                        Then open the <strong style="color: var(--accent);">Redis CPU View</strong> below to watch containers scale in real-time as load increases.
-                    </div>
-                </div>
-
-                <!-- Overview / static -->
-                <div id="default-section">
-                    <div class="stats">
-                        <div class="stat">
-                            <div class="stat-label">Status</div>
-                            <div class="stat-value">Online</div>
-                        </div>
-                        <div class="stat">
-                            <div class="stat-label">Platform</div>
-                            <div class="stat-value">Kubernetes</div>
-                        </div>
-                    </div>
-
-                    <div class="endpoints">
-                        <button id="show-health-btn" type="button" class="endpoint-card button-like">
-                            <div class="endpoint-title">
-                                <span class="endpoint-icon">●</span>
-                                Health View
-                            </div>
-                            <div class="endpoint-desc">
-                                Live status, CPU and memory from /health.
-                            </div>
-                        </button>
-
-                        <button id="show-metrics-btn" type="button" class="endpoint-card button-like">
-                            <div class="endpoint-title">
-                                <span class="endpoint-icon">◆</span>
-                                Metrics View
-                            </div>
-                            <div class="endpoint-desc">
-                                Detailed process metrics from /metrics.
-                            </div>
-                        </button>
-
-                        <button id="show-redis-btn" type="button" class="endpoint-card button-like">
-                            <div class="endpoint-title">
-                                <span class="endpoint-icon">▮▮</span>
-                                Redis CPU View
-                            </div>
-                            <div class="endpoint-desc">
-                                Aggregate CPU usage per pod from Redis.
-                            </div>
-                        </button>
-                    </div>
-                </div>
-
-                <!-- Health section -->
-                <div id="health-section" class="hidden">
-                    <div class="section-header">
-                        <h2>Process Health</h2>
-                        <div class="section-header-right">
-                            <span id="health-status" class="section-status"></span>
-                            <button id="health-refresh-btn" type="button" class="btn-refresh">Refresh</button>
-                            <button type="button" class="btn-refresh" onclick="location.reload()">Back</button>
-                        </div>
-                    </div>
-                    <div id="health-panel" class="grid-panel"></div>
-                </div>
-
-                <!-- Metrics section -->
-                <div id="metrics-section" class="hidden">
-                    <div class="section-header">
-                        <h2>Process Metrics</h2>
-                        <div class="section-header-right">
-                            <span id="metrics-status" class="section-status"></span>
-                            <button id="metrics-refresh-btn" type="button" class="btn-refresh">Refresh</button>
-                            <button type="button" class="btn-refresh" onclick="location.reload()">Back</button>
-                        </div>
-                    </div>
-                    <div id="metrics-panel" class="grid-panel"></div>
-                </div>
-
-                <!-- Redis section -->
-                <div id="redis-section" class="hidden">
-                    <div class="section-header">
-                        <h2>Pod CPU Usage (Redis-backed)</h2>
-                        <div class="section-header-right">
-                            <span id="redis-status" class="section-status"></span>
-                            <button id="refresh-redis-btn" type="button" class="btn-refresh">Refresh</button>
-                            <button type="button" class="btn-refresh" onclick="location.reload()">Back</button>
-                        </div>
-                    </div>
-                    <div id="redis-panel" class="grid-panel"></div>
-                </div>
-
-                <div class="footer">
-                    <span>health-service</span> · FastAPI · Redis · Kubernetes
-                </div>
-            </div>
-        </div>
-
-        <script>
-            document.addEventListener("DOMContentLoaded", () => {
-                const defaultSection = document.getElementById("default-section");
-                const healthSection = document.getElementById("health-section");
-                const metricsSection = document.getElementById("metrics-section");
-                const redisSection = document.getElementById("redis-section");
-
-                const showHealthBtn = document.getElementById("show-health-btn");
-                const showMetricsBtn = document.getElementById("show-metrics-btn");
-                const showRedisBtn = document.getElementById("show-redis-btn");
-
-                const healthRefreshBtn = document.getElementById("health-refresh-btn");
-                const metricsRefreshBtn = document.getElementById("metrics-refresh-btn");
-                const redisRefreshBtn = document.getElementById("refresh-redis-btn");
-
-                const healthStatus = document.getElementById("health-status");
-                const metricsStatus = document.getElementById("metrics-status");
-                const redisStatus = document.getElementById("redis-status");
-
-                const healthPanel = document.getElementById("health-panel");
-                const metricsPanel = document.getElementById("metrics-panel");
-                const redisPanel = document.getElementById("redis-panel");
-
-                let autoRedisRefreshId = null;
-                let loadingHealth = false;
-                let loadingMetrics = false;
-                let loadingRedis = false;
-
-                function setActiveSection(section) {
-                    defaultSection.classList.add("hidden");
-                    healthSection.classList.add("hidden");
-                    metricsSection.classList.add("hidden");
-                    redisSection.classList.add("hidden");
-
-                    if (section === "default") defaultSection.classList.remove("hidden");
-                    if (section === "health") healthSection.classList.remove("hidden");
-                    if (section === "metrics") metricsSection.classList.remove("hidden");
-                    if (section === "redis") redisSection.classList.remove("hidden");
-                }
-
-                async function loadHealth() {
-                    if (loadingHealth) return;
-                    loadingHealth = true;
-
-                    healthStatus.textContent = "Loading /health...";
-                    healthRefreshBtn.disabled = true;
-                    showHealthBtn.disabled = true;
-
-                    try {
-                        const res = await fetch("/health");
-                        const text = await res.text();
-                        const data = JSON.parse(text || "{}");
-
-                        setActiveSection("health");
-                        healthStatus.textContent = "Last updated: " + new Date().toLocaleTimeString();
-
-                        const frag = document.createDocumentFragment();
-
-                        const statusCard = document.createElement("div");
-                        statusCard.className = "data-card";
-                        statusCard.innerHTML = `
-                            <div class="data-title">Status</div>
-                            <div class="data-value ${data.status === "ok" ? "accent" : "bad"}">
-                                ${data.status || "unknown"}
-                            </div>
-                            <div class="small-text">${data.timestamp || ""}</div>
-                        `;
-                        frag.appendChild(statusCard);
-
-                        const cpuCard = document.createElement("div");
-                        cpuCard.className = "data-card";
-                        cpuCard.innerHTML = `
-                            <div class="data-title">CPU</div>
-                            <div class="data-value accent">${(data.cpu_percent ?? 0).toFixed(1)}%</div>
-                        `;
-                        frag.appendChild(cpuCard);
-
-                        const memCard = document.createElement("div");
-                        memCard.className = "data-card";
-                        memCard.innerHTML = `
-                            <div class="data-title">Memory</div>
-                            <div class="data-value accent">${(data.memory_mb ?? 0).toFixed(2)} MB</div>
-                            <div class="small-text">${(data.memory_percent ?? 0).toFixed(2)}% of process RSS</div>
-                        `;
-                        frag.appendChild(memCard);
-
-                        healthPanel.replaceChildren(frag);
-                    } catch (err) {
-                        console.error(err);
-                        healthStatus.textContent = "Error loading /health: " + err;
-                    } finally {
-                        loadingHealth = false;
-                        healthRefreshBtn.disabled = false;
-                        showHealthBtn.disabled = false;
-                    }
-                }
-
-                async function loadMetrics() {
-                    if (loadingMetrics) return;
-                    loadingMetrics = true;
-
-                    metricsStatus.textContent = "Loading /metrics...";
-                    metricsRefreshBtn.disabled = true;
-                    showMetricsBtn.disabled = true;
-
-                    try {
-                        const res = await fetch("/metrics");
-                        const text = await res.text();
-                        const data = JSON.parse(text || "{}");
-
-                        setActiveSection("metrics");
-                        metricsStatus.textContent = "Last updated: " + new Date().toLocaleTimeString();
-
-                        const frag = document.createDocumentFragment();
-
-                        const cpuCard = document.createElement("div");
-                        cpuCard.className = "data-card";
-                        cpuCard.innerHTML = `
-                            <div class="data-title">CPU</div>
-                            <div class="data-value accent">${(data.cpu_percent ?? 0).toFixed(1)}%</div>
-                        `;
-                        frag.appendChild(cpuCard);
-
-                        const memCard = document.createElement("div");
-                        memCard.className = "data-card";
-                        memCard.innerHTML = `
-                            <div class="data-title">Memory</div>
-                            <div class="data-value accent">${(data.memory_mb ?? 0).toFixed(2)} MB</div>
-                            <div class="small-text">${(data.memory_percent ?? 0).toFixed(2)}% of process RSS</div>
-                        `;
-                        frag.appendChild(memCard);
-
-                        const threadsCard = document.createElement("div");
-                        threadsCard.className = "data-card";
-                        threadsCard.innerHTML = `
-                            <div class="data-title">Threads</div>
-                            <div class="data-value">${data.num_threads ?? 0}</div>
-                        `;
-                        frag.appendChild(threadsCard);
-
-                        const filesCard = document.createElement("div");
-                        filesCard.className = "data-card";
-                        filesCard.innerHTML = `
-                            <div class="data-title">Open Files</div>
-                            <div class="data-value">${data.open_files ?? 0}</div>
-                        `;
-                        frag.appendChild(filesCard);
-
-                        const connCard = document.createElement("div");
-                        connCard.className = "data-card";
-                        connCard.innerHTML = `
-                            <div class="data-title">Connections</div>
-                            <div class="data-value">${data.connections ?? 0}</div>
-                        `;
-                        frag.appendChild(connCard);
-
-                        const tsCard = document.createElement("div");
-                        tsCard.className = "data-card";
-                        tsCard.innerHTML = `
-                            <div class="data-title">Timestamp</div>
-                            <div class="data-value">${data.timestamp || ""}</div>
-                        `;
-                        frag.appendChild(tsCard);
-
-                        metricsPanel.replaceChildren(frag);
-                    } catch (err) {
-                        console.error(err);
-                        metricsStatus.textContent = "Error loading /metrics: " + err;
-                    } finally {
-                        loadingMetrics = false;
-                        metricsRefreshBtn.disabled = false;
-                        showMetricsBtn.disabled = false;
-                    }
-                }
-
-                async function loadRedisData() {
-                    if (loadingRedis) return;
-                    loadingRedis = true;
-
-                    redisStatus.textContent = "Loading Redis CPU data...";
-                    redisRefreshBtn.disabled = true;
-                    showRedisBtn.disabled = true;
-
-                    try {
-                        const res = await fetch("/get-all-redis-keys");
-                        const text = await res.text();
-                        const data = JSON.parse(text || "{}");
-
-                        const entries = Object.values(data);
-
-                        if (!entries.length) {
-                            redisStatus.textContent = "No CPU records found in Redis yet.";
-                            return;
-                        }
-
-                        setActiveSection("redis");
-                        redisStatus.textContent = "Last updated: " + new Date().toLocaleTimeString();
-
-                        const frag = document.createDocumentFragment();
-
-                        entries.forEach(item => {
-                            const card = document.createElement("div");
-                            card.className = "data-card";
-
-                            const ts = new Date(item.ts * 2000);
-                            const tsLabel = ts.toLocaleTimeString();
-
-                            card.innerHTML = `
-                                <div class="data-title">Pod</div>
-                                <div class="data-value accent">${item.pod}</div>
-                                <div class="small-text">${item.namespace}</div>
-                                <div style="margin-top:6px" class="data-title">CPU</div>
-                                <div class="data-value accent">${item.cpu_percent.toFixed(1)}% CPU</div>
-                                <div class="small-text">Updated at ${tsLabel}</div>
-                            `;
-
-                            frag.appendChild(card);
-                        });
-
-                        redisPanel.replaceChildren(frag);
-                    } catch (err) {
-                        console.error(err);
-                        redisStatus.textContent = "Error loading Redis data: " + err;
-                    } finally {
-                        loadingRedis = false;
-                        redisRefreshBtn.disabled = false;
-                        showRedisBtn.disabled = false;
-                    }
-                }
-
-                showHealthBtn.addEventListener("click", () => {
-                    loadHealth();
-                });
-
-                healthRefreshBtn.addEventListener("click", () => {
-                    loadHealth();
-                });
-
-                showMetricsBtn.addEventListener("click", () => {
-                    loadMetrics();
-                });
-
-                metricsRefreshBtn.addEventListener("click", () => {
-                    loadMetrics();
-                });
-
-                showRedisBtn.addEventListener("click", () => {
-                    loadRedisData();
-
-                    if (autoRedisRefreshId === null) {
-                        autoRedisRefreshId = setInterval(loadRedisData, 2000);
-                    }
-                });
-
-                redisRefreshBtn.addEventListener("click", () => {
-                    loadRedisData();
-                });
-            });
-        </script>
-    </body>
-    </html>
-    """
-    return HTMLResponse(content=html_content)
+@app.get("/static/{name}")
+async def static_asset(name: str, request: Request):
+    """content-hashed dashboard css/js, cacheable forever"""
+    asset = static_assets.get(f"/static/{name}")
+    if asset is None:
+        raise HTTPException(status_code=404)
+    return assets.respond(asset, request)
 
 
 
@@ -806,7 +260,7 @@ async def return_page():
 async def return_redis_port_connection_status():
     """this just checks port 6379 to see if redis is running"""
     try:
-        r.ping()
+        await redis_pool.get_client().ping()
         return HTMLResponse(content="container is able to connect to redis")
     except Exception as e:
         return HTMLResponse(content=f"container is unable to connect to redis + {e}")
@@ -815,62 +269,230 @@ async def return_redis_port_connection_status():
 async def get_all_redis_keys():
     """return and join all keys in redis"""
     try:
-        state = {}
-        for key in r.scan_iter("cpu:*"):
-            val = r.get(key)
-            if val:
-                state[key] = json.loads(val)
-        logger.info(f"All keys in redis: {state}")
-        return HTMLResponse(content=json.dumps(state))
+        state = await local_cache.get_or_load(
+            "cluster-cpu", lambda: cluster_view.read_cluster_cpu(redis_pool.get_client())
+        )
+        degraded = cluster_view.CLUSTER_VIEW == "pubsub" and not cluster_view.subscriber.connected
+        if not degraded:
+            last_cluster_cpu.update(state=state)
+    except RedisError as e:
+        # serve the last view this worker read; the header tells the dashboard it is stale
+        logger.info("Serving last known cluster CPU view: %s", e, extra={"route": "/get-all-redis-keys"})
+        state, degraded = last_cluster_cpu.get("state", {}), True
     except Exception as e:
         logger.error(f"Error getting all keys from redis: {e}")
         return HTMLResponse(content=f"Error getting all keys from redis: {e}")
+    logger.info("All keys in redis: %s", state, extra={"route": "/get-all-redis-keys"})
+    if degraded:
+        prom.DEGRADED_RESPONSES.labels("/get-all-redis-keys").inc()
+        return HTMLResponse(content=json.dumps(state), headers={"X-Degraded": "true"})
+    return HTMLResponse(content=json.dumps(state))
+
+@app.get("/history")
+async def get_history(pod: Optional[str] = None, namespace: Optional[str] = None, worker: Optional[int] = None,
+                      seconds: float = 600, end: Optional[float] = None, resolution: Optional[int] = None):
+    """CPU/memory buckets of one pod (this one by default) over the last ``seconds`` before ``end``"""
+    if resolution is not None and resolution not in history.RESOLUTIONS:
+        raise HTTPException(status_code=400, detail=f"resolution must be one of {list(history.RESOLUTIONS)}")
+    key = f"cpu:{namespace or POD_NAMESPACE}:{pod or os.getenv('POD_NAME', 'unknown')}"
+    if worker is not None:
+        key = f"{key}:{worker}"
+    end = end or time.time()
+    try:
+        series = await history.read_range(redis_pool.get_client(), key, end - seconds, end, resolution)
+    except RedisError as e:
+        raise HTTPException(status_code=503, detail=f"history unavailable: {e}")
+    return Response(content=orjson.dumps({"key": key, **series}), media_type="application/json")
+
+@app.get("/stream/cluster-cpu")
+async def stream_cluster_cpu():
+    """server-sent events of the cluster CPU view, one Redis read per tick per worker however many viewers"""
+    sub = cluster_stream.subscribe()
+    return StreamingResponse(
+        cluster_stream.events(sub),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-# this is a background thread/task that runs periodically and reports CPU usage to the shared Redis pod
-def start_cpu_reporter():
-    redis_url = os.getenv("REDIS_URL", "redis://localhost:6379/0")
-    r = redis.Redis.from_url(redis_url, decode_responses=True)
-    ns = os.getenv("POD_NAMESPACE", "default")
-    pod = os.getenv("POD_NAME", "unknown")
-    key = f"cpu:{ns}:{pod}"
-    ttl = 5
-    interval = 3
-    psutil.cpu_percent(interval=None)  # prime
-    def loop():
-        while True:
-            try:
-                cpu = psutil.cpu_percent(interval=None)
-                payload = {
-                    "pod": pod,
-                    "namespace": ns,
-                    "cpu_percent": cpu,
-                    "ts": time.time(),
-                }
-                r.set(key, json.dumps(payload), ex=ttl)
-            except Exception:
-                # optionally log the exception here
-                pass
-            time.sleep(interval)
-    t = threading.Thread(target=loop, daemon=True, name="cpu-reporter")
-    t.start()
-    return t
+@app.get("/stream/stats", response_model=dict)
+async def get_stream_stats():
+    """subscriber and producer counters for the cluster CPU stream on this worker"""
+    return {**cluster_stream.stats(), "cluster_view": cluster_view.CLUSTER_VIEW,
+            "pubsub": cluster_view.subscriber.stats()}
+
+@app.get("/prometheus")
+async def prometheus_metrics():
+    """Prometheus text format, merged across all workers of the pod"""
+    return Response(content=prom.render(), media_type=CONTENT_TYPE_LATEST)
+
+@app.get("/log-stats", response_model=dict)
+async def get_log_stats():
+    """log queue depth plus records dropped by sampling or a full queue, for this worker"""
+    return log_config.log_stats()
+
+@app.get("/reporter", response_model=dict)
+async def get_reporter_status():
+    """whether this worker is the pod's cpu reporter"""
+    return reporter.status()
+
+@app.get("/redis-pool", response_model=dict)
+async def get_redis_pool_stats():
+    """connection pool usage for this worker, used to size REDIS_POOL_SIZE per pod"""
+    return {**redis_pool.pool_stats(), "write_batcher": batcher.stats()}
+
+@app.get("/cache-stats", response_model=dict)
+async def get_cache_stats():
+    """health/metrics cache counters for this worker"""
+    return {"local": local_cache.stats(), "redis": metrics_cache.stats()}
+
+@app.get("/admission", response_model=dict)
+async def admission_stats():
+    """Adaptive concurrency limit and shed requests for this worker"""
+    return admission.limiter.stats()
+
+@app.get("/capture", response_model=dict)
+async def capture_stats():
+    """Request capture records, drops, files and measured overhead for this worker"""
+    return capture.writer.stats()
+
+def require_debug(request: Request, seconds: float = 0):
+    if not debug.ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not debug.authorized(request.headers.get("x-debug-token")):
+        raise HTTPException(status_code=403, detail="invalid debug token")
+    if not 0 <= seconds <= debug.DEBUG_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds must be between 0 and {debug.DEBUG_MAX_SECONDS}")
+
+@app.get("/debug/profile")
+async def debug_profile(request: Request, seconds: float = 10, format: str = "collapsed",
+                        interval: Optional[float] = None):
+    """Sampled stacks of this worker's event loop over ``seconds``, collapsed or speedscope JSON"""
+    require_debug(request, seconds)
+    if format not in ("collapsed", "speedscope"):
+        raise HTTPException(status_code=400, detail="format must be collapsed or speedscope")
+    if debug.profiler.running:
+        raise HTTPException(status_code=409, detail="a profile is already running in this worker")
+    profile = await debug.profiler.profile(seconds, interval)
+    if format == "speedscope":
+        return Response(content=orjson.dumps(profile.speedscope()), media_type="application/json")
+    return Response(content=profile.collapsed(), media_type="text/plain")
+
+@app.get("/debug/blocking", response_model=dict)
+async def debug_blocking(request: Request):
+    """Callbacks that held this worker's event loop past the threshold, with their stacks"""
+    require_debug(request)
+    return debug.detector.stats()
+
+@app.get("/debug/route-times", response_model=dict)
+async def debug_route_times(request: Request, seconds: float = 10):
+    """Per-route wall vs CPU time of this worker's requests over ``seconds``"""
+    require_debug(request, seconds)
+    if debug.route_timer.active:
+        raise HTTPException(status_code=409, detail="route timing is already running in this worker")
+    return await debug.route_timer.collect(seconds)
+
+@app.get("/scaling")
+async def scaling_signal():
+    """Desired replicas for KEDA's metrics-api scaler, recomputed in the background"""
+    ready, body = scaling.scaler.status()
+    return Response(content=body, status_code=200 if ready else 503, media_type="application/json")
+
+@app.get("/livez")
+async def livez():
+    """liveness: the event loop answered, nothing else is checked"""
+    return Response(content=ALIVE, media_type="application/json")
+
+@app.get("/readyz")
+async def readyz():
+    """readiness from the last background check: warm, Redis reachable, loop lag under threshold"""
+    ready, body = readiness.monitor.status()
+    return Response(content=body, status_code=200 if ready else 503, media_type="application/json")
+
+@app.get("/startup", response_model=dict)
+async def get_startup_report():
+    """where this worker's time-to-ready went, measured from launcher start"""
+    return startup_timer.report()
+
+def build_assets():
+    """called by the preloading launcher before fork so workers share the compressed assets"""
+    if not static_assets:
+        with startup_timer.phase("assets"):
+            static_assets.update(assets.build())
+
+async def warm_up(quiet: bool = False) -> bool:
+    try:
+        await redis_pool.warm_pool()
+        return True
+    except Exception as e:
+        if not quiet:
+            logger.warning(f"Redis warm-up failed, retrying in the background: {e}")
+        return False
+
+async def keep_warming():
+    """retry the warm-up with backoff; the worker serves (degraded) meanwhile"""
+    delay = 0.5
+    while not await warm_up(quiet=True):
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 5)
+    mark_ready()
+
+def mark_ready():
+    startup_timer.mark_ready()
+    logger.info("Worker ready: %s", startup_timer.report())
 
 @app.on_event("startup")
-def startup():
-    start_cpu_reporter()
-
-
-if __name__ == "__main__":
-    port = int(os.getenv("PORT", 8080))
-    host = os.getenv("HOST", "0.0.0.0")
-    workers = int(os.getenv("WORKERS", 10))  
-
-
-    logger.info(f"Starting Container Resource Monitor on {host}:{port} with {workers} workers")
-    uvicorn.run(
-        "main:app",
-        host=host,
-        port=port,
-        workers=workers,
-        log_level="info"
+async def startup():
+    global process, container, warmup_task
+    process = psutil.Process()
+    if METRICS_SOURCE != "sampler":
+        container = cgroup.open_reader()
+    build_assets()
+    with startup_timer.phase("redis_connect"):
+        rc = await redis_pool.open_pool()
+    with startup_timer.phase("background"):
+        batcher.start(redis_pool.get_client)
+        prom.loop_lag.start()
+        admission.limiter.publish()
+        if capture.CAPTURE == "on":
+            capture.writer.start()
+        if debug.ENABLED:
+            debug.detector.start()
+        elif debug.DEBUG_ENDPOINTS == "on":
+            logger.warning("DEBUG_ENDPOINTS=on without DEBUG_TOKEN, debug endpoints stay disabled")
+        if cluster_view.CLUSTER_VIEW == "pubsub":
+            cluster_view.subscriber.start(rc)
+        if METRICS_SOURCE == "sampler":
+            sampler.start()
+            if METRICS_SCOPE == "pod":
+                pod_aggregator.start(rc)
+        reporter.start()
+        scaling.scaler.start(lambda: cluster_view.read_live_cluster_cpu(redis_pool.get_client()))
+    with startup_timer.phase("redis_warm"):
+        warm = await warm_up()
+    if warm:
+        mark_ready()
+    else:
+        warmup_task = asyncio.create_task(keep_warming())
+    readiness.monitor.start(
+        ping=lambda: redis_pool.get_client().ping(),
+        warm=lambda: startup_timer.ready,
+        loop_lag=lambda: prom.loop_lag.last_lag,
     )
+
+@app.on_event("shutdown")
+async def shutdown():
+    if warmup_task is not None:
+        warmup_task.cancel()
+    await readiness.monitor.stop()
+    await scaling.scaler.stop()
+    await capture.writer.stop()
+    await debug.detector.stop()
+    await prom.loop_lag.stop()
+    await pod_aggregator.stop()
+    sampler.stop()
+    await cluster_view.subscriber.stop()
+    await batcher.stop()
+    await redis_pool.close_pool()
+
+
+startup_timer.phases["import"] = round((time.perf_counter() - _import_started) * 1000, 1)
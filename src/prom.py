@@ -0,0 +1,207 @@
+"""Prometheus instrumentation shared by every module.
+
+Multi-worker safe: when PROMETHEUS_MULTIPROC_DIR is set (serve.py sets it before starting
+uvicorn workers) each worker writes its samples to mmap files in that directory and the
+/prometheus endpoint merges them with MultiProcessCollector, so a scrape of any worker
+returns pod-wide totals.
+"""
+import os
+import math
+import time
+import asyncio
+import logging
+from typing import List, Optional, Set
+
+from prometheus_client import (
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from starlette.routing import BaseRoute, Match
+
+
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", 0.5))
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+REDIS_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 2)
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "HTTP requests by route, method and status", ["route", "method", "status"]
+)
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ["route", "method"], buckets=LATENCY_BUCKETS
+)
+HTTP_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "Requests currently being served", ["route"], multiprocess_mode="livesum"
+)
+REDIS_LATENCY = Histogram(
+    "redis_command_duration_seconds", "Redis command latency on the request path", ["command"], buckets=REDIS_BUCKETS
+)
+REDIS_ERRORS = Counter("redis_command_errors_total", "Redis commands that raised", ["command"])
+REDIS_BREAKER_STATE = Gauge(
+    "redis_breaker_state", "Redis circuit: 0 closed, 1 half-open, 2 open, max across live workers",
+    multiprocess_mode="livemax"
+)
+REDIS_BREAKER_REJECTED = Counter("redis_breaker_rejected_total", "Redis calls refused by the open circuit")
+REDIS_BATCH_SIZE = Histogram(
+    "redis_write_batch_commands", "Commands per write-behind pipeline flush", buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256)
+)
+REDIS_FLUSH_LATENCY = Histogram(
+    "redis_write_flush_seconds", "Round trip of one write-behind pipeline flush", buckets=REDIS_BUCKETS
+)
+REDIS_WRITES_COALESCED = Counter("redis_writes_coalesced_total", "Writes replaced by a newer write to the same key")
+REDIS_WRITES_DROPPED = Counter("redis_writes_dropped_total", "Writes lost with a failed flush")
+DEGRADED_RESPONSES = Counter(
+    "degraded_responses_total", "Responses served from local fallbacks because Redis was unavailable", ["route"]
+)
+ADMISSION_LIMIT = Gauge(
+    "admission_concurrency_limit", "Adaptive concurrency limit, summed over live workers", multiprocess_mode="livesum"
+)
+ADMISSION_REJECTED = Counter(
+    "admission_rejected_total", "Requests shed with 503 by admission control", ["route", "reason"]
+)
+CACHE_LOOKUPS = Counter("cache_lookups_total", "Cache lookups by tier and result", ["cache", "result"])
+LOOP_LAG = Histogram(
+    "event_loop_lag_seconds", "How late the event loop ran a periodic timer", buckets=LATENCY_BUCKETS
+)
+LOOP_LAG_MAX = Gauge(
+    "event_loop_lag_max_seconds", "Lag of the latest timer wakeup, max across live workers", multiprocess_mode="livemax"
+)
+# every worker samples the same container, so the live max is the pod's value
+CONTAINER_CPU_USAGE = Gauge(
+    "container_cpu_usage_cores", "Cores the container used over the last sample (cgroup cpu.stat)",
+    multiprocess_mode="livemax"
+)
+CONTAINER_CPU_THROTTLED = Gauge(
+    "container_cpu_throttled_ratio", "Share of CFS periods the container was throttled in", multiprocess_mode="livemax"
+)
+CONTAINER_CPU_PRESSURE = Gauge(
+    "container_cpu_pressure_ratio", "Share of time runnable tasks waited for CPU (PSI some)", multiprocess_mode="livemax"
+)
+CONTAINER_MEMORY = Gauge(
+    "container_memory_working_set_bytes", "memory.current minus inactive_file", multiprocess_mode="livemax"
+)
+
+logger = logging.getLogger(__name__)
+
+
+def render() -> bytes:
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    from prometheus_client import REGISTRY
+    return generate_latest(REGISTRY)
+
+
+class RouteLabels:
+    """The route template a request matched, such as ``/static/{name}``, or "other".
+
+    Anything outside the app's routes is folded into "other" to keep label cardinality bounded.
+    Plain paths are a set lookup; only the rest are matched against the templated routes.
+    """
+
+    def __init__(self):
+        self.plain: Optional[Set[str]] = None
+        self.templated: List[BaseRoute] = []
+
+    def __call__(self, scope) -> str:
+        if self.plain is None:
+            routes = [r for r in scope["app"].routes if hasattr(r, "path")]
+            self.templated = [r for r in routes if getattr(r, "param_convertors", None)]
+            self.plain = {r.path for r in routes} - {r.path for r in self.templated}
+        path = scope["path"]
+        if path in self.plain:
+            return path
+        for route in self.templated:
+            if route.matches(scope)[0] != Match.NONE:
+                return route.path
+        return "other"
+
+
+class PrometheusMiddleware:
+    """ASGI middleware timing each request against its route (see RouteLabels)"""
+
+    def __init__(self, app):
+        self.app = app
+        self._route = RouteLabels()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        route = self._route(scope)
+        method = scope["method"]
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        in_flight = HTTP_IN_FLIGHT.labels(route)
+        in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_flight.dec()
+            HTTP_LATENCY.labels(route, method).observe(time.perf_counter() - start)
+            HTTP_REQUESTS.labels(route, method, str(status)).inc()
+
+
+class LoopLagMonitor:
+    """Sleeps LOOP_LAG_INTERVAL at a time and records how late each wakeup was"""
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL):
+        self.interval = interval
+        self.last_lag = 0.0
+        # a wakeup's lag fades with this time constant instead of holding for a whole interval
+        self.decay = interval / 2
+        self._woke: Optional[float] = None
+        self._due: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            self._due = start + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - start - self.interval)
+            self.last_lag = lag
+            self._woke = loop.time()
+            LOOP_LAG.observe(lag)
+            LOOP_LAG_MAX.set(lag)
+
+    def current_lag(self) -> float:
+        """Lag of the last wakeup, decayed since, or how overdue the pending one is if that is more.
+
+        Decaying keeps one stall from shedding everything for the rest of the interval, while a
+        loop that stays saturated keeps raising it at every wakeup.
+        """
+        if self._due is None:
+            return self.last_lag
+        now = asyncio.get_running_loop().time()
+        recent = self.last_lag * math.exp(-(now - self._woke) / self.decay) if self._woke is not None else 0.0
+        return max(recent, now - self._due)
+
+
+loop_lag = LoopLagMonitor()
@@ -0,0 +1,80 @@
+"""Dependency status for /readyz, refreshed off the probe path.
+
+A task per worker pings Redis every READINESS_INTERVAL seconds and reads the event-loop lag
+that prom.loop_lag already measures. It then stores the verdict as pre-encoded response
+bytes. Redis status is always reported but only gates readiness with READINESS_REQUIRE_REDIS.
+A probe only returns those bytes, so probes never touch Redis however many of them arrive. A
+verdict older than three intervals counts as not ready, so a stuck refresher cannot keep a
+worker in rotation.
+"""
+import os
+import time
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional
+
+import orjson
+
+
+READINESS_INTERVAL = float(os.getenv("READINESS_INTERVAL", 2))
+READINESS_REDIS_TIMEOUT = float(os.getenv("READINESS_REDIS_TIMEOUT", 0.5))
+READINESS_MAX_LOOP_LAG = float(os.getenv("READINESS_MAX_LOOP_LAG", 0.5))
+# off by default: with the Redis circuit breaker every endpoint degrades to local data, and a
+# Redis outage that marked every pod unready would empty the Service instead
+READINESS_REQUIRE_REDIS = os.getenv("READINESS_REQUIRE_REDIS", "false").lower() == "true"
+
+logger = logging.getLogger(__name__)
+
+
+class ReadinessMonitor:
+    def __init__(self, interval: float = READINESS_INTERVAL, redis_timeout: float = READINESS_REDIS_TIMEOUT,
+                 max_loop_lag: float = READINESS_MAX_LOOP_LAG, require_redis: bool = READINESS_REQUIRE_REDIS):
+        self.interval = interval
+        self.redis_timeout = redis_timeout
+        self.max_loop_lag = max_loop_lag
+        self.require_redis = require_redis
+        self.ready = False
+        self.body = orjson.dumps({"ready": False, "reason": "starting"})
+        self.checked_at = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self, ping: Callable[[], Awaitable], warm: Callable[[], bool], loop_lag: Callable[[], float]):
+        self._task = asyncio.create_task(self._run(ping, warm, loop_lag))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def check(self, ping, warm, loop_lag):
+        try:
+            await asyncio.wait_for(ping(), self.redis_timeout)
+            redis_ok = True
+        except Exception:
+            redis_ok = False
+        lag = loop_lag()
+        status = {"redis": redis_ok, "warm": warm(), "loop_lag_ms": round(lag * 1000, 1)}
+        ready = lag < self.max_loop_lag and (not self.require_redis or (redis_ok and status["warm"]))
+        if ready != self.ready:
+            logger.info("Readiness changed to %s: %s", ready, status)
+        self.ready = ready
+        self.body = orjson.dumps({"ready": ready, **status})
+        self.checked_at = time.monotonic()
+
+    async def _run(self, ping, warm, loop_lag):
+        while True:
+            await self.check(ping, warm, loop_lag)
+            await asyncio.sleep(self.interval)
+
+    def status(self):
+        """(ready, body) for a probe; no I/O"""
+        if self.checked_at and time.monotonic() - self.checked_at > 3 * self.interval:
+            return False, b'{"ready":false,"reason":"stale"}'
+        return self.ready, self.body
+
+
+monitor = ReadinessMonitor()
@@ -0,0 +1,176 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Dict, Optional
+
+import redis.asyncio as aioredis
+from redis.asyncio import BlockingConnectionPool
+from redis.asyncio.client import Pipeline
+from redis.exceptions import ConnectionError, TimeoutError
+
+from breaker import STATE_VALUES, CircuitBreaker
+from prom import REDIS_BREAKER_REJECTED, REDIS_BREAKER_STATE, REDIS_ERRORS, REDIS_LATENCY
+
+
+REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
+REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
+# per-worker pool bound, total connections per pod is WORKERS * REDIS_POOL_SIZE
+REDIS_POOL_SIZE = int(os.getenv("REDIS_POOL_SIZE", 20))
+# how long a request waits for a free connection before giving up
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", 2))
+# tight on purpose: in-cluster commands take well under a millisecond, and every timeout
+# counts towards opening the circuit breaker
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", 0.5))
+# connections opened at startup so the first requests do not pay for the TCP handshake
+REDIS_POOL_WARM = int(os.getenv("REDIS_POOL_WARM", 4))
+
+logger = logging.getLogger(__name__)
+
+
+class PoolExhaustedError(ConnectionError):
+    """No pooled connection freed up within REDIS_POOL_TIMEOUT; says nothing about Redis itself"""
+
+
+class CircuitOpenError(ConnectionError):
+    """Raised without touching the network while the Redis circuit is open"""
+
+
+breaker = CircuitBreaker("redis", on_change=lambda state: REDIS_BREAKER_STATE.set(STATE_VALUES[state]))
+
+
+class StatsConnectionPool(BlockingConnectionPool):
+    """Blocking pool that keeps counters for waiters and checkout timeouts"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.waiting = 0
+        self.timeouts = 0
+        self.checkouts = 0
+
+    async def get_connection(self, command_name=None, *keys, **options):
+        blocked = not self.can_get_connection()
+        if blocked:
+            self.waiting += 1
+        try:
+            connection = await super().get_connection()
+        except ConnectionError as e:
+            if isinstance(e.__cause__, asyncio.TimeoutError):
+                self.timeouts += 1
+                raise PoolExhaustedError(str(e)) from e
+            raise
+        finally:
+            if blocked:
+                self.waiting -= 1
+        self.checkouts += 1
+        return connection
+
+    def stats(self) -> Dict:
+        return {
+            "max_connections": self.max_connections,
+            "in_use": len(self._in_use_connections),
+            "idle": len(self._available_connections),
+            "waiting": self.waiting,
+            "timeouts": self.timeouts,
+            "checkouts": self.checkouts,
+        }
+
+
+async def guarded(command: str, call):
+    """Run one Redis round trip through the breaker, recording latency and errors"""
+    if not breaker.allow():
+        REDIS_BREAKER_REJECTED.inc()
+        raise CircuitOpenError(f"Redis circuit open, {command} not sent")
+    start = time.perf_counter()
+    try:
+        result = await call()
+    except PoolExhaustedError:
+        # our own pool is saturated, Redis may be fine
+        breaker.abandon()
+        REDIS_ERRORS.labels(command).inc()
+        raise
+    except (ConnectionError, TimeoutError):
+        breaker.record_failure()
+        REDIS_ERRORS.labels(command).inc()
+        raise
+    except asyncio.CancelledError:
+        breaker.abandon()
+        raise
+    except Exception:
+        # Redis answered, with an error reply
+        breaker.record_success()
+        REDIS_ERRORS.labels(command).inc()
+        raise
+    finally:
+        REDIS_LATENCY.labels(command).observe(time.perf_counter() - start)
+    breaker.record_success()
+    return result
+
+
+class GuardedPipeline(Pipeline):
+    async def execute(self, raise_on_error: bool = True):
+        return await guarded("pipeline", lambda: super(GuardedPipeline, self).execute(raise_on_error))
+
+
+class InstrumentedRedis(aioredis.Redis):
+    """Sends commands and pipelines through the breaker; pub/sub connections bypass it"""
+
+    async def execute_command(self, *args, **options):
+        return await guarded(str(args[0]).lower(), lambda: super(InstrumentedRedis, self).execute_command(*args, **options))
+
+    def pipeline(self, transaction: bool = True, shard_hint: Optional[str] = None) -> GuardedPipeline:
+        return GuardedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+pool: Optional[StatsConnectionPool] = None
+client: Optional[InstrumentedRedis] = None
+
+
+async def open_pool() -> aioredis.Redis:
+    """Create the worker's shared pool and client, called from app startup"""
+    global pool, client
+    pool = StatsConnectionPool(
+        host=REDIS_HOST,
+        port=REDIS_PORT,
+        db=0,
+        decode_responses=True,
+        max_connections=REDIS_POOL_SIZE,
+        timeout=REDIS_POOL_TIMEOUT,
+        socket_timeout=REDIS_SOCKET_TIMEOUT,
+        socket_connect_timeout=REDIS_SOCKET_TIMEOUT,
+    )
+    client = InstrumentedRedis(connection_pool=pool)
+    logger.info(f"Redis pool ready: {REDIS_HOST}:{REDIS_PORT} max_connections={REDIS_POOL_SIZE}")
+    return client
+
+
+async def warm_pool(size: int = REDIS_POOL_WARM):
+    """Open ``size`` connections by pinging concurrently; each ping checks out its own connection"""
+    await asyncio.gather(*(client.ping() for _ in range(min(size, REDIS_POOL_SIZE))))
+    logger.info(f"Redis pool warmed: {len(pool._available_connections)} idle connections")
+
+
+async def close_pool():
+    """Close the client and drop every pooled connection, called from app shutdown"""
+    global pool, client
+    if client is not None:
+        await client.aclose()
+    if pool is not None:
+        await pool.disconnect()
+    client = None
+    pool = None
+
+
+def get_client() -> aioredis.Redis:
+    if client is None:
+        raise RuntimeError("Redis pool is not open, startup has not run")
+    return client
+
+
+def pool_stats() -> Dict:
+    if pool is None:
+        stats = {"max_connections": REDIS_POOL_SIZE, "in_use": 0, "idle": 0,
+                 "waiting": 0, "timeouts": 0, "checkouts": 0}
+    else:
+        stats = pool.stats()
+    return {**stats, "breaker": breaker.stats()}
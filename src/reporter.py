@@ -0,0 +1,164 @@
+import os
+import time
+import fcntl
+import logging
+import threading
+from typing import Dict, Optional
+
+import psutil
+
+import cgroup
+import cluster_view
+import history
+import scaling
+from batcher import batcher
+
+
+# "leader": one worker per pod reports cpu:{ns}:{pod}, elected with a file lock
+# "worker": every worker reports its own process CPU under cpu:{ns}:{pod}:{pid}
+# "all": every worker overwrites cpu:{ns}:{pod} (the old behaviour)
+REPORTER_MODE = os.getenv("REPORTER_MODE", "leader")
+# all workers of a pod share the container filesystem, so a lock file here is pod-scoped
+REPORTER_LOCK_FILE = os.getenv("REPORTER_LOCK_FILE", "/tmp/health-service-cpu-reporter.lock")
+
+logger = logging.getLogger(__name__)
+
+
+class PodLock:
+    """Non-blocking flock held for the life of the process.
+
+    The kernel releases it when the holder exits or crashes, so a follower that keeps calling
+    try_acquire() takes over within one report interval.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: Optional[int] = None
+
+    @property
+    def held(self) -> bool:
+        return self._fd is not None
+
+    def try_acquire(self) -> bool:
+        if self._fd is not None:
+            return True
+        fd = os.open(self.path, os.O_CREAT | os.O_RDWR, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        return True
+
+
+class CpuReporter:
+    """Background thread that periodically reports CPU usage to the shared Redis"""
+
+    def __init__(self, mode: str = REPORTER_MODE):
+        self.mode = mode
+        self.ns = os.getenv("POD_NAMESPACE", "default")
+        self.pod = os.getenv("POD_NAME", "unknown")
+        self.lock = PodLock(REPORTER_LOCK_FILE) if mode == "leader" else None
+        self.process: Optional[psutil.Process] = None
+        self.container: Optional[cgroup.CgroupReader] = None
+        self.reports = 0
+        self.errors = 0
+        self.pruned = 0
+        self.rollups = history.RollupWriter()
+
+    @property
+    def pid(self) -> int:
+        return os.getpid()
+
+    @property
+    def key(self) -> str:
+        if self.mode == "worker":
+            return f"cpu:{self.ns}:{self.pod}:{self.pid}"
+        return f"cpu:{self.ns}:{self.pod}"
+
+    @property
+    def active(self) -> bool:
+        return self.lock is None or self.lock.held
+
+    def sample(self) -> Dict:
+        payload = {"pod": self.pod, "namespace": self.ns, "ts": time.time()}
+        if self.mode == "worker":
+            payload["cpu_percent"] = self.process.cpu_percent(interval=None)
+            payload["memory_mb"] = round(self.process.memory_info().rss / 1024 / 1024, 2)
+            payload["worker"] = self.pid
+        elif self.container is not None:
+            container = self.container.sample()
+            payload["cpu_percent"] = container.cpu_percent
+            payload["memory_mb"] = container.memory_mb
+            payload["cpu_quota"] = container.cpu_quota
+            payload["throttled_ratio"] = container.throttled_ratio
+            payload["cpu_pressure"] = container.cpu_pressure
+        else:
+            # no cgroup to read (local runs): the whole node
+            payload["cpu_percent"] = psutil.cpu_percent(interval=None)
+            payload["memory_mb"] = round(psutil.virtual_memory().used / 1024 / 1024, 2)
+        payload.update(scaling.probe.sample(payload["cpu_percent"]))
+        return payload
+
+    def report(self):
+        """Hand one sample to the worker's write batcher; runs on the reporter thread"""
+        key, payload, ttl = self.key, self.sample(), cluster_view.CPU_TTL
+        slots = self.rollups.add(payload["ts"], payload["cpu_percent"], payload["memory_mb"])
+
+        def queue(pipe):
+            cluster_view.queue_sample(pipe, key, payload, ttl)
+
+        batcher.put_threadsafe(("cpu", key), queue, lambda replies: self._written(replies, payload["ts"] - ttl))
+        batcher.put_threadsafe(("history", key, payload["ts"]), lambda pipe: history.queue_history(pipe, key, slots))
+
+    def _written(self, replies, cutoff: float):
+        # runs on the event loop after the flush
+        if isinstance(replies, Exception):
+            self.errors += 1
+            return
+        self.reports += 1
+        stale = replies[-1]
+        if stale and not isinstance(stale, Exception):
+            self.pruned += len(stale)
+            batcher.put("cpu-prune", lambda pipe: cluster_view.queue_prune(pipe, stale, cutoff))
+
+    def _loop(self):
+        while True:
+            try:
+                if self.lock is not None and not self.lock.held and self.lock.try_acquire():
+                    logger.info(f"Worker {self.pid} is now the cpu reporter for {self.pod}")
+                if self.active:
+                    self.report()
+            except Exception as e:
+                self.errors += 1
+                logger.warning(f"CPU report failed: {e}")
+            time.sleep(cluster_view.REPORT_INTERVAL)
+
+    def start(self) -> threading.Thread:
+        """Start sampling; writes go through the batcher, which must already be started"""
+        self.process = psutil.Process()
+        if self.mode != "worker":
+            self.container = cgroup.open_reader()
+        psutil.cpu_percent(interval=None)  # prime
+        self.process.cpu_percent(interval=None)
+        t = threading.Thread(target=self._loop, daemon=True, name="cpu-reporter")
+        t.start()
+        return t
+
+    def status(self) -> Dict:
+        return {
+            "mode": self.mode,
+            "source": "process" if self.mode == "worker" else ("cgroup" if self.container else "node"),
+            "worker": self.pid,
+            "key": self.key,
+            "active": self.active,
+            "reports": self.reports,
+            "errors": self.errors,
+            "pruned": self.pruned,
+        }
+
+
+reporter = CpuReporter()
@@ -0,0 +1,143 @@
+import os
+import time
+import logging
+import threading
+from typing import Dict, NamedTuple, Optional
+
+import psutil
+
+import cgroup
+from prom import CONTAINER_CPU_USAGE, CONTAINER_CPU_THROTTLED, CONTAINER_CPU_PRESSURE, CONTAINER_MEMORY
+
+
+# cheap fields (cpu, rss, threads) are refreshed every tick
+SAMPLE_INTERVAL = float(os.getenv("METRICS_SAMPLE_INTERVAL", 1))
+# open_files()/connections() walk /proc/<pid>/fd and the socket tables, so they run less often
+SLOW_SAMPLE_INTERVAL = float(os.getenv("METRICS_SLOW_SAMPLE_INTERVAL", 5))
+
+logger = logging.getLogger(__name__)
+
+
+class MetricsSnapshot(NamedTuple):
+    cpu_percent: float
+    memory_mb: float
+    memory_percent: float
+    num_threads: int
+    open_files: int
+    connections: int
+    sampled_at: float
+    slow_sampled_at: float
+    # "cgroup": cpu/memory are the container's, against its limits; "process": this worker's, from psutil
+    source: str = "process"
+    cpu_quota: Optional[float] = None
+    throttled_ratio: Optional[float] = None
+    cpu_pressure: Optional[float] = None
+
+    def as_dict(self) -> Dict:
+        return {
+            "cpu_percent": self.cpu_percent,
+            "memory_mb": self.memory_mb,
+            "memory_percent": self.memory_percent,
+            "num_threads": self.num_threads,
+            "open_files": self.open_files,
+            "connections": self.connections,
+            "sampled_at": self.sampled_at,
+            "source": self.source,
+            "cpu_quota": self.cpu_quota,
+            "throttled_ratio": self.throttled_ratio,
+            "cpu_pressure": self.cpu_pressure,
+        }
+
+
+class MetricsSampler:
+    """Background thread that keeps an immutable snapshot of this worker's metrics.
+
+    CPU and memory come from the container's cgroup when there is one (see cgroup.py), the
+    thread, file and connection counts are always this worker's process.
+
+    Readers only dereference ``self.snapshot``; the sampler swaps in a new tuple each tick,
+    which is a single atomic reference assignment, so no lock is needed.
+    """
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL, slow_interval: float = SLOW_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.slow_interval = slow_interval
+        self.process = psutil.Process()
+        self.container: Optional[cgroup.CgroupReader] = None
+        self.snapshot: Optional[MetricsSnapshot] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def sample(self) -> MetricsSnapshot:
+        """Take one sample, reusing the previous slow fields until they are due"""
+        now = time.time()
+        prev = self.snapshot
+        if self.container is not None:
+            container = self.container.sample()
+            usage = container.as_fields()
+            num_threads = self.process.num_threads()
+            CONTAINER_CPU_USAGE.set(container.cpu_cores)
+            CONTAINER_CPU_THROTTLED.set(container.throttled_ratio)
+            if container.cpu_pressure is not None:
+                CONTAINER_CPU_PRESSURE.set(container.cpu_pressure / 100)
+            CONTAINER_MEMORY.set(container.memory_mb * 1024 * 1024)
+        else:
+            with self.process.oneshot():
+                usage = {
+                    "cpu_percent": round(self.process.cpu_percent(interval=0), 2),
+                    "memory_mb": round(self.process.memory_info().rss / 1024 / 1024, 2),
+                    "memory_percent": round(self.process.memory_percent(), 2),
+                }
+                num_threads = self.process.num_threads()
+        if prev is None or now - prev.slow_sampled_at >= self.slow_interval:
+            open_files = len(self.process.open_files())
+            connections = len(self.process.net_connections())
+            slow_sampled_at = now
+        else:
+            open_files = prev.open_files
+            connections = prev.connections
+            slow_sampled_at = prev.slow_sampled_at
+
+        snap = MetricsSnapshot(
+            num_threads=num_threads,
+            open_files=open_files,
+            connections=connections,
+            sampled_at=now,
+            slow_sampled_at=slow_sampled_at,
+            **usage,
+        )
+        self.snapshot = snap
+        return snap
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sample()
+            except Exception as e:
+                logger.warning(f"Metrics sampler failed: {e}")
+
+    def start(self):
+        # a worker forked from a preloaded parent must not keep sampling the parent
+        self.process = psutil.Process()
+        self.process.cpu_percent(interval=None)  # prime
+        self.container = cgroup.open_reader()
+        self.sample()
+        self._thread = threading.Thread(target=self._loop, daemon=True, name="metrics-sampler")
+        self._thread.start()
+        logger.info(f"Metrics sampler started: interval={self.interval}s slow_interval={self.slow_interval}s "
+                    f"source={'cgroup ' + self.container.root if self.container else 'psutil'}")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 1)
+
+    def latest(self) -> MetricsSnapshot:
+        snap = self.snapshot
+        if snap is None:
+            # only reachable before start(), keeps handlers total
+            snap = self.sample()
+        return snap
+
+
+sampler = MetricsSampler()
@@ -0,0 +1,211 @@
+"""Smoothed, forecast scaling signal for KEDA's metrics-api scaler.
+
+Every pod's CPU report carries a ``load``: the largest of CPU against the quota, event-loop lag
+against the admission queue delay, in-flight requests against the admission limit and offered
+against admitted requests (more than 1 once the pod sheds). 1.0 means the pod is just saturated.
+Every SCALING_INTERVAL seconds, on wall-clock boundaries so all workers fold the same samples,
+each worker sums the pods' load and:
+
+* smooths it with Holt's linear method, a level (EWMA, SCALING_ALPHA) plus a trend (SCALING_BETA);
+* forecasts it SCALING_HORIZON seconds ahead, about a KEDA poll plus a pod start, so scale-out
+  begins while the trend is still climbing rather than after the pods saturate. The trend is
+  damped by SCALING_DAMPING per step, so a ramp that levels off is not extrapolated the whole
+  horizon and noise in the trend is not multiplied by it;
+* turns the larger of level and forecast into ``ceil(load / SCALING_TARGET_UTILIZATION)`` replicas,
+  applied at once when it grows and only once the load has fit in one pod fewer, with
+  SCALING_HYSTERESIS to spare, for SCALING_SCALE_IN_DELAY seconds when it shrinks.
+
+/scaling serves the result as pre-encoded JSON; the ScaledObject reads ``desiredReplicas`` with
+an AverageValue target of 1, so the HPA runs exactly that many pods. While the cluster view is
+unavailable (Redis down, or the pub/sub map no longer refreshed) the last decision is kept and
+marked stale, and a worker that never had a view keeps answering 503.
+"""
+import os
+import math
+import time
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+import orjson
+
+import admission
+from cluster_view import REPORT_INTERVAL
+from prom import loop_lag
+
+
+SCALING_INTERVAL = float(os.getenv("SCALING_INTERVAL", REPORT_INTERVAL))
+SCALING_TARGET_UTILIZATION = float(os.getenv("SCALING_TARGET_UTILIZATION", 0.7))
+SCALING_ALPHA = float(os.getenv("SCALING_ALPHA", 0.5))
+SCALING_BETA = float(os.getenv("SCALING_BETA", 0.3))
+SCALING_DAMPING = float(os.getenv("SCALING_DAMPING", 0.9))
+SCALING_HORIZON = float(os.getenv("SCALING_HORIZON", 30))
+SCALING_SCALE_IN_DELAY = float(os.getenv("SCALING_SCALE_IN_DELAY", 60))
+SCALING_HYSTERESIS = float(os.getenv("SCALING_HYSTERESIS", 0.1))
+SCALING_MIN_REPLICAS = int(os.getenv("SCALING_MIN_REPLICAS", 1))
+# one pod never asks for more than this many pods' worth, which bounds a single scale-out step
+SCALING_MAX_POD_LOAD = float(os.getenv("SCALING_MAX_POD_LOAD", 4))
+
+logger = logging.getLogger(__name__)
+
+
+class LoadProbe:
+    """This pod's load for its CPU report, taken on the reporter thread.
+
+    The reporting worker's limiter and loop lag stand in for the pod's; with WORKERS=auto under
+    the prod 200m quota it is the pod's only worker.
+    """
+
+    def __init__(self, limiter: admission.AdaptiveLimiter = admission.limiter, max_load: float = SCALING_MAX_POD_LOAD):
+        self.limiter = limiter
+        self.max_load = max_load
+        self._admitted = 0
+        self._rejected = 0
+
+    def sample(self, cpu_percent: float) -> Dict:
+        # plain int/float reads of state the event loop owns; a torn read only blurs one sample
+        admitted, rejected = self.limiter.admitted, sum(self.limiter.rejected_by.values())
+        new_admitted, new_rejected = admitted - self._admitted, rejected - self._rejected
+        self._admitted, self._rejected = admitted, rejected
+        if new_rejected:
+            demand = (new_admitted + new_rejected) / new_admitted if new_admitted else self.max_load
+        else:
+            demand = 0.0
+        lag = loop_lag.last_lag
+        in_flight = self.limiter.in_flight
+        load = max(
+            cpu_percent / 100,
+            lag / self.limiter.max_queue_delay,
+            in_flight / max(1.0, self.limiter.limit),
+            demand,
+        )
+        return {
+            "load": round(min(load, self.max_load), 3),
+            "in_flight": in_flight,
+            "queue_delay_ms": round(lag * 1000, 1),
+        }
+
+
+probe = LoadProbe()
+
+
+def cluster_load(state: Dict[str, Dict], max_load: float = SCALING_MAX_POD_LOAD) -> Tuple[int, float]:
+    """(pods, summed load) of a cluster CPU view; a pod reporting per worker counts at its busiest"""
+    pods: Dict[Tuple[str, str], float] = {}
+    for sample in state.values():
+        pod = (sample.get("namespace"), sample.get("pod"))
+        load = sample.get("load")
+        if load is None:
+            # a sample from before load was reported
+            load = sample.get("cpu_percent", 0) / 100
+        pods[pod] = max(pods.get(pod, 0.0), min(load, max_load))
+    return len(pods), sum(pods.values())
+
+
+class ScalingSignal:
+    def __init__(self, interval: float = SCALING_INTERVAL, target: float = SCALING_TARGET_UTILIZATION,
+                 alpha: float = SCALING_ALPHA, beta: float = SCALING_BETA, damping: float = SCALING_DAMPING,
+                 horizon: float = SCALING_HORIZON, scale_in_delay: float = SCALING_SCALE_IN_DELAY,
+                 hysteresis: float = SCALING_HYSTERESIS, min_replicas: int = SCALING_MIN_REPLICAS):
+        self.interval = interval
+        self.target = target
+        self.alpha = alpha
+        self.beta = beta
+        self.damping = damping
+        # sum of damping ** i over the forecast steps
+        steps = max(1, round(horizon / interval))
+        self.reach = sum(damping ** i for i in range(1, steps + 1))
+        self.horizon = horizon
+        self.scale_in_delay = scale_in_delay
+        self.hysteresis = hysteresis
+        self.min_replicas = min_replicas
+        self.level: Optional[float] = None
+        self.trend = 0.0
+        self.desired: Optional[int] = None
+        self.fits_since: Optional[float] = None
+        self.body = orjson.dumps({"desiredReplicas": None, "reason": "starting"})
+        self.updates = 0
+        self.errors = 0
+        self.stale = False
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self, read_state: Callable[[], Awaitable[Dict]]):
+        self._task = asyncio.create_task(self._run(read_state))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self, read_state):
+        while True:
+            await asyncio.sleep(self.interval - time.time() % self.interval)
+            try:
+                state = await read_state()
+            except Exception as e:
+                # keep serving the last decision, marked stale; logged once per outage
+                if not self.stale:
+                    logger.warning(f"Scaling signal not updated, serving the last decision as stale: {e}")
+                self.stale = True
+                self.errors += 1
+                self.body = orjson.dumps({**orjson.loads(self.body), "stale": True})
+                continue
+            if self.stale:
+                logger.info("Scaling signal updating again")
+                self.stale = False
+            self.update(state, time.time())
+
+    def update(self, state: Dict[str, Dict], now: float) -> Dict:
+        pods, load = cluster_load(state)
+        if self.level is None:
+            self.level, self.trend = load, 0.0
+        else:
+            prev = self.level
+            self.level = self.alpha * load + (1 - self.alpha) * (self.level + self.damping * self.trend)
+            self.trend = self.beta * (self.level - prev) + (1 - self.beta) * self.damping * self.trend
+        forecast = max(0.0, self.level + self.trend * self.reach)
+        planned = max(self.level, forecast)
+        wanted = max(self.min_replicas, math.ceil(planned / self.target - 1e-9))
+
+        if self.desired is None:
+            # a new worker starts from the fleet it sees instead of pulling it down
+            self.desired = max(wanted, pods)
+        if wanted > self.desired:
+            self.desired = wanted
+            self.fits_since = None
+        elif wanted < self.desired and planned <= (self.desired - 1) * self.target * (1 - self.hysteresis):
+            if self.fits_since is None:
+                self.fits_since = now
+            elif now - self.fits_since >= self.scale_in_delay:
+                self.desired = wanted
+                self.fits_since = None
+        else:
+            self.fits_since = None
+
+        self.updates += 1
+        status = {
+            "desiredReplicas": self.desired,
+            "pods": pods,
+            "load": round(load, 3),
+            "utilization": round(load / pods, 3) if pods else 0.0,
+            "level": round(self.level, 3),
+            "trend": round(self.trend, 3),
+            "forecast": round(forecast, 3),
+            "wanted": wanted,
+            "scale_in_pending_s": round(now - self.fits_since, 1) if self.fits_since is not None else None,
+            "stale": False,
+            "updated_at": now,
+        }
+        self.body = orjson.dumps(status)
+        return status
+
+    def status(self):
+        """(ready, body) for /scaling; no I/O"""
+        return self.desired is not None, self.body
+
+
+scaler = ScalingSignal()
@@ -0,0 +1,79 @@
+"""Pre-encoded JSON bodies for /health and /metrics.
+
+The metrics part of a response only changes when a new sample lands, so it is encoded with
+orjson once per sample and kept as bytes; each request only splices in its own timestamp and
+sample age. Handlers return the bytes as a raw Response, which skips FastAPI's response_model
+validation (the models still document the shape in OpenAPI).
+"""
+import os
+from datetime import datetime
+from typing import Dict, Tuple
+
+import orjson
+from fastapi.responses import Response
+
+
+# "fast" returns pre-encoded bytes, "pydantic" validates through response_model as before
+RESPONSE_MODE = os.getenv("RESPONSE_MODE", "fast")
+
+HEALTH_FIELDS = ("cpu_percent", "memory_mb", "memory_percent")
+METRICS_FIELDS = ("cpu_percent", "memory_mb", "memory_percent", "num_threads", "open_files", "connections")
+# container-level, so only at the top of a pod rollup
+CONTAINER_FIELDS = ("cpu_quota", "throttled_ratio", "cpu_pressure")
+
+
+class FragmentCache:
+    """Last encoded fragment per kind, keyed on the sample it came from"""
+
+    def __init__(self):
+        self._last: Dict[str, Tuple[Tuple, bytes]] = {}
+
+    def get(self, kind: str, metrics: Dict, build) -> bytes:
+        # the pod rollup list is replaced, never mutated, so its identity marks a new rollup
+        key = (metrics.get("sampled_at"), tuple(metrics[f] for f in METRICS_FIELDS), id(metrics.get("workers")))
+        last = self._last.get(kind)
+        if last is not None and last[0] == key:
+            return last[1]
+        fragment = build(metrics)
+        self._last[kind] = (key, fragment)
+        return fragment
+
+
+fragments = FragmentCache()
+
+
+def _open_object(payload: Dict) -> bytes:
+    # drop the closing brace so per-request fields can be appended
+    return orjson.dumps(payload)[:-1]
+
+
+def _health_fragment(metrics: Dict) -> bytes:
+    return _open_object({"status": "ok", **{f: metrics[f] for f in HEALTH_FIELDS}})
+
+
+def _metrics_fragment(metrics: Dict) -> bytes:
+    payload = {f: metrics[f] for f in METRICS_FIELDS}
+    payload["source"] = metrics.get("source", "process")
+    payload.update((f, metrics.get(f)) for f in CONTAINER_FIELDS)
+    if "workers" in metrics:
+        payload["scope"] = "pod"
+        payload["workers"] = [{"worker": w["worker"], **{f: w[f] for f in METRICS_FIELDS}} for w in metrics["workers"]]
+    else:
+        payload["scope"] = "worker"
+        payload["workers"] = None
+    return _open_object(payload)
+
+
+def _splice(fragment: bytes, age_ms: float, degraded: bool) -> Response:
+    timestamp = datetime.utcnow().isoformat()
+    body = b"".join((fragment, b',"timestamp":"', timestamp.encode(), b'","sample_age_ms":', orjson.dumps(age_ms),
+                     b',"degraded":true}' if degraded else b',"degraded":false}'))
+    return Response(content=body, media_type="application/json")
+
+
+def health_response(metrics: Dict, age_ms: float, degraded: bool = False) -> Response:
+    return _splice(fragments.get("health", metrics, _health_fragment), age_ms, degraded)
+
+
+def metrics_response(metrics: Dict, age_ms: float, degraded: bool = False) -> Response:
+    return _splice(fragments.get("metrics", metrics, _metrics_fragment), age_ms, degraded)
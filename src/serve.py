@@ -0,0 +1,130 @@
+"""Launcher: prepares the process environment and runs uvicorn in one of two startup modes.
+
+    STARTUP_MODE=preload   import the app and build its assets once, bind the socket, then fork
+                           the workers from that process; they start with everything already
+                           imported and share the parent's pages copy-on-write. The parent
+                           stays as a supervisor and re-forks workers that exit (for example
+                           after UVICORN_MAX_REQUESTS).
+    STARTUP_MODE=spawn     uvicorn's own multiprocess manager, every worker is a fresh
+                           interpreter that imports the app itself.
+
+Run as ``python src/serve.py`` (``python src/main.py`` delegates here).
+"""
+import os
+import sys
+import time
+import signal
+import logging
+from typing import Dict
+
+import psutil
+
+# stamped before anything heavy is imported, workers measure their startup against it
+os.environ["STARTUP_LAUNCHED_AT"] = str(psutil.Process().create_time())
+# workers inherit this and write their metrics to mmap files there, see prom.py; it has to be
+# set before prometheus_client is imported anywhere in this process
+PROM_DIR = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/prometheus-multiproc")
+
+STARTUP_MODE = os.getenv("STARTUP_MODE", "preload")
+
+logger = logging.getLogger("serve")
+
+
+def reset_prom_dir():
+    os.makedirs(PROM_DIR, exist_ok=True)
+    for name in os.listdir(PROM_DIR):
+        os.remove(os.path.join(PROM_DIR, name))
+
+
+def run_spawn(config) -> int:
+    import uvicorn
+
+    uvicorn.run(
+        "main:app",
+        log_level="info",
+        # leave uvicorn's loggers unconfigured so they propagate into our queue handler
+        log_config=None,
+        **config.uvicorn_kwargs(),
+    )
+    return 0
+
+
+def run_preload(config) -> int:
+    import uvicorn
+    from prometheus_client import multiprocess
+
+    import main
+
+    main.build_assets()
+    kwargs = config.uvicorn_kwargs()
+    kwargs.pop("workers")
+    uv_config = uvicorn.Config(main.app, log_level="info", log_config=None, **kwargs)
+    sock = uv_config.bind_socket()
+
+    children: Dict[int, float] = {}
+    stopping = False
+
+    def fork_worker():
+        pid = os.fork()
+        if pid == 0:
+            for sig in (signal.SIGTERM, signal.SIGINT):
+                signal.signal(sig, signal.SIG_DFL)
+            try:
+                uvicorn.Server(uv_config).run(sockets=[sock])
+            finally:
+                os._exit(0)
+        children[pid] = time.monotonic()
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    logger.info("Preloaded app in %s, forking %s workers", main.startup_timer.phases, config.workers)
+    for _ in range(config.workers):
+        fork_worker()
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        started = children.pop(pid, None)
+        if started is None:
+            continue
+        # drop the dead worker's live gauges (in-flight requests, max loop lag)
+        multiprocess.mark_process_dead(pid)
+        if stopping:
+            continue
+        uptime = time.monotonic() - started
+        logger.warning("Worker %s exited (status %s) after %.1fs, forking a replacement", pid, status, uptime)
+        if uptime < 1:
+            # crash looping at import or startup, do not spin
+            time.sleep(1)
+        fork_worker()
+    sock.close()
+    return 0
+
+
+def main() -> int:
+    import server_config
+    import log_config
+
+    log_config.setup_logging()
+    reset_prom_dir()
+    config = server_config.load()
+    logger.info("Starting Container Resource Monitor (%s) on %s", STARTUP_MODE, config.describe())
+    if STARTUP_MODE == "spawn":
+        return run_spawn(config)
+    return run_preload(config)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+"""uvicorn settings derived from the container's limits.
+
+Worker count defaults to ``auto``: one worker per CPU of cgroup quota (rounded up), capped so
+that WORKER_MEMORY_MB per worker fits in 80% of the memory limit. Every knob can be pinned
+with an environment variable; the effective values are logged at startup.
+"""
+import os
+import math
+from typing import Dict, NamedTuple, Optional
+
+from cgroup import cpu_quota, memory_limit
+
+
+WORKERS = os.getenv("WORKERS", "auto")
+# resident size of one worker, used to fit workers into the memory limit
+WORKER_MEMORY_MB = int(os.getenv("WORKER_MEMORY_MB", 100))
+UVICORN_LOOP = os.getenv("UVICORN_LOOP", "auto")
+UVICORN_HTTP = os.getenv("UVICORN_HTTP", "auto")
+UVICORN_BACKLOG = int(os.getenv("UVICORN_BACKLOG", 2048))
+# above ingress-nginx's 60s upstream keepalive so nginx, not us, closes idle connections
+UVICORN_KEEPALIVE = int(os.getenv("UVICORN_KEEPALIVE", 65))
+UVICORN_LIMIT_CONCURRENCY = os.getenv("UVICORN_LIMIT_CONCURRENCY")
+UVICORN_MAX_REQUESTS = os.getenv("UVICORN_MAX_REQUESTS")
+UVICORN_ACCESS_LOG = os.getenv("UVICORN_ACCESS_LOG", "true").lower() == "true"
+
+
+def auto_workers(cores: Optional[float], mem_bytes: Optional[int]) -> int:
+    by_cpu = math.ceil(cores) if cores is not None else (os.cpu_count() or 1)
+    by_memory = by_cpu
+    if mem_bytes is not None:
+        by_memory = int(mem_bytes * 0.8 / (WORKER_MEMORY_MB * 1024 * 1024))
+    return max(1, min(by_cpu, by_memory))
+
+
+def _pick(setting: str, preferred: str, module: str, fallback: str) -> str:
+    if setting != "auto":
+        return setting
+    try:
+        __import__(module)
+        return preferred
+    except ImportError:
+        return fallback
+
+
+class ServerConfig(NamedTuple):
+    host: str
+    port: int
+    workers: int
+    loop: str
+    http: str
+    backlog: int
+    timeout_keep_alive: int
+    limit_concurrency: Optional[int]
+    limit_max_requests: Optional[int]
+    access_log: bool
+    cpu_quota: Optional[float]
+    memory_limit_mb: Optional[int]
+
+    def uvicorn_kwargs(self) -> Dict:
+        return {
+            "host": self.host,
+            "port": self.port,
+            "workers": self.workers,
+            "loop": self.loop,
+            "http": self.http,
+            "backlog": self.backlog,
+            "timeout_keep_alive": self.timeout_keep_alive,
+            "limit_concurrency": self.limit_concurrency,
+            "limit_max_requests": self.limit_max_requests,
+            "access_log": self.access_log,
+        }
+
+    def describe(self) -> str:
+        cpu = f"{self.cpu_quota:g} cpu" if self.cpu_quota is not None else "unlimited cpu"
+        mem = f"{self.memory_limit_mb}MB" if self.memory_limit_mb is not None else "unlimited memory"
+        return (f"{self.host}:{self.port} workers={self.workers} ({WORKERS}; limits {cpu}, {mem}) "
+                f"loop={self.loop} http={self.http} backlog={self.backlog} keepalive={self.timeout_keep_alive}s "
+                f"limit_concurrency={self.limit_concurrency} max_requests={self.limit_max_requests} "
+                f"access_log={self.access_log}")
+
+
+def load() -> ServerConfig:
+    cores = cpu_quota()
+    mem = memory_limit()
+    workers = auto_workers(cores, mem) if WORKERS == "auto" else int(WORKERS)
+    return ServerConfig(
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", 8080)),
+        workers=workers,
+        loop=_pick(UVICORN_LOOP, "uvloop", "uvloop", "asyncio"),
+        http=_pick(UVICORN_HTTP, "httptools", "httptools", "h11"),
+        backlog=UVICORN_BACKLOG,
+        timeout_keep_alive=UVICORN_KEEPALIVE,
+        limit_concurrency=int(UVICORN_LIMIT_CONCURRENCY) if UVICORN_LIMIT_CONCURRENCY else None,
+        limit_max_requests=int(UVICORN_MAX_REQUESTS) if UVICORN_MAX_REQUESTS else None,
+        access_log=UVICORN_ACCESS_LOG,
+        cpu_quota=cores,
+        memory_limit_mb=mem // (1024 * 1024) if mem is not None else None,
+    )
@@ -0,0 +1,59 @@
+"""Startup timing and the readiness flag.
+
+The launcher (serve.py) exports its own process start time as STARTUP_LAUNCHED_AT, so every
+worker, forked from a preloaded parent or spawned fresh, can break time-to-ready down into
+phases measured against the same origin. Phases run in the preloading parent (the app import,
+asset build) are inherited by forked workers and reported as such.
+"""
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+
+LAUNCHED_AT = float(os.getenv("STARTUP_LAUNCHED_AT", 0)) or time.time()
+
+
+class StartupTimer:
+    def __init__(self):
+        self.phases: Dict[str, float] = {}
+        self.inherited: Dict[str, float] = {}
+        self.worker_started_at = time.time()
+        self.ready_at: Optional[float] = None
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = round((time.perf_counter() - start) * 1000, 1)
+
+    @property
+    def ready(self) -> bool:
+        return self.ready_at is not None
+
+    def mark_ready(self):
+        if self.ready_at is None:
+            self.ready_at = time.time()
+
+    def _after_fork(self):
+        # the child starts here; what the parent measured is shared, not redone
+        self.inherited.update(self.phases)
+        self.phases = {}
+        self.worker_started_at = time.time()
+
+    def report(self) -> Dict:
+        return {
+            "ready": self.ready,
+            "pid": os.getpid(),
+            "preloaded": bool(self.inherited),
+            "worker_start_ms": round((self.worker_started_at - LAUNCHED_AT) * 1000, 1),
+            "ready_ms": round((self.ready_at - LAUNCHED_AT) * 1000, 1) if self.ready else None,
+            "inherited_phases_ms": dict(self.inherited),
+            "phases_ms": dict(self.phases),
+        }
+
+
+timer = StartupTimer()
+os.register_at_fork(after_in_child=timer._after_fork)
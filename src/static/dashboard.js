@@ -0,0 +1,284 @@
+document.addEventListener("DOMContentLoaded", () => {
+    const defaultSection = document.getElementById("default-section");
+    const healthSection = document.getElementById("health-section");
+    const metricsSection = document.getElementById("metrics-section");
+    const redisSection = document.getElementById("redis-section");
+
+    const showHealthBtn = document.getElementById("show-health-btn");
+    const showMetricsBtn = document.getElementById("show-metrics-btn");
+    const showRedisBtn = document.getElementById("show-redis-btn");
+
+    const healthRefreshBtn = document.getElementById("health-refresh-btn");
+    const metricsRefreshBtn = document.getElementById("metrics-refresh-btn");
+    const redisRefreshBtn = document.getElementById("refresh-redis-btn");
+
+    const healthStatus = document.getElementById("health-status");
+    const metricsStatus = document.getElementById("metrics-status");
+    const redisStatus = document.getElementById("redis-status");
+
+    const healthPanel = document.getElementById("health-panel");
+    const metricsPanel = document.getElementById("metrics-panel");
+    const redisPanel = document.getElementById("redis-panel");
+
+    let autoRedisRefreshId = null;
+    let redisStream = null;
+    let clusterState = {};
+    let loadingHealth = false;
+    let loadingMetrics = false;
+    let loadingRedis = false;
+
+    function setActiveSection(section) {
+        defaultSection.classList.add("hidden");
+        healthSection.classList.add("hidden");
+        metricsSection.classList.add("hidden");
+        redisSection.classList.add("hidden");
+
+        if (section === "default") defaultSection.classList.remove("hidden");
+        if (section === "health") healthSection.classList.remove("hidden");
+        if (section === "metrics") metricsSection.classList.remove("hidden");
+        if (section === "redis") redisSection.classList.remove("hidden");
+    }
+
+    async function loadHealth() {
+        if (loadingHealth) return;
+        loadingHealth = true;
+
+        healthStatus.textContent = "Loading /health...";
+        healthRefreshBtn.disabled = true;
+        showHealthBtn.disabled = true;
+
+        try {
+            const res = await fetch("/health");
+            const text = await res.text();
+            const data = JSON.parse(text || "{}");
+
+            setActiveSection("health");
+            healthStatus.textContent = "Last updated: " + new Date().toLocaleTimeString();
+
+            const frag = document.createDocumentFragment();
+
+            const statusCard = document.createElement("div");
+            statusCard.className = "data-card";
+            statusCard.innerHTML = `
+                <div class="data-title">Status</div>
+                <div class="data-value ${data.status === "ok" ? "accent" : "bad"}">
+                    ${data.status || "unknown"}
+                </div>
+                <div class="small-text">${data.timestamp || ""}</div>
+            `;
+            frag.appendChild(statusCard);
+
+            const cpuCard = document.createElement("div");
+            cpuCard.className = "data-card";
+            cpuCard.innerHTML = `
+                <div class="data-title">CPU</div>
+                <div class="data-value accent">${(data.cpu_percent ?? 0).toFixed(1)}%</div>
+            `;
+            frag.appendChild(cpuCard);
+
+            const memCard = document.createElement("div");
+            memCard.className = "data-card";
+            memCard.innerHTML = `
+                <div class="data-title">Memory</div>
+                <div class="data-value accent">${(data.memory_mb ?? 0).toFixed(2)} MB</div>
+                <div class="small-text">${(data.memory_percent ?? 0).toFixed(2)}% of process RSS</div>
+            `;
+            frag.appendChild(memCard);
+
+            healthPanel.replaceChildren(frag);
+        } catch (err) {
+            console.error(err);
+            healthStatus.textContent = "Error loading /health: " + err;
+        } finally {
+            loadingHealth = false;
+            healthRefreshBtn.disabled = false;
+            showHealthBtn.disabled = false;
+        }
+    }
+
+    async function loadMetrics() {
+        if (loadingMetrics) return;
+        loadingMetrics = true;
+
+        metricsStatus.textContent = "Loading /metrics...";
+        metricsRefreshBtn.disabled = true;
+        showMetricsBtn.disabled = true;
+
+        try {
+            const res = await fetch("/metrics");
+            const text = await res.text();
+            const data = JSON.parse(text || "{}");
+
+            setActiveSection("metrics");
+            metricsStatus.textContent = "Last updated: " + new Date().toLocaleTimeString();
+
+            const frag = document.createDocumentFragment();
+
+            const cpuCard = document.createElement("div");
+            cpuCard.className = "data-card";
+            cpuCard.innerHTML = `
+                <div class="data-title">CPU</div>
+                <div class="data-value accent">${(data.cpu_percent ?? 0).toFixed(1)}%</div>
+            `;
+            frag.appendChild(cpuCard);
+
+            const memCard = document.createElement("div");
+            memCard.className = "data-card";
+            memCard.innerHTML = `
+                <div class="data-title">Memory</div>
+                <div class="data-value accent">${(data.memory_mb ?? 0).toFixed(2)} MB</div>
+                <div class="small-text">${(data.memory_percent ?? 0).toFixed(2)}% of process RSS</div>
+            `;
+            frag.appendChild(memCard);
+
+            const threadsCard = document.createElement("div");
+            threadsCard.className = "data-card";
+            threadsCard.innerHTML = `
+                <div class="data-title">Threads</div>
+                <div class="data-value">${data.num_threads ?? 0}</div>
+            `;
+            frag.appendChild(threadsCard);
+
+            const filesCard = document.createElement("div");
+            filesCard.className = "data-card";
+            filesCard.innerHTML = `
+                <div class="data-title">Open Files</div>
+                <div class="data-value">${data.open_files ?? 0}</div>
+            `;
+            frag.appendChild(filesCard);
+
+            const connCard = document.createElement("div");
+            connCard.className = "data-card";
+            connCard.innerHTML = `
+                <div class="data-title">Connections</div>
+                <div class="data-value">${data.connections ?? 0}</div>
+            `;
+            frag.appendChild(connCard);
+
+            const tsCard = document.createElement("div");
+            tsCard.className = "data-card";
+            tsCard.innerHTML = `
+                <div class="data-title">Timestamp</div>
+                <div class="data-value">${data.timestamp || ""}</div>
+            `;
+            frag.appendChild(tsCard);
+
+            metricsPanel.replaceChildren(frag);
+        } catch (err) {
+            console.error(err);
+            metricsStatus.textContent = "Error loading /metrics: " + err;
+        } finally {
+            loadingMetrics = false;
+            metricsRefreshBtn.disabled = false;
+            showMetricsBtn.disabled = false;
+        }
+    }
+
+    function renderRedisData(data) {
+        const entries = Object.values(data);
+
+        if (!entries.length) {
+            redisStatus.textContent = "No CPU records found in Redis yet.";
+            return;
+        }
+
+        setActiveSection("redis");
+        redisStatus.textContent = "Last updated: " + new Date().toLocaleTimeString();
+
+        const frag = document.createDocumentFragment();
+
+        entries.forEach(item => {
+            const card = document.createElement("div");
+            card.className = "data-card";
+
+            const ts = new Date(item.ts * 2000);
+            const tsLabel = ts.toLocaleTimeString();
+
+            card.innerHTML = `
+                <div class="data-title">Pod</div>
+                <div class="data-value accent">${item.pod}</div>
+                <div class="small-text">${item.namespace}</div>
+                <div style="margin-top:6px" class="data-title">CPU</div>
+                <div class="data-value accent">${item.cpu_percent.toFixed(1)}% CPU</div>
+                <div class="small-text">Updated at ${tsLabel}</div>
+            `;
+
+            frag.appendChild(card);
+        });
+
+        redisPanel.replaceChildren(frag);
+    }
+
+    async function loadRedisData() {
+        if (loadingRedis) return;
+        loadingRedis = true;
+
+        redisStatus.textContent = "Loading Redis CPU data...";
+        redisRefreshBtn.disabled = true;
+        showRedisBtn.disabled = true;
+
+        try {
+            const res = await fetch("/get-all-redis-keys");
+            const text = await res.text();
+            clusterState = JSON.parse(text || "{}");
+            renderRedisData(clusterState);
+        } catch (err) {
+            console.error(err);
+            redisStatus.textContent = "Error loading Redis data: " + err;
+        } finally {
+            loadingRedis = false;
+            redisRefreshBtn.disabled = false;
+            showRedisBtn.disabled = false;
+        }
+    }
+
+    // push updates from /stream/cluster-cpu, falls back to polling without EventSource
+    function startRedisStream() {
+        if (redisStream !== null || autoRedisRefreshId !== null) return;
+
+        if (!window.EventSource) {
+            autoRedisRefreshId = setInterval(loadRedisData, 2000);
+            return;
+        }
+
+        redisStream = new EventSource("/stream/cluster-cpu");
+        redisStream.addEventListener("snapshot", (e) => {
+            clusterState = JSON.parse(e.data);
+            renderRedisData(clusterState);
+        });
+        redisStream.addEventListener("delta", (e) => {
+            const delta = JSON.parse(e.data);
+            Object.assign(clusterState, delta.upsert);
+            delta.remove.forEach(key => delete clusterState[key]);
+            renderRedisData(clusterState);
+        });
+        redisStream.onerror = () => {
+            redisStatus.textContent = "Stream interrupted, reconnecting...";
+        };
+    }
+
+    showHealthBtn.addEventListener("click", () => {
+        loadHealth();
+    });
+
+    healthRefreshBtn.addEventListener("click", () => {
+        loadHealth();
+    });
+
+    showMetricsBtn.addEventListener("click", () => {
+        loadMetrics();
+    });
+
+    metricsRefreshBtn.addEventListener("click", () => {
+        loadMetrics();
+    });
+
+    showRedisBtn.addEventListener("click", () => {
+        loadRedisData();
+        startRedisStream();
+    });
+
+    redisRefreshBtn.addEventListener("click", () => {
+        loadRedisData();
+    });
+});
@@ -0,0 +1,116 @@
+import os
+import json
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Optional, Set
+
+
+STREAM_INTERVAL = float(os.getenv("STREAM_INTERVAL", 2))
+# events buffered per subscriber before it is considered too slow and dropped
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", 8))
+STREAM_HEARTBEAT = float(os.getenv("STREAM_HEARTBEAT", 15))
+
+logger = logging.getLogger(__name__)
+
+
+def sse_event(event: str, data: Dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class Subscriber:
+    def __init__(self, maxsize: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = False
+
+
+class Broadcaster:
+    """One producer per worker that reads a keyed state once per tick and fans deltas out to subscribers.
+
+    The producer only runs while someone is subscribed, so N open dashboards cost one read per
+    tick instead of N. New subscribers get a full ``snapshot`` event, then ``delta`` events with
+    ``upsert`` and ``remove``. A subscriber whose queue fills up is dropped and closed; the
+    browser's EventSource reconnects and starts again from a snapshot.
+    """
+
+    def __init__(self, read: Callable[[], Awaitable[Dict]], interval: float = STREAM_INTERVAL,
+                 queue_size: int = STREAM_QUEUE_SIZE):
+        self.read = read
+        self.interval = interval
+        self.queue_size = queue_size
+        self.state: Dict = {}
+        self.subscribers: Set[Subscriber] = set()
+        self._task: Optional[asyncio.Task] = None
+        self.ticks = 0
+        self.read_errors = 0
+        self.dropped = 0
+
+    def subscribe(self) -> Subscriber:
+        sub = Subscriber(self.queue_size)
+        sub.queue.put_nowait(("snapshot", self.state))
+        self.subscribers.add(sub)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        return sub
+
+    def unsubscribe(self, sub: Subscriber):
+        self.subscribers.discard(sub)
+        if not self.subscribers and self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _publish(self, event: str, data: Dict):
+        for sub in list(self.subscribers):
+            try:
+                sub.queue.put_nowait((event, data))
+            except asyncio.QueueFull:
+                self._drop(sub)
+
+    def _drop(self, sub: Subscriber):
+        # replace the backlog with a single marker so the consumer wakes up and ends its stream
+        while not sub.queue.empty():
+            sub.queue.get_nowait()
+        sub.queue.put_nowait(("dropped", {}))
+        sub.dropped = True
+        self.dropped += 1
+        self.subscribers.discard(sub)
+
+    async def _run(self):
+        while True:
+            try:
+                new = await self.read()
+            except Exception as e:
+                self.read_errors += 1
+                logger.warning(f"Stream read failed: {e}")
+            else:
+                self.ticks += 1
+                upsert = {k: v for k, v in new.items() if self.state.get(k) != v}
+                remove = [k for k in self.state if k not in new]
+                self.state = new
+                if upsert or remove:
+                    self._publish("delta", {"upsert": upsert, "remove": remove})
+            await asyncio.sleep(self.interval)
+
+    async def events(self, sub: Subscriber):
+        """SSE body for one subscriber, ends when it is dropped"""
+        try:
+            yield "retry: 2000\n\n"
+            while True:
+                try:
+                    event, data = await asyncio.wait_for(sub.queue.get(), timeout=STREAM_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if event == "dropped":
+                    return
+                yield sse_event(event, data)
+        finally:
+            self.unsubscribe(sub)
+
+    def stats(self) -> Dict:
+        return {
+            "subscribers": len(self.subscribers),
+            "running": self._task is not None,
+            "ticks": self.ticks,
+            "read_errors": self.read_errors,
+            "dropped_subscribers": self.dropped,
+        }
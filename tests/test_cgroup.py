@@ -0,0 +1,104 @@
+"""cgroup.CgroupReader against fake cgroup v2 trees.
+
+Each case writes plain files standing in for the kernel's, takes a primed sample, advances the
+counters by a known interval and compares the second sample with the expected figures.
+"""
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import cgroup  # noqa: E402
+
+MB = 1024 * 1024
+CPU_STAT = ("usage_usec {usage}\nuser_usec 0\nsystem_usec 0\n"
+            "nr_periods {periods}\nnr_throttled {throttled}\nthrottled_usec {throttled_us}\n")
+PRESSURE = "some avg10=1.50 avg60=0.00 avg300=0.00 total={total}\nfull avg10=0.00 avg60=0.00 avg300=0.00 total=0\n"
+MEMORY_STAT = "anon {anon}\nfile 0\ninactive_file {inactive}\nactive_file 0\n"
+
+
+def write_tree(root, usage: int, periods: int = 0, throttled: int = 0, throttled_us: int = 0,
+               pressure_total: int = 0, cpu_max: str = "20000 100000", memory_current: int = 300 * MB,
+               inactive_file: int = 100 * MB, memory_max: str = str(400 * MB), pressure: bool = True):
+    files = {
+        "cpu.stat": CPU_STAT.format(usage=usage, periods=periods, throttled=throttled, throttled_us=throttled_us),
+        "cpu.max": cpu_max + "\n",
+        "memory.current": f"{memory_current}\n",
+        "memory.max": memory_max + "\n",
+        "memory.stat": MEMORY_STAT.format(anon=memory_current - inactive_file, inactive=inactive_file),
+    }
+    if pressure:
+        files["cpu.pressure"] = PRESSURE.format(total=pressure_total)
+    for name, content in files.items():
+        with open(os.path.join(root, name), "w") as f:
+            f.write(content)
+
+
+def sample_after(reader: cgroup.CgroupReader, root, seconds: float, **tree) -> cgroup.ContainerSnapshot:
+    """Advance the fake tree and take a sample exactly ``seconds`` after the previous one"""
+    write_tree(root, **tree)
+    reader._prev = (time.monotonic() - seconds,) + reader._prev[1:]
+    return reader.sample()
+
+
+def assert_snapshot(snapshot: cgroup.ContainerSnapshot, expected: dict):
+    for field, value in expected.items():
+        actual = getattr(snapshot, field)
+        if value is None:
+            assert actual is None, field
+        else:
+            assert actual == pytest.approx(value, rel=0.02, abs=0.02), field
+
+
+@pytest.fixture
+def limited(tmp_path):
+    # 0.2 core quota
+    write_tree(tmp_path, usage=1_000_000, periods=100, throttled=0, pressure_total=0)
+    reader = cgroup.CgroupReader(str(tmp_path))
+    reader.sample()
+    yield reader
+    reader.close()
+
+
+def test_quota(limited, tmp_path):
+    # 0.199 cores used over 1s, half the periods throttled, 20% pressure
+    snap = sample_after(limited, tmp_path, 1.0, usage=1_199_000, periods=110, throttled=5, throttled_us=50_000,
+                        pressure_total=200_000)
+    assert_snapshot(snap, {"cpu_cores": 0.199, "cpu_percent": 99.5, "cpu_quota": 0.2, "throttled_ratio": 0.5,
+                           "throttled_ms": 50.0, "cpu_pressure": 20.0, "memory_mb": 200.0,
+                           "memory_percent": 50.0, "memory_limit_mb": 400.0})
+
+
+def test_counter_reset(limited, tmp_path):
+    # counters went backwards, as after the cgroup is recreated: no interval, nothing negative
+    snap = sample_after(limited, tmp_path, 1.0, usage=5_000, periods=1, throttled=0, pressure_total=0)
+    assert_snapshot(snap, {"cpu_cores": 0.0, "throttled_ratio": 0.0, "cpu_pressure": 1.5})
+    # and the next interval is measured from the reset values
+    snap = sample_after(limited, tmp_path, 1.0, usage=105_000, periods=11, throttled=0, pressure_total=0)
+    assert_snapshot(snap, {"cpu_cores": 0.1, "cpu_percent": 50.0, "throttled_ratio": 0.0})
+
+
+def test_unlimited_without_psi(tmp_path):
+    # no CPU or memory limit, and no PSI files (kernel without CONFIG_PSI): node-relative figures
+    tree = {"cpu_max": "max 100000", "memory_max": "max", "pressure": False}
+    write_tree(tmp_path, usage=0, **tree)
+    reader = cgroup.CgroupReader(str(tmp_path))
+    reader.sample()
+    snap = sample_after(reader, tmp_path, 1.0, usage=500_000, **tree)
+    reader.close()
+    assert_snapshot(snap, {
+        "cpu_quota": None, "cpu_cores": 0.5, "cpu_percent": 50.0 / reader.node_cores,
+        "cpu_pressure": None, "memory_limit_mb": None, "memory_percent": 200 * MB / reader.node_memory * 100,
+    })
+    assert cgroup.cpu_quota(str(tmp_path)) is None
+    assert cgroup.memory_limit(str(tmp_path)) is None
+
+
+def test_missing_files(tmp_path):
+    # a cgroup v1 host or no cgroup at all: auto falls back to psutil, cgroup insists
+    assert cgroup.open_reader(str(tmp_path), "auto") is None
+    with pytest.raises(OSError):
+        cgroup.open_reader(str(tmp_path), "cgroup")